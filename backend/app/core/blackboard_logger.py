@@ -11,13 +11,17 @@ logs/
       blackboard.jsonl       # Append-only log of all events
       context_snapshots/     # Full context dumps at key moments
       agent_outputs/         # Raw agent outputs per execution
+
+Writes never block the event loop: blackboard.jsonl appends go through a
+per-session `SessionLogWriter` that numbers entries in memory and flushes them
+in batches from a worker thread; snapshot/output files are written off-loop too.
 """
 
 import os
 import json
 import asyncio
 from datetime import datetime
-from typing import Any, Dict, Optional, Literal
+from typing import Any, Dict, List, Optional, Literal
 from pathlib import Path
 
 
@@ -25,13 +29,121 @@ LogLevel = Literal["EVENT", "AGENT_START", "AGENT_COMPLETE", "CONTEXT_UPDATE",
                    "CLARIFICATION", "ADMINISTRATOR", "SYSTEM", "ERROR"]
 
 
+class SessionLogWriter:
+    """
+    Buffered, append-only writer for one session's blackboard.jsonl.
+
+    Sequence numbers are assigned in memory at append time (recovered from the
+    file tail when a session is reopened after a restart). Lines are flushed by a
+    background task in batches, each batch written in a worker thread.
+
+    Flush policy:
+        flush_interval: seconds to coalesce appends before writing (0 = next loop tick)
+        max_batch: flush immediately once this many lines are buffered
+        fsync: os.fsync after every batch (durable, slower)
+    """
+
+    def __init__(self, log_file: Path, flush_interval: float = 0.05, max_batch: int = 256, fsync: bool = False):
+        self.log_file = log_file
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.fsync = fsync
+        self.sequence = self._recover_sequence()
+        self._buffer: List[str] = []
+        self._pending = asyncio.Event()
+        self._batch_full = asyncio.Event()
+        self._write_lock = asyncio.Lock()
+        self._closing = False
+        self._task = asyncio.create_task(self._run())
+
+    def _recover_sequence(self) -> int:
+        """Read the last complete line of an existing log to continue its numbering."""
+        if not self.log_file.exists():
+            return 0
+        with open(self.log_file, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            end = f.tell()
+            block = 4096
+            tail = b""
+            while end > 0:
+                start = max(0, end - block)
+                f.seek(start)
+                tail = f.read(end - start) + tail
+                lines = [line for line in tail.split(b"\n") if line.strip()]
+                # Need a full line: either more than one line, or we reached the start of the file
+                if len(lines) > 1 or start == 0:
+                    for line in reversed(lines):
+                        try:
+                            return int(json.loads(line)["sequence"])
+                        except (ValueError, KeyError, TypeError):
+                            continue  # Torn/partial write; try the previous line
+                    return 0
+                end = start
+        return 0
+
+    def append(self, entry: Dict[str, Any]) -> int:
+        """Number and buffer an entry. Synchronous, so call order == sequence order."""
+        self.sequence += 1
+        entry["sequence"] = self.sequence
+        self._buffer.append(json.dumps(entry, default=str) + "\n")
+        self._pending.set()
+        if len(self._buffer) >= self.max_batch:
+            self._batch_full.set()
+        return self.sequence
+
+    async def _run(self):
+        while True:
+            await self._pending.wait()
+            if not self._closing and self.flush_interval > 0 and len(self._buffer) < self.max_batch:
+                try:
+                    await asyncio.wait_for(self._batch_full.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            await self.flush()
+            if self._closing and not self._buffer:
+                return
+
+    async def flush(self) -> None:
+        """Write everything buffered so far."""
+        async with self._write_lock:
+            if not self._buffer:
+                self._pending.clear()
+                return
+            lines, self._buffer = self._buffer, []
+            self._pending.clear()
+            self._batch_full.clear()
+            try:
+                await asyncio.to_thread(self._write, lines)
+            except Exception as e:
+                print(f"[BlackboardLogger] Failed to write {len(lines)} entries to {self.log_file}: {e}")
+
+    def _write(self, lines: List[str]) -> None:
+        with open(self.log_file, "a") as f:
+            f.writelines(lines)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+    async def close(self) -> None:
+        """Flush remaining entries and stop the background task."""
+        self._closing = True
+        self._pending.set()
+        await self._task
+
+
 class BlackboardLogger:
     """
     Comprehensive logger for the agentic network blackboard.
     Captures raw data in organized, analyzable format.
     """
     
-    def __init__(self, base_path: str = None):
+    def __init__(
+        self,
+        base_path: str = None,
+        flush_interval: Optional[float] = None,
+        max_batch: Optional[int] = None,
+        fsync: Optional[bool] = None
+    ):
         if base_path is None:
             # Default to logs directory in backend root
             backend_root = Path(__file__).parent.parent.parent
@@ -39,21 +151,68 @@ class BlackboardLogger:
         
         self.base_path = Path(base_path)
         self.base_path.mkdir(parents=True, exist_ok=True)
-        self._locks: Dict[str, asyncio.Lock] = {}
+
+        # Flush policy (env overridable)
+        if flush_interval is None:
+            flush_interval = int(os.environ.get("BLACKBOARD_FLUSH_INTERVAL_MS", "50")) / 1000
+        if max_batch is None:
+            max_batch = int(os.environ.get("BLACKBOARD_MAX_BATCH", "256"))
+        if fsync is None:
+            fsync = os.environ.get("BLACKBOARD_FSYNC", "false").lower() in ("1", "true", "yes")
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.fsync = fsync
+
+        self._session_paths: Dict[str, Path] = {}
+        self._writers: Dict[str, SessionLogWriter] = {}
     
     def _get_session_path(self, session_id: str) -> Path:
-        """Get or create session directory."""
-        session_path = self.base_path / session_id
-        session_path.mkdir(parents=True, exist_ok=True)
-        (session_path / "context_snapshots").mkdir(exist_ok=True)
-        (session_path / "agent_outputs").mkdir(exist_ok=True)
+        """Get or create session directory (created once per session)."""
+        session_path = self._session_paths.get(session_id)
+        if session_path is None:
+            session_path = self.base_path / session_id
+            (session_path / "context_snapshots").mkdir(parents=True, exist_ok=True)
+            (session_path / "agent_outputs").mkdir(exist_ok=True)
+            self._session_paths[session_id] = session_path
         return session_path
-    
-    def _get_lock(self, session_id: str) -> asyncio.Lock:
-        """Get or create a lock for a session (thread-safe writes)."""
-        if session_id not in self._locks:
-            self._locks[session_id] = asyncio.Lock()
-        return self._locks[session_id]
+
+    def _get_writer(self, session_id: str) -> SessionLogWriter:
+        """Get or create the buffered blackboard.jsonl writer for a session."""
+        writer = self._writers.get(session_id)
+        if writer is None:
+            writer = SessionLogWriter(
+                self._get_session_path(session_id) / "blackboard.jsonl",
+                flush_interval=self.flush_interval,
+                max_batch=self.max_batch,
+                fsync=self.fsync
+            )
+            self._writers[session_id] = writer
+        return writer
+
+    @staticmethod
+    def _write_json_file(path: Path, payload: str) -> None:
+        with open(path, "w") as f:
+            f.write(payload)
+
+    async def flush(self, session_id: Optional[str] = None) -> None:
+        """Force buffered entries to disk (one session, or all)."""
+        writers = [self._writers[session_id]] if session_id in self._writers else (
+            [] if session_id else list(self._writers.values())
+        )
+        for writer in writers:
+            await writer.flush()
+
+    async def close_session(self, session_id: str) -> None:
+        """Flush and release a session's writer."""
+        writer = self._writers.pop(session_id, None)
+        self._session_paths.pop(session_id, None)
+        if writer:
+            await writer.close()
+
+    async def aclose(self) -> None:
+        """Flush and release every open writer (call on shutdown)."""
+        for session_id in list(self._writers):
+            await self.close_session(session_id)
     
     async def log_event(
         self,
@@ -75,12 +234,9 @@ class BlackboardLogger:
             agent_id: Optional agent identifier
             metadata: Optional additional metadata
         """
-        session_path = self._get_session_path(session_id)
-        log_file = session_path / "blackboard.jsonl"
-        
         entry = {
             "timestamp": datetime.now().isoformat(),
-            "sequence": await self._get_next_sequence(session_id),
+            "sequence": None, # Assigned by the session writer
             "level": level,
             "event_type": event_type,
             "agent_id": agent_id,
@@ -88,9 +244,7 @@ class BlackboardLogger:
             "metadata": metadata or {}
         }
         
-        async with self._get_lock(session_id):
-            with open(log_file, "a") as f:
-                f.write(json.dumps(entry, default=str) + "\n")
+        self._get_writer(session_id).append(entry)
     
     async def log_agent_execution(
         self,
@@ -102,7 +256,8 @@ class BlackboardLogger:
         prompt: Optional[str] = None,
         llm_response: Optional[str] = None,
         duration_ms: Optional[int] = None,
-        error: Optional[str] = None
+        error: Optional[str] = None,
+        timings: Optional[Dict[str, Any]] = None
     ) -> None:
         """
         Log detailed agent execution data.
@@ -123,12 +278,13 @@ class BlackboardLogger:
             "llm_response": llm_response,
             "output_data": output_data,
             "duration_ms": duration_ms,
+            "timings": timings,
             "error": error
         }
         
-        async with self._get_lock(session_id):
-            with open(agent_file, "w") as f:
-                json.dump(detailed_entry, f, indent=2, default=str)
+        # Serialize now (context keeps mutating), write off the event loop
+        payload = json.dumps(detailed_entry, indent=2, default=str)
+        await asyncio.to_thread(self._write_json_file, agent_file, payload)
         
         # Also log summary to main blackboard
         level = "ERROR" if phase == "error" else f"AGENT_{phase.upper()}"
@@ -140,6 +296,7 @@ class BlackboardLogger:
                 "output_file": str(agent_file.name),
                 "output_summary": self._summarize_output(output_data) if output_data else None,
                 "duration_ms": duration_ms,
+                "stages_ms": timings.get("stages_ms") if timings else None,
                 "error": error
             },
             agent_id=agent_id
@@ -168,9 +325,8 @@ class BlackboardLogger:
             "context": context
         }
         
-        async with self._get_lock(session_id):
-            with open(snapshot_file, "w") as f:
-                json.dump(snapshot, f, indent=2, default=str)
+        payload = json.dumps(snapshot, indent=2, default=str)
+        await asyncio.to_thread(self._write_json_file, snapshot_file, payload)
         
         # Log reference to main blackboard
         await self.log_event(
@@ -243,17 +399,6 @@ class BlackboardLogger:
             data=data
         )
     
-    async def _get_next_sequence(self, session_id: str) -> int:
-        """Get next sequence number for ordering."""
-        session_path = self._get_session_path(session_id)
-        log_file = session_path / "blackboard.jsonl"
-        
-        if not log_file.exists():
-            return 1
-        
-        with open(log_file, "r") as f:
-            return sum(1 for _ in f) + 1
-    
     def _summarize_output(self, output: Dict[str, Any]) -> Dict[str, Any]:
         """Create a brief summary of agent output for the main log."""
         summary = {}
@@ -272,7 +417,7 @@ class BlackboardLogger:
         return summary
     
     def get_session_log(self, session_id: str) -> list:
-        """Read all log entries for a session (for analysis)."""
+        """Read all flushed log entries for a session (for analysis). Await `flush()` first for live sessions."""
         session_path = self._get_session_path(session_id)
         log_file = session_path / "blackboard.jsonl"
         
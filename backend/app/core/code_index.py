@@ -0,0 +1,299 @@
+"""
+Code Index - local ICD-10-CM (chapter F) and psychiatric CPT tables, so codes the agents
+return can be checked on the spot instead of by a reviewer or another LLM round.
+
+Each table is held once as parallel sorted arrays (code keys, kinds, descriptions):
+    lookup(code)        exact match by binary search, O(log n)
+    complete(prefix)    autocomplete; a prefix trie maps every prefix to the slice of the
+                        sorted array it covers, so no codes are copied into the trie
+    suggest(code)       nearest valid codes (edit distance, transpositions count as one),
+                        searched under the longest known prefix and widened as needed
+    validate(code)      all of the above as one verdict for an agent output
+
+A table that is only a subset of its code system (the bundled ICD-10-CM chapter F set) is
+loaded with `complete=False`: a well-formed code it doesn't list is accepted as
+unverified (flagged, with suggestions) instead of rejected, since it may well be real.
+
+Keys are codes without the dot (ICD-10-CM "F32.1" is stored as "F321"); input is
+normalised, so "f32.1", "F321" and "F32.1 " all resolve to the same entry.
+"""
+
+import os
+import re
+import time
+from bisect import bisect_left
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+
+# Widest edit distance offered as a suggestion
+MAX_SUGGESTION_DISTANCE = 3
+
+
+@dataclass(frozen=True)
+class CodeEntry:
+    code: str          # Display form ("F32.1", "90837")
+    kind: str          # CPT: primary | addon; empty for ICD-10-CM
+    description: str
+
+    def to_dict(self) -> Dict[str, Any]:
+        entry = {"code": self.code, "description": self.description}
+        if self.kind:
+            entry["kind"] = self.kind
+        return entry
+
+
+def _distance(a: str, b: str) -> int:
+    """Optimal string alignment distance (Levenshtein plus adjacent transpositions)."""
+    prev2: List[int] = []
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        row = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            row[j] = min(prev[j] + 1, row[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                row[j] = min(row[j], prev2[j - 2] + 1)
+        prev2, prev = prev, row
+    return prev[-1]
+
+
+def _common_prefix(a: str, b: str) -> int:
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+class CodeIndex:
+    def __init__(
+        self, system: str, entries: Iterable[Tuple[str, str, str]], pattern: str, dotted: bool = False, complete: bool = True
+    ):
+        """
+        `entries` are (code, kind, description); `pattern` is the regex a normalised key
+        must match; `dotted` codes are displayed with a dot after the third character;
+        `complete` says the entries are the whole code system.
+        """
+        self.system = system
+        self.dotted = dotted
+        self.complete = complete
+        self._pattern = re.compile(pattern)
+        rows = sorted({self.normalize(code): (kind, description) for code, kind, description in entries}.items())
+        self._keys: List[str] = [key for key, _ in rows]
+        self._kinds: List[str] = [kind for _, (kind, _) in rows]
+        self._descriptions: List[str] = [description for _, (_, description) in rows]
+        # Prefix trie over the sorted keys: node -> children, and the [lo, hi) slice it covers
+        self._children: List[Dict[str, int]] = [{}]
+        self._lo: List[int] = [0]
+        self._hi: List[int] = [len(self._keys)]
+        for i, key in enumerate(self._keys):
+            node = 0
+            for ch in key:
+                child = self._children[node].get(ch)
+                if child is None:
+                    child = len(self._children)
+                    self._children[node][ch] = child
+                    self._children.append({})
+                    self._lo.append(i)
+                    self._hi.append(i)
+                node = child
+                self._hi[node] = i + 1
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def normalize(self, code: Any) -> str:
+        key = re.sub(r"[\s.]", "", str(code or "")).upper()
+        if not self.dotted:
+            key = key.split("-", 1)[0] # "90837-95": the modifier isn't part of the code
+        return key
+
+    def display(self, key: str) -> str:
+        return f"{key[:3]}.{key[3:]}" if self.dotted and len(key) > 3 else key
+
+    def _entry(self, i: int) -> CodeEntry:
+        return CodeEntry(code=self.display(self._keys[i]), kind=self._kinds[i], description=self._descriptions[i])
+
+    def _descend(self, key: str) -> Tuple[int, int]:
+        """(node, depth) of the longest prefix of `key` present in the trie."""
+        node = 0
+        for depth, ch in enumerate(key):
+            child = self._children[node].get(ch)
+            if child is None:
+                return node, depth
+            node = child
+        return node, len(key)
+
+    def lookup(self, code: Any) -> Optional[CodeEntry]:
+        key = self.normalize(code)
+        i = bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            return self._entry(i)
+        return None
+
+    def complete(self, prefix: Any, limit: int = 10) -> List[CodeEntry]:
+        """Codes starting with `prefix`, in code order."""
+        key = self.normalize(prefix)
+        node, depth = self._descend(key)
+        if depth < len(key):
+            return []
+        lo = self._lo[node]
+        return [self._entry(i) for i in range(lo, min(self._hi[node], lo + limit))]
+
+    def suggest(self, code: Any, limit: int = 5) -> List[CodeEntry]:
+        """
+        Nearest valid codes: candidates share the longest known prefix minus its last
+        character (so the first wrong character may itself be a typo); the search widens
+        one level at a time until enough candidates are within reach.
+        """
+        key = self.normalize(code)
+        if not key or not self._keys:
+            return []
+        _, depth = self._descend(key)
+        length = max(1, depth - 1) if depth else 0
+        while True:
+            node, reached = self._descend(key[:length])
+            ranked = []
+            for i in range(self._lo[node], self._hi[node]):
+                candidate = self._keys[i]
+                if abs(len(candidate) - len(key)) > MAX_SUGGESTION_DISTANCE:
+                    continue
+                distance = _distance(key, candidate)
+                if distance <= MAX_SUGGESTION_DISTANCE:
+                    ranked.append((distance, -_common_prefix(key, candidate), candidate, i))
+            if length == 0 or sum(1 for r in ranked if r[0] <= 2) >= limit:
+                break
+            length -= 1
+        ranked.sort()
+        return [self._entry(i) for _, _, _, i in ranked[:limit]]
+
+    def validate(self, code: Any) -> Dict[str, Any]:
+        """
+        {"code", "valid", "description"} for a known code; otherwise "valid": False, the
+        reason (malformed | category (not billable on its own) | unknown) and suggestions.
+        On an incomplete table an unknown well-formed code is "valid" but "verified": False.
+        """
+        key = self.normalize(code)
+        entry = self.lookup(key)
+        if entry is not None:
+            return {"code": entry.code, "valid": True, "description": entry.description}
+        if not self._pattern.match(key):
+            reason = "malformed"
+        else:
+            node, depth = self._descend(key)
+            reason = "category" if depth == len(key) else "unknown"
+            if reason == "unknown" and not self.complete:
+                return {
+                    "code": self.display(key),
+                    "valid": True,
+                    "verified": False,
+                    "suggestions": [e.to_dict() for e in self.suggest(key)]
+                }
+        return {
+            "code": self.display(key) if key else str(code),
+            "valid": False,
+            "reason": reason,
+            "suggestions": [e.to_dict() for e in self.suggest(key)]
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {"system": self.system, "codes": len(self._keys), "complete": self.complete, "trie_nodes": len(self._children)}
+
+
+def load_table(path: Path) -> List[Tuple[str, str, str]]:
+    """
+    Rows of a code table: `code<TAB>description`, `code<TAB>kind<TAB>description`, or a
+    CMS code file (`code` and description separated by spaces). `#` lines are comments.
+    """
+    rows = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line.strip() or line.startswith("#"):
+                continue
+            parts = line.split("\t") if "\t" in line else line.split(None, 1)
+            if len(parts) >= 3:
+                rows.append((parts[0], parts[1].strip(), parts[2].strip()))
+            elif len(parts) == 2:
+                rows.append((parts[0], "", parts[1].strip()))
+    return rows
+
+
+def check_code(index: CodeIndex, entry: Any) -> Optional[Dict[str, Any]]:
+    """
+    Validate the "code" of one agent output entry in place: a valid code is rewritten in
+    its canonical form; one the table can't confirm is also marked `code_verified: false`
+    with `suggested_codes`; an invalid one is marked `code_valid: false` with
+    `suggested_codes`. Returns the verdict (None if the entry has no code).
+    """
+    if not isinstance(entry, dict) or not entry.get("code"):
+        return None
+    verdict = index.validate(entry["code"])
+    if verdict["valid"]:
+        entry["code"] = verdict["code"]
+        entry.pop("code_valid", None)
+        if verdict.get("verified", True):
+            entry.pop("code_verified", None)
+            entry.pop("suggested_codes", None)
+        else:
+            entry["code_verified"] = False
+            entry["suggested_codes"] = verdict["suggestions"]
+    else:
+        entry["code_valid"] = False
+        entry["suggested_codes"] = verdict["suggestions"]
+    return verdict
+
+
+def invalid_code_question(index: CodeIndex, verdict: Dict[str, Any]) -> Tuple[str, str]:
+    """(clarification_question, suggested_answer) for an invalid primary code."""
+    code = verdict["code"]
+    problem = {
+        "category": f"{code} is a {index.system} category, not a billable code",
+        "malformed": f"\"{code}\" is not a well-formed {index.system} code"
+    }.get(verdict["reason"], f"{code} is not a valid {index.system} code")
+    suggestions = verdict["suggestions"]
+    if not suggestions:
+        return f"{problem}. Which code should be used?", ""
+    options = ", ".join(f"{s['code']} ({s['description']})" for s in suggestions[:3])
+    best = suggestions[0]
+    return f"{problem}. Did you mean one of: {options}?", f"{best['code']} ({best['description']})"
+
+
+def build_code_indexes() -> Dict[str, CodeIndex]:
+    """
+    Load the code tables from env:
+        ICD10_CODES_PATH      ICD-10-CM table (default: bundled chapter F subset, app/data/icd10cm_f.tsv)
+        ICD10_CODES_COMPLETE  the table is the full release, so codes missing from it are
+                              rejected (default: on when ICD10_CODES_PATH is set, else off)
+        CPT_CODES_PATH        CPT table (default: bundled psychiatric set, app/data/cpt_psychiatry.tsv)
+    """
+    icd10_path = os.environ.get("ICD10_CODES_PATH")
+    icd10_complete = os.environ.get("ICD10_CODES_COMPLETE", "on" if icd10_path else "off").lower() not in ("0", "off", "false")
+    started = time.perf_counter()
+    indexes = {
+        "icd10": CodeIndex(
+            "ICD-10-CM",
+            load_table(Path(icd10_path or DATA_DIR / "icd10cm_f.tsv")),
+            pattern=r"^[A-Z][0-9][0-9A-Z]{1,5}$",
+            dotted=True,
+            complete=icd10_complete
+        ),
+        "cpt": CodeIndex(
+            "CPT",
+            load_table(Path(os.environ.get("CPT_CODES_PATH") or DATA_DIR / "cpt_psychiatry.tsv")),
+            pattern=r"^[0-9]{4}[0-9A-Z]$"
+        )
+    }
+    elapsed = (time.perf_counter() - started) * 1000
+    print(f"DEBUG: Code index loaded {', '.join(f'{len(i)} {i.system}' for i in indexes.values())} codes in {elapsed:.1f}ms")
+    return indexes
+
+
+# Singleton instances
+code_indexes = build_code_indexes()
+icd10_index = code_indexes["icd10"]
+cpt_index = code_indexes["cpt"]
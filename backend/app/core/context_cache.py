@@ -0,0 +1,172 @@
+"""
+Context Cache - provider-side caching of the prompt prefix every agent in a session shares
+(team roster + transcript), so its input tokens are billed at the cached rate instead of
+once per agent.
+
+Backends:
+    GeminiContextCache  - explicit Gemini context caching (`CachedContent`); the first
+                          agent to need a prefix creates it, the rest reuse it until the TTL.
+    LocalContextCache   - in-process stand-in for the fake LLM backend and tests: tracks
+                          prefixes the same way and reports their tokens as cached.
+
+Prefixes below `min_tokens` are not worth a provider cache (Gemini rejects them); those
+calls still benefit from the provider's implicit prefix caching because the prefix bytes
+are identical across agents.
+"""
+
+import os
+import time
+import asyncio
+import hashlib
+import datetime
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from app.core.llm_governor import estimate_tokens
+
+
+@dataclass
+class CachedPrefix:
+    name: str           # Provider handle
+    tokens: int         # Size of the cached prefix
+    length: int         # Characters of the prompt it covers (the rest is sent as usual)
+    expires_at: float   # time.monotonic()
+    ref: Any = None     # Provider object
+
+
+class ContextCache(ABC):
+    # Don't hand out an entry this close to expiry (the call could outlive it)
+    EXPIRY_MARGIN_S = 30
+
+    def __init__(self, ttl: float = 600, min_tokens: int = 1024, max_entries: int = 256):
+        self.ttl = ttl
+        self.min_tokens = min_tokens
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, CachedPrefix]" = OrderedDict()
+        self._creating: Dict[str, asyncio.Lock] = {} # One creation per prefix, however many agents ask at once
+        self._failed: Dict[str, float] = {} # key -> don't retry before (monotonic)
+        self.created = 0
+        self.reused = 0
+        self.skipped = 0
+        self.failures = 0
+
+    @staticmethod
+    def _key(model_name: str, prefix: str) -> str:
+        return hashlib.sha256(f"{model_name}\x00{prefix}".encode("utf-8")).hexdigest()
+
+    def _fresh(self, key: str) -> Optional[CachedPrefix]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at - self.EXPIRY_MARGIN_S <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    async def acquire(self, model_name: str, prefix: Optional[str]) -> Optional[CachedPrefix]:
+        """Cached handle for this prefix (created on first use), or None to send the prompt as is."""
+        if not prefix or estimate_tokens(prefix) < self.min_tokens:
+            self.skipped += 1
+            return None
+        key = self._key(model_name, prefix)
+        entry = self._fresh(key)
+        if entry is not None:
+            self.reused += 1
+            return entry
+        if self._failed.get(key, 0) > time.monotonic():
+            return None
+        lock = self._creating.setdefault(key, asyncio.Lock())
+        async with lock:
+            entry = self._fresh(key)
+            if entry is not None: # Created while we waited
+                self.reused += 1
+                return entry
+            if self._failed.get(key, 0) > time.monotonic():
+                return None
+            try:
+                return await self._create_entry(key, model_name, prefix)
+            finally:
+                if self._creating.get(key) is lock:
+                    del self._creating[key]
+
+    async def _create_entry(self, key: str, model_name: str, prefix: str) -> Optional[CachedPrefix]:
+        try:
+            entry = await self._create(model_name, prefix)
+        except Exception as e:
+            # e.g. model without caching support: fall back to plain prompts for a while
+            self.failures += 1
+            self._failed[key] = time.monotonic() + self.ttl
+            print(f"WARNING: Context cache unavailable for {model_name}: {e}")
+            return None
+        self.created += 1
+        self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False) # Provider copy expires on its own TTL
+        return entry
+
+    @abstractmethod
+    async def _create(self, model_name: str, prefix: str) -> CachedPrefix:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": type(self).__name__,
+            "entries": len(self._entries),
+            "created": self.created,
+            "reused": self.reused,
+            "skipped_small": self.skipped,
+            "failures": self.failures
+        }
+
+
+class GeminiContextCache(ContextCache):
+    async def _create(self, model_name: str, prefix: str) -> CachedPrefix:
+        from google.generativeai import caching
+        cached = await asyncio.to_thread(
+            caching.CachedContent.create,
+            model=model_name,
+            contents=[prefix],
+            ttl=datetime.timedelta(seconds=self.ttl)
+        )
+        usage = getattr(cached, "usage_metadata", None)
+        return CachedPrefix(
+            name=cached.name,
+            tokens=getattr(usage, "total_token_count", 0) or estimate_tokens(prefix),
+            length=len(prefix),
+            expires_at=time.monotonic() + self.ttl,
+            ref=cached
+        )
+
+
+class LocalContextCache(ContextCache):
+    async def _create(self, model_name: str, prefix: str) -> CachedPrefix:
+        return CachedPrefix(
+            name=f"local/{self._key(model_name, prefix)[:16]}",
+            tokens=estimate_tokens(prefix),
+            length=len(prefix),
+            expires_at=time.monotonic() + self.ttl
+        )
+
+
+def build_context_cache(llm_backend: str) -> Optional[ContextCache]:
+    """
+    Build the cache from env:
+        LLM_CONTEXT_CACHE             auto (default: gemini for the Gemini backend, local for fake and replay) | gemini | local | off
+        LLM_CONTEXT_CACHE_TTL_S       lifetime of a cached prefix (default 600)
+        LLM_CONTEXT_CACHE_MIN_TOKENS  smallest prefix worth caching (default 1024)
+    """
+    mode = os.environ.get("LLM_CONTEXT_CACHE", "auto").lower()
+    if mode == "auto":
+        mode = "local" if llm_backend in ("fake", "replay") else "gemini"
+    settings = {
+        "ttl": float(os.environ.get("LLM_CONTEXT_CACHE_TTL_S", "600")),
+        "min_tokens": int(os.environ.get("LLM_CONTEXT_CACHE_MIN_TOKENS", "1024"))
+    }
+    if mode == "gemini":
+        return GeminiContextCache(**settings)
+    if mode == "local":
+        return LocalContextCache(**settings)
+    return None
@@ -0,0 +1,89 @@
+"""
+Context Projection - the part of the blackboard an agent actually reads.
+
+Agents declare their inputs as `{source: [field, ...]}`, where a source is the id of the
+agent whose output is on the blackboard (e.g. "clinical_entity"). `project()` picks
+exactly those top-level fields and nothing else: no parse-failure `raw` text, no
+clarification chatter, no checkpoints. `serialize()` renders the result as compact JSON
+and trims it to a token budget.
+
+A required source missing from the blackboard is a bug (a misnamed key, or an agent
+scheduled before its dependency), so it raises instead of quietly prompting with `{}`.
+"""
+
+import json
+from typing import Any, Dict, Iterable, List, Tuple
+
+from app.core.llm_governor import estimate_tokens
+
+# Declared inputs: {source agent id: [top-level fields of its output]}
+InputSchema = Dict[str, List[str]]
+
+# (longest string, longest list) tried in turn when the projection is over budget
+TRIM_STEPS: List[Tuple[int, int]] = [(1000, 20), (400, 10), (160, 5), (60, 3)]
+
+
+class MissingInputError(LookupError):
+    """A required source is not on the blackboard."""
+
+
+def project(context: Dict[str, Any], inputs: InputSchema, optional: Iterable[str] = ()) -> Dict[str, Any]:
+    """
+    Pick the declared fields from each source's output. Sources in `optional` (debate
+    peers that may not have run yet) are skipped when absent; fields the model left out
+    are skipped too. A source whose output failed to parse is passed on as unavailable.
+    """
+    projected: Dict[str, Any] = {}
+    for source, fields in inputs.items():
+        output = context.get(source)
+        if output is None:
+            if source in optional:
+                continue
+            available = sorted(k for k in context if k not in ("checkpoints", "user_clarifications"))
+            raise MissingInputError(f"'{source}' is not on the blackboard (available: {available})")
+        if "error" in output and not any(field in output for field in fields):
+            projected[source] = {"unavailable": output["error"]}
+            continue
+        projected[source] = {field: output[field] for field in fields if field in output}
+    return projected
+
+
+def _compact(data: Any) -> str:
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def _trim(value: Any, max_chars: int, max_items: int) -> Any:
+    if isinstance(value, str):
+        return value if len(value) <= max_chars else value[:max_chars] + "…"
+    if isinstance(value, list):
+        items = [_trim(v, max_chars, max_items) for v in value[:max_items]]
+        if len(value) > max_items:
+            items.append(f"… {len(value) - max_items} more")
+        return items
+    if isinstance(value, dict):
+        return {k: _trim(v, max_chars, max_items) for k, v in value.items()}
+    return value
+
+
+def serialize(projected: Dict[str, Any], max_tokens: int = 0) -> str:
+    """
+    Compact JSON of a projection within `max_tokens` (0 = unbounded). Over budget, long
+    strings and lists are cut progressively; as a last resort whole sources are dropped,
+    last declared first.
+    """
+    text = _compact(projected)
+    if not max_tokens or estimate_tokens(text) <= max_tokens:
+        return text
+    original = estimate_tokens(text)
+    for max_chars, max_items in TRIM_STEPS:
+        trimmed = _trim(projected, max_chars, max_items)
+        text = _compact(trimmed)
+        if estimate_tokens(text) <= max_tokens:
+            break
+    else:
+        omitted: List[str] = []
+        while len(trimmed) > 1 and estimate_tokens(text) > max_tokens:
+            omitted.insert(0, trimmed.popitem()[0])
+            text = _compact({**trimmed, "omitted": omitted})
+    print(f"WARNING: Agent inputs trimmed from ~{original} to ~{estimate_tokens(text)} tokens (budget {max_tokens})")
+    return text
@@ -1,6 +1,10 @@
+import os
 import asyncio
-from typing import Dict, List, Callable, Any, Awaitable
-from collections import defaultdict
+import traceback
+from abc import ABC, abstractmethod
+from contextvars import ContextVar
+from typing import Dict, List, Callable, Any, Awaitable, Optional, Tuple
+from collections import defaultdict, deque
 from dataclasses import dataclass
 from datetime import datetime
 
@@ -11,17 +15,72 @@ class Event:
     data: Dict[str, Any]
     sender_priority: int = 1 # Default priority
     timestamp: datetime = None
+    target_id: Optional[str] = None # Deliver only to this agent (checkpoint resume)
 
     def __post_init__(self):
         if self.timestamp is None:
             self.timestamp = datetime.now()
 
-class EventBus:
-    def __init__(self):
-        self._subscribers: Dict[str, List[Callable[[Event], Awaitable[None]]]] = defaultdict(list)
-        self._history: List[Event] = []
+    def to_dict(self) -> Dict[str, Any]:
+        """Wire format for out-of-process transports."""
+        return {
+            "topic": self.topic,
+            "sender_id": self.sender_id,
+            "data": self.data,
+            "sender_priority": self.sender_priority,
+            "timestamp": self.timestamp.isoformat(),
+            "target_id": self.target_id
+        }
 
-    def subscribe(self, topic: str, handler: Callable[[Event], Awaitable[None]]):
+    @classmethod
+    def from_dict(cls, payload: Dict[str, Any]) -> "Event":
+        return cls(
+            topic=payload["topic"],
+            sender_id=payload["sender_id"],
+            data=payload.get("data") or {},
+            sender_priority=payload.get("sender_priority", 1),
+            timestamp=datetime.fromisoformat(payload["timestamp"]) if payload.get("timestamp") else None,
+            target_id=payload.get("target_id")
+        )
+
+Handler = Callable[[Event], Awaitable[None]]
+
+class BaseEventBus(ABC):
+    """
+    Transport-agnostic bus.
+        subscribe(topic, h)            work delivery: each event is handled once per deployment
+                                       (by one worker, when the transport spans processes)
+        subscribe_broadcast(topic, h)  fan-out: every process handles every event
+    In a single process both mean "call every local handler".
+    """
+    distributed = False # True when events cross process boundaries
+
+    @abstractmethod
+    def subscribe(self, topic: str, handler: Handler):
+        pass
+
+    def subscribe_broadcast(self, topic: str, handler: Handler):
+        self.subscribe(topic, handler)
+
+    @abstractmethod
+    async def publish(self, event: Event):
+        pass
+
+    async def start(self):
+        """Begin consuming (no-op for in-process buses)."""
+        pass
+
+    async def close(self):
+        pass
+
+class EventBus(BaseEventBus):
+    """In-process bus: publish awaits every matching handler (the default)."""
+
+    def __init__(self, history_size: Optional[int] = None):
+        self._subscribers: Dict[str, List[Handler]] = defaultdict(list)
+        self._history = deque(maxlen=history_size)
+
+    def subscribe(self, topic: str, handler: Handler):
         """Register a handler for a specific topic."""
         self._subscribers[topic].append(handler)
         print(f"[EventBus] Subscribed to '{topic}'")
@@ -29,13 +88,13 @@ class EventBus:
     async def publish(self, event: Event):
         """Broadcast an event to all subscribers."""
         self._history.append(event)
-        
+
         # Notify specific topic subscribers + wildcard subscribers
         # Use a new list to avoid mutating the original subscriber lists
         handlers = list(self._subscribers[event.topic]) + list(self._subscribers["*"])
-        
+
         print(f"[EventBus] Publishing '{event.topic}' from {event.sender_id} to {len(handlers)} handlers")
-        
+
         if not handlers:
             return
 
@@ -43,4 +102,130 @@ class EventBus:
         await asyncio.gather(*[h(event) for h in handlers], return_exceptions=False) # Set to False to see errors in logs
 
     def get_history(self) -> List[Event]:
-        return self._history
+        return list(self._history)
+
+InMemoryEventBus = EventBus
+
+# The QueuedEventBus whose worker is running the current task (if any)
+_dispatching: ContextVar[Optional["QueuedEventBus"]] = ContextVar("_dispatching", default=None)
+
+class QueuedEventBus(BaseEventBus):
+    """
+    Queue-driven dispatch for one session's agent mesh.
+    publish() enqueues one work item per matching handler and returns; a pool of at most
+    `max_workers` tasks drains the queue, each handler call also taking a slot from the
+    optional `global_slots` semaphore shared by every session. A handler that publishes
+    therefore never waits on its downstream pipeline, so call depth stays flat.
+
+    Backpressure: publishers outside the bus wait while `max_queue` items are queued.
+    Handlers publishing from a worker never wait (only the workers can free room).
+    """
+
+    def __init__(self, max_workers: int = 8, max_queue: int = 256, global_slots: Optional[asyncio.Semaphore] = None):
+        self._subscribers: Dict[str, List[Handler]] = defaultdict(list)
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._global_slots = global_slots
+        self._queue: "asyncio.Queue[Tuple[Handler, Event]]" = asyncio.Queue()
+        self._space = asyncio.Condition()
+        self._workers: List[asyncio.Task] = []
+        self._busy = 0
+        self.cancelled = False
+        self.dispatched = 0
+
+    def subscribe(self, topic: str, handler: Handler):
+        self._subscribers[topic].append(handler)
+
+    async def publish(self, event: Event):
+        if self.cancelled:
+            return
+        handlers = list(self._subscribers[event.topic]) + list(self._subscribers["*"])
+        print(f"[EventBus] Queueing '{event.topic}' from {event.sender_id} for {len(handlers)} handlers")
+        if not handlers:
+            return
+        if _dispatching.get() is not self:
+            async with self._space:
+                await self._space.wait_for(lambda: self._queue.qsize() < self.max_queue or self.cancelled)
+            if self.cancelled:
+                return
+        for handler in handlers:
+            self._queue.put_nowait((handler, event))
+        # Grow the pool up to the per-session limit
+        while len(self._workers) < min(self.max_workers, self._busy + self._queue.qsize()):
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    async def _worker(self):
+        _dispatching.set(self)
+        while True:
+            handler, event = await self._queue.get()
+            self._busy += 1
+            try:
+                async with self._space:
+                    self._space.notify_all()
+                if self._global_slots is None:
+                    await handler(event)
+                else:
+                    async with self._global_slots:
+                        await handler(event)
+                self.dispatched += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"ERROR: Handler for '{event.topic}' failed: {e}")
+                traceback.print_exc()
+            finally:
+                self._busy -= 1
+                self._queue.task_done()
+
+    async def join(self):
+        """Wait until every queued event, and everything it triggered, has been handled."""
+        await self._queue.join()
+
+    async def cancel(self) -> Dict[str, int]:
+        """Drop queued events and cancel running handlers. Returns what was aborted."""
+        self.cancelled = True
+        queued = 0
+        while not self._queue.empty():
+            self._queue.get_nowait()
+            self._queue.task_done()
+            queued += 1
+        running = self._busy
+        await self.close()
+        async with self._space:
+            self._space.notify_all() # Release blocked publishers
+        return {"queued": queued, "running": running}
+
+    async def close(self):
+        workers, self._workers = self._workers, []
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+def build_mesh_bus() -> QueuedEventBus:
+    """
+    Bus for one run of the agent mesh, from env:
+        MESH_SESSION_CONCURRENCY   events handled at once per session (default 8)
+        MESH_QUEUE_SIZE            queued events before outside publishers wait (default 256)
+    Every mesh bus shares `mesh_dispatch_slots` (MESH_MAX_CONCURRENCY, default 64).
+    """
+    return QueuedEventBus(
+        max_workers=int(os.environ.get("MESH_SESSION_CONCURRENCY", "8")),
+        max_queue=int(os.environ.get("MESH_QUEUE_SIZE", "256")),
+        global_slots=mesh_dispatch_slots
+    )
+
+# Handler calls in flight across all sessions
+mesh_dispatch_slots = asyncio.Semaphore(int(os.environ.get("MESH_MAX_CONCURRENCY", "64")))
+
+def build_event_bus() -> BaseEventBus:
+    """
+    Process-wide bus for session commands and UI fan-out, from env:
+        EVENT_BUS   memory (default) | redis  (see app.core.redis_event_bus for its settings)
+    """
+    if os.environ.get("EVENT_BUS", "memory").lower() == "redis":
+        from app.core.redis_event_bus import build_redis_event_bus
+        return build_redis_event_bus()
+    return EventBus(history_size=1000)
+
+# Singleton instance (each run of the agent mesh gets its own QueuedEventBus from build_mesh_bus)
+event_bus = build_event_bus()
@@ -0,0 +1,219 @@
+"""
+Incremental JSON parser for streamed LLM completions.
+
+Feed it text chunks as they arrive; it returns events as soon as they can be decoded:
+    ("fragment", path, text)  - newly decoded characters of a string value still being written
+    ("value", path, value)    - a value (scalar, object or array) has closed
+
+`path` is a tuple of object keys / array indices from the root, e.g.
+("soap_note", "subjective"). Leading prose or markdown fences before the first
+`{`/`[` are skipped, and anything after the root value closes is ignored.
+"""
+
+import json
+from typing import Any, List, Optional, Tuple
+
+ParseEvent = Tuple[str, Tuple, Any]
+
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+_DELIMITERS = set(',}] \t\r\n')
+
+
+class _Frame:
+    __slots__ = ("container", "path", "pending_key")
+
+    def __init__(self, container, path: Tuple):
+        self.container = container
+        self.path = path
+        self.pending_key: Optional[str] = None
+
+
+class IncrementalJSONParser:
+    def __init__(self):
+        self.root: Any = None
+        self.started = False
+        self.done = False
+        self._stack: List[_Frame] = []
+        self._mode = "value" # value | key_or_end | colon | comma_or_end | value_or_end
+        self._string: Optional[List[str]] = None
+        self._string_is_key = False
+        self._escape: Optional[str] = None
+        self._high_surrogate: Optional[int] = None
+        self._literal: Optional[List[str]] = None
+
+    def feed(self, chunk: str) -> List[ParseEvent]:
+        events: List[ParseEvent] = []
+        fragment: List[str] = []
+        for ch in chunk:
+            if self.done:
+                break
+            if self._string is not None:
+                self._feed_string_char(ch, fragment, events)
+                continue
+            if self._literal is not None:
+                if ch not in _DELIMITERS:
+                    self._literal.append(ch)
+                    continue
+                self._finish_literal(events)
+            self._feed_structural(ch, events)
+
+        # Flush the decoded part of a string value that is still open
+        if fragment and self._string is not None:
+            events.append(("fragment", self._current_path(), "".join(fragment)))
+        return events
+
+    def close(self) -> List[ParseEvent]:
+        """Finish a trailing top-level literal (e.g. a bare number) at end of stream."""
+        events: List[ParseEvent] = []
+        if self._literal is not None:
+            self._finish_literal(events)
+        return events
+
+    # --- Strings ---
+
+    def _feed_string_char(self, ch: str, fragment: List[str], events: List[ParseEvent]) -> None:
+        if self._escape is not None:
+            if self._escape == "":
+                if ch == "u":
+                    self._escape = "u"
+                    return
+                out = _ESCAPES.get(ch, ch)
+                self._escape = None
+            else:
+                self._escape += ch
+                if len(self._escape) < 5:
+                    return
+                code = int(self._escape[1:], 16)
+                self._escape = None
+                if 0xD800 <= code <= 0xDBFF:
+                    self._high_surrogate = code # Wait for the low half of the pair
+                    return
+                if 0xDC00 <= code <= 0xDFFF and self._high_surrogate is not None:
+                    code = 0x10000 + ((self._high_surrogate - 0xD800) << 10) + (code - 0xDC00)
+                self._high_surrogate = None
+                out = chr(code)
+        elif ch == "\\":
+            self._escape = ""
+            return
+        elif ch == '"':
+            value = "".join(self._string)
+            is_key = self._string_is_key
+            self._string = None
+            if is_key:
+                self._stack[-1].pending_key = value
+                self._mode = "colon"
+            else:
+                if fragment:
+                    events.append(("fragment", self._current_path(), "".join(fragment)))
+                    fragment.clear()
+                self._complete_value(value, events)
+            return
+        else:
+            out = ch
+
+        self._string.append(out)
+        if not self._string_is_key:
+            fragment.append(out)
+
+    # --- Literals (numbers, true/false/null) ---
+
+    def _finish_literal(self, events: List[ParseEvent]) -> None:
+        text = "".join(self._literal)
+        self._literal = None
+        try:
+            value = json.loads(text)
+        except ValueError:
+            value = text # Tolerate junk like unquoted words; keep the raw text
+        self._complete_value(value, events)
+
+    # --- Structure ---
+
+    def _feed_structural(self, ch: str, events: List[ParseEvent]) -> None:
+        if ch in " \t\r\n":
+            return
+        if not self.started:
+            if ch not in "{[":
+                return # Skip prose / ```json fences before the root value
+            self.started = True
+
+        mode = self._mode
+        if mode == "colon":
+            if ch == ":":
+                self._mode = "value"
+            return
+        if mode == "key_or_end":
+            if ch == '"':
+                self._start_string(is_key=True)
+            elif ch == "}":
+                self._close_container(events)
+            return
+        if mode == "comma_or_end":
+            if ch == ",":
+                self._mode = "key_or_end" if isinstance(self._stack[-1].container, dict) else "value"
+            elif ch in "}]":
+                self._close_container(events)
+            return
+        if mode == "value_or_end" and ch == "]":
+            self._close_container(events)
+            return
+
+        # Start of a value
+        if ch == "{":
+            self._open_container({})
+            self._mode = "key_or_end"
+        elif ch == "[":
+            self._open_container([])
+            self._mode = "value_or_end"
+        elif ch == '"':
+            self._start_string(is_key=False)
+        else:
+            self._literal = [ch]
+
+    def _start_string(self, is_key: bool) -> None:
+        self._string = []
+        self._string_is_key = is_key
+
+    def _current_path(self) -> Tuple:
+        if not self._stack:
+            return ()
+        frame = self._stack[-1]
+        if isinstance(frame.container, dict):
+            return frame.path + (frame.pending_key,)
+        return frame.path + (len(frame.container),)
+
+    def _open_container(self, container) -> None:
+        path = self._current_path()
+        # Attach immediately so `root` reflects partial progress
+        if self._stack:
+            parent = self._stack[-1]
+            if isinstance(parent.container, dict):
+                parent.container[parent.pending_key] = container
+            else:
+                parent.container.append(container)
+        else:
+            self.root = container
+        self._stack.append(_Frame(container, path))
+
+    def _close_container(self, events: List[ParseEvent]) -> None:
+        frame = self._stack.pop()
+        events.append(("value", frame.path, frame.container))
+        self._after_value()
+
+    def _complete_value(self, value: Any, events: List[ParseEvent]) -> None:
+        path = self._current_path()
+        if self._stack:
+            frame = self._stack[-1]
+            if isinstance(frame.container, dict):
+                frame.container[frame.pending_key] = value
+            else:
+                frame.container.append(value)
+        else:
+            self.root = value
+        events.append(("value", path, value))
+        self._after_value()
+
+    def _after_value(self) -> None:
+        if self._stack:
+            self._mode = "comma_or_end"
+        else:
+            self.done = True
@@ -0,0 +1,253 @@
+"""
+LLM Response Cache - content-addressed store for agent completions.
+
+Keys are a SHA-256 of (model name, per-agent prompt version, fully assembled prompt),
+so re-analyzing the same transcript (provider re-runs, clarification replays, QA
+re-submitting a test scenario) is served locally instead of going to Gemini.
+
+Backends:
+    MemoryLRUCache  - in-process LRU with TTL
+    SQLiteCache     - on-disk store shared across restarts/workers, TTL + size eviction
+    TieredCache     - memory in front of SQLite (default)
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import asyncio
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+
+def make_cache_key(model_name: str, prompt: str, prompt_version: str) -> str:
+    """Content address for a completion."""
+    digest = hashlib.sha256()
+    for part in (model_name, prompt_version, prompt):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class LLMCache(ABC):
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[str]:
+        pass
+
+    @abstractmethod
+    async def set(self, key: str, value: str) -> None:
+        pass
+
+    async def delete(self, key: str) -> None:
+        pass
+
+    def _record(self, value: Optional[str]) -> Optional[str]:
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "backend": type(self).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+
+class NullCache(LLMCache):
+    """Caching disabled."""
+
+    async def get(self, key: str) -> Optional[str]:
+        return self._record(None)
+
+    async def set(self, key: str, value: str) -> None:
+        pass
+
+
+class MemoryLRUCache(LLMCache):
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = 86400):
+        super().__init__()
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+
+    def _lookup(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at and expires_at < time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _store(self, key: str, value: str) -> None:
+        expires_at = time.time() + self.ttl if self.ttl else 0
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[str]:
+        return self._record(self._lookup(key))
+
+    async def set(self, key: str, value: str) -> None:
+        self._store(key, value)
+
+    async def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "entries": len(self._entries)}
+
+
+class SQLiteCache(LLMCache):
+    """
+    On-disk cache. All sqlite work runs in a worker thread; every call opens its own
+    short-lived connection so the store is safe to share between threads and workers.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10000, ttl: Optional[float] = 86400):
+        super().__init__()
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._writes_since_evict = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                " created_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_access ON llm_cache (last_access)")
+
+    @contextmanager
+    def _connect(self):
+        """Short-lived connection; commits on success and always closes."""
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _get_sync(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if self.ttl and created_at + self.ttl < now:
+                conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            return value
+
+    def _set_sync(self, key: str, value: str, evict: bool) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            if evict:
+                self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        """Drop expired rows, then least-recently-used rows beyond max_entries."""
+        if self.ttl:
+            conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl,))
+        conn.execute(
+            "DELETE FROM llm_cache WHERE key IN ("
+            " SELECT key FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    async def get(self, key: str) -> Optional[str]:
+        return self._record(await asyncio.to_thread(self._get_sync, key))
+
+    async def set(self, key: str, value: str) -> None:
+        # Amortize eviction: sweep every 64 writes
+        self._writes_since_evict += 1
+        evict = self._writes_since_evict >= 64
+        if evict:
+            self._writes_since_evict = 0
+        await asyncio.to_thread(self._set_sync, key, value, evict)
+
+    async def delete(self, key: str) -> None:
+        def _delete():
+            with self._connect() as conn:
+                conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+        await asyncio.to_thread(_delete)
+
+
+class TieredCache(LLMCache):
+    """Memory LRU in front of a persistent cache; disk hits are promoted to memory."""
+
+    def __init__(self, memory: MemoryLRUCache, disk: LLMCache):
+        super().__init__()
+        self.memory = memory
+        self.disk = disk
+
+    async def get(self, key: str) -> Optional[str]:
+        value = self.memory._lookup(key)
+        if value is None:
+            value = await self.disk.get(key)
+            if value is not None:
+                self.memory._store(key, value)
+        return self._record(value)
+
+    async def set(self, key: str, value: str) -> None:
+        self.memory._store(key, value)
+        await self.disk.set(key, value)
+
+    async def delete(self, key: str) -> None:
+        await self.memory.delete(key)
+        await self.disk.delete(key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "memory": self.memory.stats(), "disk": self.disk.stats()}
+
+
+def build_llm_cache() -> LLMCache:
+    """
+    Build the cache from env:
+        LLM_CACHE              tiered (default) | memory | sqlite | off
+        LLM_CACHE_PATH         SQLite file (default backend/cache/llm_cache.sqlite3)
+        LLM_CACHE_TTL_S        entry lifetime in seconds (default 86400, 0 = no expiry)
+        LLM_CACHE_MAX_ENTRIES  on-disk size bound (memory tier holds 1/10th)
+    """
+    mode = os.environ.get("LLM_CACHE", "tiered").lower()
+    ttl = float(os.environ.get("LLM_CACHE_TTL_S", "86400")) or None
+    max_entries = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "10000"))
+    default_path = Path(__file__).parent.parent.parent / "cache" / "llm_cache.sqlite3"
+    path = os.environ.get("LLM_CACHE_PATH", str(default_path))
+
+    if mode == "off":
+        return NullCache()
+    memory = MemoryLRUCache(max_entries=max(1, max_entries // 10), ttl=ttl)
+    if mode == "memory":
+        return memory
+    disk = SQLiteCache(path, max_entries=max_entries, ttl=ttl)
+    if mode == "sqlite":
+        return disk
+    return TieredCache(memory, disk)
+
+
+# Singleton instance
+llm_cache = build_llm_cache()
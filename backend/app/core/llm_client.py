@@ -0,0 +1,297 @@
+"""
+LLM Client - single async entry point for every model call in the mesh.
+
+Backends:
+    GeminiClient  - native async Gemini calls (`generate_content_async`) over the SDK's
+                    shared grpc.aio channel; models are built once and reused, so the
+                    transport stays warm and no worker thread is held per call.
+    FakeLLMClient - offline backend with synthetic latency, for load tests and dev
+                    without quota.
+    ReplayLLMClient - serves completions recorded in the blackboard logs, with a
+                    configurable latency distribution (app.core.llm_replay); benchmarks.
+
+Every call is bounded by a max in-flight semaphore and a per-call timeout.
+
+Callers may mark the leading part of a prompt as a shared `prefix`; with a context cache
+configured, that part is served from the provider's cache (see app.core.context_cache).
+A response `schema` (see app.core.structured_output) asks for JSON of that shape; backends
+that can't enforce one ignore it.
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple
+
+import google.generativeai as genai
+
+from app.core.context_cache import CachedPrefix, ContextCache, build_context_cache
+
+
+@dataclass
+class LLMResponse:
+    text: str
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0 # Part of prompt_tokens served from a context cache
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.output_tokens
+
+
+class LLMClient(ABC):
+    def __init__(self, max_in_flight: int = 64, default_timeout: Optional[float] = 60.0, context_cache: Optional[ContextCache] = None):
+        self.max_in_flight = max_in_flight
+        self.default_timeout = default_timeout
+        self.context_cache = context_cache
+        self._semaphore = asyncio.Semaphore(max_in_flight) if max_in_flight else None
+        self.in_flight = 0
+
+    async def _cached_prefix(self, model_name: str, prompt: str, prefix: Optional[str]) -> Optional[CachedPrefix]:
+        if self.context_cache is None or not prefix or not prompt.startswith(prefix):
+            return None
+        return await self.context_cache.acquire(model_name, prefix)
+
+    async def generate(
+        self,
+        model_name: str,
+        prompt: str,
+        timeout: Optional[float] = None,
+        prefix: Optional[str] = None,
+        schema: Optional[Dict[str, Any]] = None
+    ) -> LLMResponse:
+        """Run one completion under the in-flight cap and timeout."""
+        timeout = timeout if timeout is not None else self.default_timeout
+        cached = await self._cached_prefix(model_name, prompt, prefix)
+        if self._semaphore:
+            await self._semaphore.acquire()
+        self.in_flight += 1
+        try:
+            return await asyncio.wait_for(self._generate(model_name, prompt, cached, schema), timeout)
+        finally:
+            self.in_flight -= 1
+            if self._semaphore:
+                self._semaphore.release()
+
+    async def stream(
+        self,
+        model_name: str,
+        prompt: str,
+        timeout: Optional[float] = None,
+        prefix: Optional[str] = None,
+        schema: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[LLMResponse]:
+        """
+        Run one completion as a stream of text chunks. The timeout bounds the whole
+        stream, not each chunk; token counts arrive on whichever chunks carry them.
+        """
+        timeout = timeout if timeout is not None else self.default_timeout
+        deadline = time.monotonic() + timeout if timeout else None
+        cached = await self._cached_prefix(model_name, prompt, prefix)
+        if self._semaphore:
+            await self._semaphore.acquire()
+        self.in_flight += 1
+        chunks = self._stream(model_name, prompt, cached, schema)
+        try:
+            while True:
+                remaining = deadline - time.monotonic() if deadline else None
+                if remaining is not None and remaining <= 0:
+                    raise asyncio.TimeoutError()
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), remaining)
+                except StopAsyncIteration:
+                    return
+                yield chunk
+        finally:
+            await chunks.aclose()
+            self.in_flight -= 1
+            if self._semaphore:
+                self._semaphore.release()
+
+    @abstractmethod
+    async def _generate(
+        self, model_name: str, prompt: str, cached: Optional[CachedPrefix] = None, schema: Optional[Dict[str, Any]] = None
+    ) -> LLMResponse:
+        """`cached`, when given, already holds the first `cached.length` characters of the prompt."""
+        pass
+
+    async def _stream(
+        self, model_name: str, prompt: str, cached: Optional[CachedPrefix] = None, schema: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[LLMResponse]:
+        """Backends without native streaming yield the whole completion as one chunk."""
+        yield await self._generate(model_name, prompt, cached, schema)
+
+    async def aclose(self) -> None:
+        pass
+
+
+class GeminiClient(LLMClient):
+    def __init__(self, api_key: str, **kwargs):
+        super().__init__(**kwargs)
+        self.api_key = api_key
+        if api_key:
+            genai.configure(api_key=api_key)
+        self._models: Dict[str, genai.GenerativeModel] = {}
+
+    def _model(self, model_name: str, cached: Optional[CachedPrefix] = None) -> genai.GenerativeModel:
+        key = cached.name if cached else model_name
+        model = self._models.get(key)
+        if model is None:
+            if cached:
+                model = genai.GenerativeModel.from_cached_content(cached_content=cached.ref)
+                # Models bound to expired caches are dropped once enough have piled up
+                if len(self._models) > 256:
+                    self._models = {k: m for k, m in self._models.items() if not k.startswith("cachedContents/")}
+            else:
+                model = genai.GenerativeModel(model_name)
+            self._models[key] = model
+        return model
+
+    @staticmethod
+    def _usage(text: str, usage) -> LLMResponse:
+        return LLMResponse(
+            text=text,
+            prompt_tokens=getattr(usage, "prompt_token_count", 0) or 0,
+            output_tokens=getattr(usage, "candidates_token_count", 0) or 0,
+            # Also reports implicit (automatic) prefix caching
+            cached_tokens=getattr(usage, "cached_content_token_count", 0) or 0
+        )
+
+    @staticmethod
+    def _generation_config(schema: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        return {"response_mime_type": "application/json", "response_schema": schema} if schema else None
+
+    async def _generate(
+        self, model_name: str, prompt: str, cached: Optional[CachedPrefix] = None, schema: Optional[Dict[str, Any]] = None
+    ) -> LLMResponse:
+        if not self.api_key:
+            print(f"WARNING: No GEMINI_API_KEY found. Returning empty JSON for {model_name}.")
+            return LLMResponse(text="{}")
+
+        contents = prompt[cached.length:] if cached else prompt
+        response = await self._model(model_name, cached).generate_content_async(
+            contents, generation_config=self._generation_config(schema)
+        )
+        return self._usage(response.text, getattr(response, "usage_metadata", None))
+
+    async def _stream(
+        self, model_name: str, prompt: str, cached: Optional[CachedPrefix] = None, schema: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[LLMResponse]:
+        if not self.api_key:
+            yield await self._generate(model_name, prompt, cached, schema)
+            return
+
+        contents = prompt[cached.length:] if cached else prompt
+        response = await self._model(model_name, cached).generate_content_async(
+            contents, generation_config=self._generation_config(schema), stream=True
+        )
+        async for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                text = "" # Usage-only / finish chunks carry no parts
+            yield self._usage(text, getattr(chunk, "usage_metadata", None))
+
+
+class FakeLLMClient(LLMClient):
+    """
+    Offline backend. Returns a minimal valid agent JSON (or whatever `responder`
+    returns) after a synthetic latency of `latency_ms` +/- `jitter_ms`.
+    """
+
+    def __init__(
+        self,
+        latency_ms: float = 200,
+        jitter_ms: float = 50,
+        responder: Optional[Callable[[str, str], str]] = None,
+        **kwargs
+    ):
+        super().__init__(**kwargs)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.responder = responder
+        self.calls = 0
+
+    def _delay(self) -> float:
+        return max(0.0, self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+
+    def _respond(self, model_name: str, prompt: str) -> str:
+        self.calls += 1
+        if self.responder:
+            return self.responder(model_name, prompt)
+        return json.dumps({
+            "clarification_needed": False,
+            "risk_detected": False,
+            "validation_result": "approved",
+            "summary": "Offline fake response."
+        })
+
+    def _reply(self, model_name: str, prompt: str) -> Tuple[str, float]:
+        """(completion text, seconds it takes to produce)."""
+        return self._respond(model_name, prompt), self._delay()
+
+    async def _generate(
+        self, model_name: str, prompt: str, cached: Optional[CachedPrefix] = None, schema: Optional[Dict[str, Any]] = None
+    ) -> LLMResponse:
+        text, delay = self._reply(model_name, prompt)
+        await asyncio.sleep(delay)
+        return LLMResponse(
+            text=text,
+            prompt_tokens=len(prompt) // 4,
+            output_tokens=len(text) // 4,
+            cached_tokens=cached.tokens if cached else 0
+        )
+
+    async def _stream(
+        self, model_name: str, prompt: str, cached: Optional[CachedPrefix] = None, schema: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[LLMResponse]:
+        """Same latency as `_generate`, spread over ~32-character chunks."""
+        text, delay = self._reply(model_name, prompt)
+        pieces = [text[i:i + 32] for i in range(0, len(text), 32)] or [""]
+        step = delay / len(pieces)
+        for i, piece in enumerate(pieces):
+            await asyncio.sleep(step)
+            last = i == len(pieces) - 1
+            yield LLMResponse(
+                text=piece,
+                prompt_tokens=len(prompt) // 4 if last else 0,
+                output_tokens=len(text) // 4 if last else 0,
+                cached_tokens=(cached.tokens if cached else 0) if last else 0
+            )
+
+
+def build_llm_client() -> LLMClient:
+    """
+    Build the client from env:
+        LLM_BACKEND           gemini (default) | fake | replay (see app.core.llm_replay for its settings)
+        LLM_MAX_IN_FLIGHT     transport-level cap on concurrent calls (default 64, 0 = none)
+        LLM_TIMEOUT_S         default per-call timeout in seconds (default 60)
+        LLM_FAKE_LATENCY_MS   fake backend mean latency (default 200)
+        LLM_FAKE_JITTER_MS    fake backend latency jitter (default 50)
+        LLM_CONTEXT_CACHE*    shared-prefix caching (see app.core.context_cache)
+    """
+    backend = os.environ.get("LLM_BACKEND", "gemini").lower()
+    common = {
+        "max_in_flight": int(os.environ.get("LLM_MAX_IN_FLIGHT", "64")),
+        "default_timeout": float(os.environ.get("LLM_TIMEOUT_S", "60")) or None,
+        "context_cache": build_context_cache(backend)
+    }
+    if backend == "replay":
+        from app.core.llm_replay import build_replay_client
+        return build_replay_client(**common)
+    if backend == "fake":
+        return FakeLLMClient(
+            latency_ms=float(os.environ.get("LLM_FAKE_LATENCY_MS", "200")),
+            jitter_ms=float(os.environ.get("LLM_FAKE_JITTER_MS", "50")),
+            **common
+        )
+    return GeminiClient(api_key=os.environ.get("GEMINI_API_KEY", ""), **common)
+
+
+# Singleton instance
+llm_client = build_llm_client()
@@ -0,0 +1,245 @@
+"""
+LLM Governor - process-wide admission control in front of every LLM call.
+
+Limits:
+    requests-per-minute and tokens-per-minute token buckets (provider quotas)
+    max concurrent calls (thread pool / socket budget)
+    max concurrent calls per session (fair share between sessions)
+
+Dispatch order: highest agent `priority` first, so safety (100) and risk (8) jump
+ahead of output generation (1) from other sessions; within a priority, the session
+with the fewest calls in flight goes first, then FIFO. A small number of slots are
+reserved for high-priority agents so safety results stay fast under load.
+"""
+
+import os
+import time
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+
+class TokenBucket:
+    """Continuous-refill bucket sized to one minute of quota. 0 = unlimited."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.capacity <= 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` can be taken (oversized requests wait for a full bucket)."""
+        if self.unlimited:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float) -> None:
+        """Take tokens. May go negative when settling actual usage above the estimate."""
+        if not self.unlimited:
+            self._refill()
+            self.tokens -= amount
+
+    def available(self) -> Optional[float]:
+        if self.unlimited:
+            return None
+        self._refill()
+        return round(self.tokens, 1)
+
+
+class _Waiter:
+    __slots__ = ("priority", "session_id", "tokens", "seq", "future", "enqueued_at")
+
+    def __init__(self, priority: int, session_id: str, tokens: int, seq: int):
+        self.priority = priority
+        self.session_id = session_id
+        self.tokens = tokens
+        self.seq = seq
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+
+
+class LLMGrant:
+    """Handed to the caller while it holds a slot; report real usage when known."""
+
+    def __init__(self, governor: "LLMGovernor", waiter: _Waiter):
+        self._governor = governor
+        self._waiter = waiter
+
+    def record_usage(self, total_tokens: int) -> None:
+        """Settle the token bucket against the provider-reported token count."""
+        delta = total_tokens - self._waiter.tokens
+        if delta:
+            self._governor.tpm.consume(delta)
+            self._waiter.tokens = total_tokens
+
+
+class LLMGovernor:
+    def __init__(
+        self,
+        rpm: float = 0,
+        tpm: float = 0,
+        max_concurrency: int = 16,
+        session_max_concurrency: int = 4,
+        reserved_slots: int = 1,
+        high_priority: int = 8
+    ):
+        self.rpm = TokenBucket(rpm)
+        self.tpm = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.session_max_concurrency = session_max_concurrency
+        self.reserved_slots = min(reserved_slots, max(0, max_concurrency - 1))
+        self.high_priority = high_priority
+
+        self._waiting: List[_Waiter] = []
+        self._in_flight = 0
+        self._session_in_flight: Dict[str, int] = {}
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+        # Metrics
+        self.granted = 0
+        self.throttled = 0 # Dispatches delayed by an empty bucket
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    @asynccontextmanager
+    async def slot(self, priority: int, session_id: Optional[str], est_tokens: int):
+        """Wait for admission, hold a slot for the duration of the call."""
+        waiter = _Waiter(priority, session_id or "_global", est_tokens, next(self._seq))
+        self._waiting.append(waiter)
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self._release(waiter) # Granted just as we were cancelled
+            elif waiter in self._waiting:
+                self._waiting.remove(waiter)
+            raise
+        try:
+            yield LLMGrant(self, waiter)
+        finally:
+            self._release(waiter)
+
+    def would_admit(self, priority: int, session_id: Optional[str]) -> bool:
+        """Whether a call would be admitted right now, without waiting (used to decide hedging)."""
+        if self._waiting or self.rpm.wait_time(1) > 0:
+            return False
+        return self._eligible(_Waiter(priority, session_id or "_global", 0, -1))
+
+    def _eligible(self, waiter: _Waiter) -> bool:
+        if self.session_max_concurrency and self._session_in_flight.get(waiter.session_id, 0) >= self.session_max_concurrency:
+            return False
+        if not self.max_concurrency:
+            return True
+        limit = self.max_concurrency
+        if waiter.priority < self.high_priority:
+            limit -= self.reserved_slots
+        return self._in_flight < limit
+
+    def _dispatch(self) -> None:
+        # A cancelled caller's future is done before its task runs the cleanup in slot();
+        # drop such waiters here so no tokens or slot are spent on them
+        self._waiting = [w for w in self._waiting if not w.future.done()]
+        while self._waiting:
+            candidates = [w for w in self._waiting if self._eligible(w)]
+            if not candidates:
+                return
+            waiter = max(candidates, key=lambda w: (w.priority, -self._session_in_flight.get(w.session_id, 0), -w.seq))
+
+            delay = max(self.rpm.wait_time(1), self.tpm.wait_time(waiter.tokens))
+            if delay > 0:
+                self.throttled += 1
+                if self._timer is None:
+                    self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+                return
+
+            self.rpm.consume(1)
+            self.tpm.consume(waiter.tokens)
+            self._waiting.remove(waiter)
+            self._in_flight += 1
+            self._session_in_flight[waiter.session_id] = self._session_in_flight.get(waiter.session_id, 0) + 1
+
+            waited = time.monotonic() - waiter.enqueued_at
+            self.granted += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+            waiter.future.set_result(None)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._dispatch()
+
+    def _release(self, waiter: _Waiter) -> None:
+        self._in_flight -= 1
+        self._session_in_flight[waiter.session_id] -= 1
+        if self._session_in_flight[waiter.session_id] <= 0:
+            del self._session_in_flight[waiter.session_id]
+        self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        by_priority: Dict[int, int] = defaultdict(int)
+        by_session: Dict[str, int] = defaultdict(int)
+        for w in self._waiting:
+            by_priority[w.priority] += 1
+            by_session[w.session_id] += 1
+        return {
+            "in_flight": self._in_flight,
+            "queue_depth": len(self._waiting),
+            "queue_by_priority": dict(sorted(by_priority.items(), reverse=True)),
+            "queue_by_session": dict(by_session),
+            "in_flight_by_session": dict(self._session_in_flight),
+            "granted": self.granted,
+            "throttled": self.throttled,
+            "avg_wait_ms": round(self._total_wait / self.granted * 1000, 1) if self.granted else 0.0,
+            "max_wait_ms": round(self._max_wait * 1000, 1),
+            "rpm_available": self.rpm.available(),
+            "tpm_available": self.tpm.available()
+        }
+
+
+def build_llm_governor() -> LLMGovernor:
+    """
+    Build the governor from env (0 = unlimited):
+        LLM_MAX_RPM                    requests per minute (default 0)
+        LLM_MAX_TPM                    tokens per minute (default 0)
+        LLM_MAX_CONCURRENCY            calls in flight across all sessions (default 16)
+        LLM_SESSION_MAX_CONCURRENCY    calls in flight per session (default 4)
+        LLM_RESERVED_PRIORITY_SLOTS    slots only priority >= 8 agents may use (default 1)
+    """
+    return LLMGovernor(
+        rpm=float(os.environ.get("LLM_MAX_RPM", "0")),
+        tpm=float(os.environ.get("LLM_MAX_TPM", "0")),
+        max_concurrency=int(os.environ.get("LLM_MAX_CONCURRENCY", "16")),
+        session_max_concurrency=int(os.environ.get("LLM_SESSION_MAX_CONCURRENCY", "4")),
+        reserved_slots=int(os.environ.get("LLM_RESERVED_PRIORITY_SLOTS", "1"))
+    )
+
+
+# Output allowance reserved before the call; settled against real usage afterwards
+EXPECTED_OUTPUT_TOKENS = 1024
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap pre-call estimate (~4 characters per token)."""
+    return max(1, len(text) // 4)
+
+
+# Singleton instance
+llm_governor = build_llm_governor()
@@ -0,0 +1,183 @@
+"""
+LLM Replay - serves completions recorded in the blackboard logs, so benchmarks and
+offline runs follow real sessions (clarification pauses, debate rounds) without Gemini.
+
+Recordings are the `agent_outputs/*.json` entries of phase "complete" that carry an
+`llm_response` (the orchestrator logs each agent's raw model text there), grouped by
+session and agent in time order. A session's transcript comes from its "start" entries.
+
+Picking the response for a call (the agent comes from `current_agent_id`):
+    1. the recorded session this live session replays: the one whose transcript appears
+       in the prompt, else a stable pick by session id
+    2. that session's n-th response of the agent for the live session's n-th call to it
+       (a debate re-run gets the recorded re-run; past the end, the last one)
+    3. otherwise any recording of the agent, else the fake backend's default response
+
+Latency follows a distribution spec (see `latency_sampler`).
+"""
+
+import os
+import json
+import math
+import random
+import zlib
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.core.llm_client import FakeLLMClient
+from app.core.session_context import current_agent_id, current_session_id
+
+# (raw model text, recorded model time in ms or None)
+Recording = Tuple[str, Optional[float]]
+
+
+def latency_sampler(spec: str, speedup: float = 1.0) -> Callable[[Optional[float]], float]:
+    """
+    Seconds to wait for one reply, from a spec (times in ms):
+        recorded              the recorded model time (uniform 150-250 when unknown)
+        fixed:MS
+        uniform:LO,HI
+        normal:MEAN,SD
+        lognormal:MEDIAN,SIGMA   heavy tail, like real model latency
+        exponential:MEAN
+    The sampler takes the recorded time of the response being replayed. Every sample is
+    divided by `speedup`.
+    """
+    kind, _, args = spec.partition(":")
+    params = [float(x) for x in args.split(",") if x.strip()]
+    kind = kind.strip().lower()
+    if kind == "recorded":
+        draw = lambda recorded: recorded if recorded is not None else random.uniform(150, 250)
+    elif kind == "fixed":
+        draw = lambda recorded: params[0]
+    elif kind == "uniform":
+        draw = lambda recorded: random.uniform(params[0], params[1])
+    elif kind == "normal":
+        draw = lambda recorded: random.gauss(params[0], params[1])
+    elif kind == "lognormal":
+        draw = lambda recorded: random.lognormvariate(math.log(params[0]), params[1])
+    elif kind == "exponential":
+        draw = lambda recorded: random.expovariate(1 / params[0])
+    else:
+        raise ValueError(f"Unknown latency distribution '{spec}'")
+    return lambda recorded=None: max(0.0, draw(recorded)) / 1000 / speedup
+
+
+def _model_ms(entry: Dict[str, Any]) -> Optional[float]:
+    """
+    Time the model itself took for a logged run: the `model_ms` stage timing. The run's
+    `duration_ms` also covers admission, parsing and stage overhead, which replay adds
+    again, so it is only used for logs written before stage timings.
+    """
+    timings = entry.get("timings")
+    if timings is None:
+        return entry.get("duration_ms")
+    return timings.get("model_ms") # None for cache hits: no model time was recorded
+
+
+def load_recordings(log_dir: Path) -> Tuple[Dict[str, Dict[str, List[Recording]]], Dict[str, str]]:
+    """({session: {agent: [recording, ...]}}, {session: transcript}) from a blackboard log directory."""
+    recordings: Dict[str, Dict[str, List[Recording]]] = {}
+    transcripts: Dict[str, str] = {}
+    for outputs in sorted(Path(log_dir).glob("*/agent_outputs")):
+        session = outputs.parent.name
+        entries = []
+        for path in outputs.glob("*.json"):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    entries.append(json.load(f))
+            except (OSError, ValueError) as e:
+                print(f"WARNING: Skipping unreadable recording {path}: {e}")
+        entries.sort(key=lambda e: e.get("timestamp") or "")
+        agents: Dict[str, List[Recording]] = defaultdict(list)
+        for entry in entries:
+            if entry.get("phase") == "start" and session not in transcripts:
+                transcript = (entry.get("input_data") or {}).get("transcript")
+                if transcript:
+                    transcripts[session] = transcript.strip()
+            elif entry.get("phase") == "complete" and entry.get("llm_response"):
+                agents[entry["agent_id"]].append((entry["llm_response"], _model_ms(entry)))
+        if agents:
+            recordings[session] = dict(agents)
+    return recordings, transcripts
+
+
+class ReplayLLMClient(FakeLLMClient):
+    def __init__(
+        self,
+        recordings: Dict[str, Dict[str, List[Recording]]],
+        transcripts: Optional[Dict[str, str]] = None,
+        latency: Optional[Callable[[Optional[float]], float]] = None,
+        **kwargs
+    ):
+        super().__init__(**kwargs)
+        self.recordings = recordings
+        self.transcripts = {s: t for s, t in (transcripts or {}).items() if s in recordings}
+        self._sessions = sorted(recordings)
+        self._by_agent: Dict[str, List[Recording]] = defaultdict(list)
+        for agents in recordings.values():
+            for agent_id, replies in agents.items():
+                self._by_agent[agent_id].extend(replies)
+        self.latency = latency or latency_sampler("recorded")
+        self._replaying: Dict[str, str] = {} # live session -> recorded session
+        self._turns: Dict[Tuple[Optional[str], Optional[str]], int] = defaultdict(int)
+        self.hits = 0
+        self.fallbacks = 0 # Served from another session's recording
+        self.misses = 0    # No recording for the agent at all
+
+    def _recorded_session(self, session_id: Optional[str], prompt: str) -> Optional[str]:
+        recorded = self._replaying.get(session_id)
+        if recorded is None and self._sessions:
+            recorded = next((s for s, t in self.transcripts.items() if t in prompt), None)
+            if recorded is not None and session_id:
+                self._replaying[session_id] = recorded # Only a transcript match is binding
+            else:
+                recorded = self._sessions[zlib.crc32((session_id or "").encode()) % len(self._sessions)]
+        return recorded
+
+    def _reply(self, model_name: str, prompt: str) -> Tuple[str, float]:
+        self.calls += 1
+        agent_id, session_id = current_agent_id.get(), current_session_id.get()
+        turn = self._turns[(session_id, agent_id)]
+        self._turns[(session_id, agent_id)] = turn + 1
+        replies = self.recordings.get(self._recorded_session(session_id, prompt), {}).get(agent_id)
+        if replies:
+            self.hits += 1
+        else:
+            replies = self._by_agent.get(agent_id)
+            if not replies:
+                self.misses += 1
+                return super()._respond(model_name, prompt), self.latency(None)
+            self.fallbacks += 1
+        text, recorded_ms = replies[min(turn, len(replies) - 1)]
+        return text, self.latency(recorded_ms)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "recorded_sessions": len(self._sessions),
+            "calls": self.calls,
+            "hits": self.hits,
+            "fallbacks": self.fallbacks,
+            "misses": self.misses
+        }
+
+
+def build_replay_client(**kwargs) -> ReplayLLMClient:
+    """
+    Build the replay backend from env:
+        LLM_REPLAY_DIR       blackboard log directory to replay (default logs/sessions)
+        LLM_REPLAY_LATENCY   latency distribution (default recorded; see latency_sampler)
+        LLM_REPLAY_SPEEDUP   divide every latency by this (default 1)
+    """
+    log_dir = Path(os.environ.get("LLM_REPLAY_DIR") or Path(__file__).resolve().parent.parent.parent / "logs" / "sessions")
+    recordings, transcripts = load_recordings(log_dir)
+    replies = sum(len(r) for agents in recordings.values() for r in agents.values())
+    print(f"DEBUG: LLM replay loaded {replies} responses from {len(recordings)} sessions in {log_dir}")
+    if not recordings:
+        print(f"WARNING: No recorded LLM responses under {log_dir}; replay will serve the fake default response")
+    latency = latency_sampler(
+        os.environ.get("LLM_REPLAY_LATENCY", "recorded"),
+        speedup=float(os.environ.get("LLM_REPLAY_SPEEDUP", "1")) or 1.0
+    )
+    return ReplayLLMClient(recordings, transcripts, latency=latency, **kwargs)
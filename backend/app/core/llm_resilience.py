@@ -0,0 +1,307 @@
+"""
+LLM Resilience - retry, hedging and circuit-breaker policy around every agent LLM call.
+
+Per attempt (one admitted model call, up to its first chunk when streaming):
+    timeout     the agent's `llm_timeout` (enforced by the client)
+    retries     retryable failures (timeouts, 429, 5xx, dropped connections) are tried
+                again after a full-jitter exponential backoff; anything else (bad request,
+                blocked prompt) fails at once
+    hedging     for agents that opt in, a duplicate request goes out once the first has
+                been outstanding longer than the agent's recent p95; the first to answer
+                wins and the other is cancelled. Tail latency is mostly provider queueing,
+                so a second try usually lands on a faster path.
+    breaker     per model: after `failure_threshold` retryable failures in a row calls fail
+                fast with CircuitOpenError for `open_seconds`; then one probe call is let
+                through and its outcome closes or re-opens the circuit
+
+A streamed call that fails after its first chunk is not retried: its fields have already
+been forwarded. Its failure still counts toward the breaker (`record_failure`).
+"""
+
+import os
+import time
+import random
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+from google.api_core import exceptions as google_exceptions
+
+from app.core.metrics import llm_circuit_state, llm_hedges_total, llm_retries_total
+
+T = TypeVar("T")
+
+RETRYABLE_ERRORS = (
+    asyncio.TimeoutError,
+    ConnectionError,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.InternalServerError,
+    google_exceptions.BadGateway,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.GatewayTimeout,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.Aborted
+)
+
+CIRCUIT_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+class CircuitOpenError(Exception):
+    """The model's circuit is open: the call was not sent."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    return isinstance(error, RETRYABLE_ERRORS)
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 5, open_seconds: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.state = "closed"
+        self.failures = 0 # Consecutive retryable failures
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probing = False
+        llm_circuit_state.labels(name).set(CIRCUIT_STATES["closed"])
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless a call may go out now."""
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.open_seconds:
+            self._set_state("half_open")
+        if self.state == "open" or (self.state == "half_open" and self._probing):
+            self.rejected += 1
+            raise CircuitOpenError(f"LLM circuit for {self.name} is open after {self.failures} consecutive failures")
+        if self.state == "half_open":
+            self._probing = True
+
+    def release_probe(self) -> None:
+        """The probe call was cancelled before it had an outcome; let the next one through."""
+        self._probing = False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._probing = False
+        if self.state != "closed":
+            print(f"DEBUG: LLM circuit for {self.name} closed")
+            self._set_state("closed")
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.state == "half_open" or (self.state == "closed" and self.failure_threshold and self.failures >= self.failure_threshold):
+            print(f"WARNING: LLM circuit for {self.name} opened after {self.failures} consecutive failures; failing fast for {self.open_seconds}s")
+            self.opened_at = time.monotonic()
+            self._set_state("open")
+
+    def _set_state(self, state: str) -> None:
+        self.state = state
+        llm_circuit_state.labels(self.name).set(CIRCUIT_STATES[state])
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "consecutive_failures": self.failures, "rejected": self.rejected}
+
+
+class LatencyWindow:
+    """Recent attempt latencies of one agent, for its hedge delay."""
+
+    def __init__(self, size: int = 200):
+        self.samples: Deque[float] = deque(maxlen=size)
+
+    def add(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def quantile(self, q: float) -> float:
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class LLMResilience:
+    def __init__(
+        self,
+        max_retries: int = 2,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        failure_threshold: int = 5,
+        open_seconds: float = 30.0,
+        hedge_enabled: bool = True,
+        hedge_quantile: float = 0.95,
+        hedge_min_samples: int = 20,
+        hedge_min_delay: float = 0.05
+    ):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.hedge_enabled = hedge_enabled
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._latency: Dict[str, LatencyWindow] = {}
+
+        # Metrics
+        self.calls = 0
+        self.retries = 0
+        self.failed = 0
+        self.hedges = 0
+        self.hedges_won = 0
+
+    def breaker(self, model_name: str) -> CircuitBreaker:
+        if model_name not in self._breakers:
+            self._breakers[model_name] = CircuitBreaker(model_name, self.failure_threshold, self.open_seconds)
+        return self._breakers[model_name]
+
+    def backoff(self, retry: int) -> float:
+        """Full jitter: uniform between 0 and base * 2^retry, capped."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** retry))
+
+    def hedge_delay(self, agent_id: str) -> Optional[float]:
+        """Seconds after which to hedge `agent_id`'s call, None until enough latencies are known."""
+        window = self._latency.get(agent_id)
+        if not self.hedge_enabled or window is None or len(window.samples) < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_delay, window.quantile(self.hedge_quantile))
+
+    def record_failure(self, model_name: str, error: BaseException) -> None:
+        """Report a failure outside `call` (a stream that broke after its first chunk)."""
+        if is_retryable(error):
+            self.breaker(model_name).record_failure()
+
+    async def call(
+        self,
+        agent_id: str,
+        model_name: str,
+        attempt: Callable[[], Awaitable[T]],
+        hedge: Optional[Callable[[], bool]] = None,
+        discard: Optional[Callable[[T], Awaitable[None]]] = None
+    ) -> T:
+        """
+        Run `attempt` under the policy and return the first successful result.
+        `hedge`, when given, opts into hedging and is asked just before the duplicate goes
+        out (return False to skip it, e.g. when no capacity is free). `discard` releases
+        a result that lost the race.
+        """
+        self.calls += 1
+        breaker = self.breaker(model_name)
+        retry = 0
+        while True:
+            breaker.before_call()
+            started = time.perf_counter()
+            try:
+                result = await self._attempt(agent_id, attempt, hedge, discard)
+            except asyncio.CancelledError:
+                breaker.release_probe()
+                raise
+            except Exception as e:
+                if not is_retryable(e):
+                    breaker.record_success() # The backend answered; the request itself was bad
+                    self.failed += 1
+                    raise
+                breaker.record_failure()
+                if retry >= self.max_retries or breaker.state == "open":
+                    self.failed += 1
+                    raise
+                delay = self.backoff(retry)
+                retry += 1
+                self.retries += 1
+                llm_retries_total.labels(agent_id, type(e).__name__).inc()
+                print(f"WARNING: LLM call for {agent_id} failed ({type(e).__name__}: {e}); retry {retry}/{self.max_retries} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                continue
+            breaker.record_success()
+            self._latency.setdefault(agent_id, LatencyWindow()).add(time.perf_counter() - started)
+            return result
+
+    async def _attempt(
+        self,
+        agent_id: str,
+        attempt: Callable[[], Awaitable[T]],
+        hedge: Optional[Callable[[], bool]],
+        discard: Optional[Callable[[T], Awaitable[None]]]
+    ) -> T:
+        delay = self.hedge_delay(agent_id) if hedge else None
+        if delay is None:
+            return await attempt()
+
+        primary = asyncio.ensure_future(attempt())
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done or not hedge():
+                return await primary
+            self.hedges += 1
+            secondary = asyncio.ensure_future(attempt())
+        except BaseException:
+            primary.cancel()
+            raise
+
+        pending = {primary, secondary}
+        try:
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((t for t in done if not t.cancelled() and t.exception() is None), None)
+                if winner is not None:
+                    break
+                if not pending:
+                    return await primary # Both failed: surface the primary's error
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        for task in done:
+            if task is not winner and discard and not task.cancelled() and task.exception() is None:
+                await discard(task.result()) # Both answered in the same tick
+        outcome = "hedge" if winner is secondary else "primary"
+        if winner is secondary:
+            self.hedges_won += 1
+        llm_hedges_total.labels(agent_id, outcome).inc()
+        print(f"DEBUG: Hedged LLM call for {agent_id} after {delay * 1000:.0f} ms; {outcome} answered first")
+        return winner.result()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "failed": self.failed,
+            "hedges": self.hedges,
+            "hedges_won": self.hedges_won,
+            "hedge_delay_ms": {
+                agent: round(delay * 1000, 1)
+                for agent in self._latency
+                if (delay := self.hedge_delay(agent)) is not None
+            },
+            "circuits": {name: breaker.stats() for name, breaker in self._breakers.items()}
+        }
+
+
+def build_llm_resilience() -> LLMResilience:
+    """
+    Build the policy from env:
+        LLM_MAX_RETRIES              retries per call on retryable errors (default 2)
+        LLM_RETRY_BACKOFF_MS         backoff base; retry n waits up to base * 2^n (default 500)
+        LLM_RETRY_BACKOFF_MAX_MS     backoff cap (default 8000)
+        LLM_CIRCUIT_FAILURES         consecutive failures that open a model's circuit (default 5, 0 = never)
+        LLM_CIRCUIT_OPEN_S           how long an open circuit fails fast before a probe (default 30)
+        LLM_HEDGE                    hedge agents with `hedge_requests` (default on)
+        LLM_HEDGE_QUANTILE           latency quantile after which to hedge (default 0.95)
+        LLM_HEDGE_MIN_SAMPLES        calls an agent needs before it is hedged (default 20)
+    """
+    return LLMResilience(
+        max_retries=int(os.environ.get("LLM_MAX_RETRIES", "2")),
+        backoff_base=float(os.environ.get("LLM_RETRY_BACKOFF_MS", "500")) / 1000,
+        backoff_max=float(os.environ.get("LLM_RETRY_BACKOFF_MAX_MS", "8000")) / 1000,
+        failure_threshold=int(os.environ.get("LLM_CIRCUIT_FAILURES", "5")),
+        open_seconds=float(os.environ.get("LLM_CIRCUIT_OPEN_S", "30")),
+        hedge_enabled=os.environ.get("LLM_HEDGE", "on").lower() not in ("0", "off", "false"),
+        hedge_quantile=float(os.environ.get("LLM_HEDGE_QUANTILE", "0.95")),
+        hedge_min_samples=int(os.environ.get("LLM_HEDGE_MIN_SAMPLES", "20"))
+    )
+
+
+# Singleton instance
+llm_resilience = build_llm_resilience()
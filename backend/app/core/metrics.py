@@ -0,0 +1,238 @@
+"""
+Metrics - in-process counters, gauges and histograms served at /metrics in the
+Prometheus text format.
+
+Recording is a dict lookup plus an add (histograms: a bisect over the bucket bounds);
+no locks, since everything runs on the event loop. Rendering walks the registry when
+/metrics is scraped. Point-in-time values (sessions by status, queue depths, cache hit
+ratio) are set by the endpoint just before rendering.
+
+    agent_execute_seconds.labels("diagnosis_mapping").observe(1.2)
+"""
+
+import asyncio
+import math
+import os
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Seconds; covers cache hits through slow model calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        return "\n".join([f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples())
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, k)} {_number(c.value)}" for k, c in self._children.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def clear(self) -> None:
+        """Forget all label sets (for gauges rebuilt on every scrape)."""
+        self._children.clear()
+
+
+class _Buckets:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1) # Last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _Buckets:
+        return _Buckets(self.buckets)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), child.counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(child.sum)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self, loop_lag_interval: float = 0.1):
+        self.loop_lag_interval = loop_lag_interval
+        self._metrics: Dict[str, _Metric] = {}
+        self._lag_monitor: Optional[asyncio.Task] = None
+
+    def _register(self, metric: _Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        return "\n".join(m.render() for m in self._metrics.values()) + "\n"
+
+    def start_loop_monitor(self) -> None:
+        """Measure event-loop lag: how late a periodic sleep wakes up."""
+        if self.loop_lag_interval > 0 and self._lag_monitor is None:
+            self._lag_monitor = asyncio.create_task(self._watch_loop_lag())
+
+    async def stop_loop_monitor(self) -> None:
+        if self._lag_monitor is not None:
+            self._lag_monitor.cancel()
+            await asyncio.gather(self._lag_monitor, return_exceptions=True)
+            self._lag_monitor = None
+
+    async def _watch_loop_lag(self) -> None:
+        lag_histogram = event_loop_lag_seconds.labels()
+        lag_gauge = event_loop_lag_last_seconds.labels()
+        while True:
+            expected = time.perf_counter() + self.loop_lag_interval
+            await asyncio.sleep(self.loop_lag_interval)
+            lag = max(0.0, time.perf_counter() - expected)
+            lag_histogram.observe(lag)
+            lag_gauge.set(lag)
+
+
+def build_metrics() -> MetricsRegistry:
+    """
+    Build the registry from env:
+        METRICS_LOOP_LAG_INTERVAL_MS   event-loop lag sampling period (default 100, 0 = off)
+    """
+    interval_ms = float(os.environ.get("METRICS_LOOP_LAG_INTERVAL_MS", "100"))
+    return MetricsRegistry(loop_lag_interval=interval_ms / 1000)
+
+
+# Singleton instances
+metrics = build_metrics()
+
+# Agents
+agent_queue_seconds = metrics.histogram(
+    "crucible_agent_queue_seconds", "Time from the triggering event to the agent starting (bus queue and agent lock)", ["agent"])
+agent_execute_seconds = metrics.histogram(
+    "crucible_agent_execute_seconds", "Agent execute() wall time", ["agent"])
+agent_parse_seconds = metrics.histogram(
+    "crucible_agent_parse_seconds", "Parsing and checking an agent's LLM output", ["agent"])
+agent_runs_total = metrics.counter(
+    "crucible_agent_runs_total", "Agent runs by outcome", ["agent", "status"])
+
+# LLM
+llm_admission_wait_seconds = metrics.histogram(
+    "crucible_llm_admission_wait_seconds", "Time an LLM call waited for the governor (rate limits, concurrency)", ["agent"])
+llm_call_seconds = metrics.histogram(
+    "crucible_llm_call_seconds", "LLM call time once admitted", ["agent", "model"])
+llm_tokens_total = metrics.counter(
+    "crucible_llm_tokens_total", "LLM tokens by kind: prompt (including cached), cached, output", ["agent", "model", "kind"])
+llm_cache_requests_total = metrics.counter(
+    "crucible_llm_cache_requests_total", "LLM response cache lookups", ["agent", "result"])
+llm_cache_hit_ratio = metrics.gauge(
+    "crucible_llm_cache_hit_ratio", "LLM response cache hit ratio since start")
+llm_retries_total = metrics.counter(
+    "crucible_llm_retries_total", "LLM calls retried, by the error that triggered the retry", ["agent", "error"])
+llm_hedges_total = metrics.counter(
+    "crucible_llm_hedges_total", "Hedged LLM calls by which request answered first (primary, hedge)", ["agent", "winner"])
+llm_circuit_state = metrics.gauge(
+    "crucible_llm_circuit_state", "LLM circuit breaker state per model: 0 closed, 1 half-open, 2 open", ["model"])
+llm_governor_queue_depth = metrics.gauge(
+    "crucible_llm_governor_queue_depth", "LLM calls waiting for admission")
+llm_governor_in_flight = metrics.gauge(
+    "crucible_llm_governor_in_flight", "LLM calls in flight")
+
+# Sessions and transport
+sessions = metrics.gauge(
+    "crucible_sessions", "Sessions in memory by status", ["status"])
+ws_connections = metrics.gauge(
+    "crucible_ws_connections", "Open WebSocket connections")
+ws_queue_depth = metrics.gauge(
+    "crucible_ws_queue_depth", "Messages queued across WebSocket send queues")
+ws_dropped = metrics.gauge(
+    "crucible_ws_dropped_messages", "Status messages dropped by full WebSocket send queues (open connections)")
+event_loop_lag_seconds = metrics.histogram(
+    "crucible_event_loop_lag_seconds", "How late a periodic sleep on the event loop wakes up", buckets=LAG_BUCKETS)
+event_loop_lag_last_seconds = metrics.gauge(
+    "crucible_event_loop_lag_last_seconds", "Latest event-loop lag sample")
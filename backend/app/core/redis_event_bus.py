@@ -0,0 +1,406 @@
+"""
+Redis Streams event bus - lets several uvicorn workers / nodes share sessions.
+
+Every topic is a stream `{prefix}:{topic}`.
+    subscribe(topic, h)            consumer group `{group}`: each event goes to exactly one
+                                   worker. Entries are acked once the handler returns, so an
+                                   event whose worker died is reclaimed (XAUTOCLAIM) by another
+                                   after `claim_idle_ms`. Workers refresh the idle time of
+                                   events they are still handling, so a long workflow is
+                                   never taken over while its worker is alive.
+    subscribe_broadcast(topic, h)  plain XREAD from the stream's end at start(): every worker
+                                   sees every later event, in order.
+
+Requires the `redis` package (redis-py >= 4.2, RESP2 replies with decode_responses=True).
+Works against a local redis-server or any client object exposing the same stream commands.
+`FakeStreamClient` is such an object: an in-process stand-in (REDIS_URL=memory://) for
+trying the bus, several "workers" in one process included, without a server.
+"""
+
+import os
+import json
+import time
+import socket
+import asyncio
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.event_bus import BaseEventBus, Event, Handler
+
+try:
+    import redis.asyncio as aioredis
+except ImportError: # Optional dependency: only needed with EVENT_BUS=redis
+    aioredis = None
+
+# (entry id, fields)
+StreamEntry = Tuple[str, Dict[str, str]]
+
+
+def _entries_by_stream(reply: Any) -> List[Tuple[str, List[StreamEntry]]]:
+    """Normalize XREAD/XREADGROUP replies (RESP2 list of pairs, or RESP3 dict)."""
+    if not reply:
+        return []
+    if isinstance(reply, dict):
+        return list(reply.items())
+    return [(stream, entries) for stream, entries in reply]
+
+
+def _parse_id(entry_id: str) -> Tuple[int, int]:
+    ms, _, seq = entry_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+class FakeStreamServer:
+    """Shared state of the fake: streams, consumer groups and their pending entries."""
+
+    def __init__(self):
+        self.streams: Dict[str, List[StreamEntry]] = defaultdict(list)
+        # stream -> group -> {"last": last delivered id, "pending": {id: [consumer, delivered at ms]}}
+        self.groups: Dict[str, Dict[str, Dict[str, Any]]] = defaultdict(dict)
+        self.added = asyncio.Condition()
+        self._last_id = (0, 0)
+
+    def next_id(self) -> str:
+        ms = int(time.time() * 1000)
+        last_ms, last_seq = self._last_id
+        self._last_id = (ms, 0) if ms > last_ms else (last_ms, last_seq + 1)
+        return f"{self._last_id[0]}-{self._last_id[1]}"
+
+
+class FakeStreamClient:
+    """
+    The stream commands RedisStreamsEventBus uses (RESP2 reply shapes), over a
+    FakeStreamServer. Clients sharing a server behave like workers sharing a Redis.
+    """
+
+    def __init__(self, server: Optional[FakeStreamServer] = None):
+        self.server = server or FakeStreamServer()
+
+    @staticmethod
+    def _now_ms() -> float:
+        return time.monotonic() * 1000
+
+    def _after(self, stream: str, last_id: str) -> List[StreamEntry]:
+        after = _parse_id(last_id)
+        return [(i, f) for i, f in self.server.streams.get(stream, []) if _parse_id(i) > after]
+
+    def _group(self, stream: str, group: str) -> Dict[str, Any]:
+        state = self.server.groups.get(stream, {}).get(group)
+        if state is None:
+            raise Exception(f"NOGROUP No such key '{stream}' or consumer group '{group}'")
+        return state
+
+    async def _wait(self, read, block: Optional[int]):
+        reply = read()
+        if reply or not block:
+            return reply
+        deadline = time.monotonic() + block / 1000
+        async with self.server.added:
+            while not reply:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(self.server.added.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+                reply = read()
+        return reply
+
+    async def xadd(self, name: str, fields: Dict[str, str], maxlen: Optional[int] = None, approximate: bool = True) -> str:
+        entry_id = self.server.next_id()
+        entries = self.server.streams[name]
+        entries.append((entry_id, dict(fields)))
+        if maxlen and len(entries) > maxlen:
+            del entries[:len(entries) - maxlen]
+        async with self.server.added:
+            self.server.added.notify_all()
+        return entry_id
+
+    async def xgroup_create(self, name: str, groupname: str, id: str = "$", mkstream: bool = False) -> bool:
+        if name not in self.server.streams and not mkstream:
+            raise Exception("ERR The XGROUP subcommand requires the key to exist")
+        if groupname in self.server.groups[name]:
+            raise Exception("BUSYGROUP Consumer Group name already exists")
+        entries = self.server.streams[name]
+        last = entries[-1][0] if id == "$" and entries else ("0-0" if id == "$" else id)
+        self.server.groups[name][groupname] = {"last": last, "pending": {}}
+        return True
+
+    async def xrevrange(self, name: str, max: str = "+", min: str = "-", count: Optional[int] = None) -> List[StreamEntry]:
+        entries = list(reversed(self.server.streams.get(name, [])))
+        return entries[:count] if count else entries
+
+    async def xread(self, streams: Dict[str, str], count: Optional[int] = None, block: Optional[int] = None):
+        def read():
+            reply = []
+            for stream, last_id in streams.items():
+                entries = self._after(stream, last_id)[:count]
+                if entries:
+                    reply.append([stream, entries])
+            return reply
+        return await self._wait(read, block)
+
+    async def xreadgroup(self, groupname: str, consumername: str, streams: Dict[str, str], count: Optional[int] = None, block: Optional[int] = None):
+        def read():
+            reply = []
+            for stream, cursor in streams.items():
+                if cursor != ">":
+                    raise NotImplementedError("FakeStreamClient only reads new entries ('>')")
+                state = self._group(stream, groupname)
+                entries = self._after(stream, state["last"])[:count]
+                if entries:
+                    state["last"] = entries[-1][0]
+                    for entry_id, _ in entries:
+                        state["pending"][entry_id] = [consumername, self._now_ms()]
+                    reply.append([stream, entries])
+            return reply
+        return await self._wait(read, block)
+
+    async def xack(self, name: str, groupname: str, *ids: str) -> int:
+        pending = self._group(name, groupname)["pending"]
+        return sum(1 for entry_id in ids if pending.pop(entry_id, None) is not None)
+
+    async def xclaim(
+        self, name: str, groupname: str, consumername: str, min_idle_time: int, message_ids: List[str], justid: bool = False
+    ):
+        pending = self._group(name, groupname)["pending"]
+        now = self._now_ms()
+        claimed = [i for i in message_ids if i in pending and now - pending[i][1] >= min_idle_time]
+        for entry_id in claimed:
+            pending[entry_id] = [consumername, now]
+        if justid:
+            return claimed
+        fields = dict(self.server.streams.get(name, []))
+        return [(i, fields[i]) for i in claimed if i in fields]
+
+    async def xautoclaim(
+        self, name: str, groupname: str, consumername: str, min_idle_time: int, start_id: str = "0-0", count: Optional[int] = None
+    ):
+        """[next start id, claimed entries, deleted ids]; trimmed entries come back with None fields."""
+        pending = self._group(name, groupname)["pending"]
+        fields = dict(self.server.streams.get(name, []))
+        now = self._now_ms()
+        start = _parse_id(start_id)
+        claimed = []
+        for entry_id in sorted(pending, key=_parse_id):
+            if _parse_id(entry_id) < start or now - pending[entry_id][1] < min_idle_time:
+                continue
+            if count and len(claimed) >= count:
+                return [entry_id, claimed, []]
+            pending[entry_id] = [consumername, now]
+            claimed.append((entry_id, fields.get(entry_id)))
+        return ["0-0", claimed, []]
+
+    async def aclose(self) -> None:
+        pass
+
+
+# Workers in one process built with REDIS_URL=memory:// share this
+_memory_server: Optional[FakeStreamServer] = None
+
+
+class RedisStreamsEventBus(BaseEventBus):
+    distributed = True
+
+    def __init__(
+        self,
+        client: Any = None,
+        url: str = "redis://localhost:6379/0",
+        prefix: str = "crucible",
+        group: str = "workers",
+        consumer: Optional[str] = None,
+        block_ms: int = 1000,
+        claim_idle_ms: int = 60000,
+        maxlen: int = 10000,
+        max_in_flight: int = 32
+    ):
+        if client is None and url.startswith("memory://"):
+            global _memory_server
+            _memory_server = _memory_server or FakeStreamServer()
+            client = FakeStreamClient(_memory_server)
+        if client is None:
+            if aioredis is None:
+                raise RuntimeError("EVENT_BUS=redis needs the redis package (pip install redis)")
+            client = aioredis.from_url(url, decode_responses=True)
+        self.client = client
+        self.prefix = prefix
+        self.group = group
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.maxlen = maxlen
+        self._work: Dict[str, List[Handler]] = defaultdict(list)
+        self._fanout: Dict[str, List[Handler]] = defaultdict(list)
+        self.max_in_flight = max_in_flight
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._in_flight: Dict[str, set] = defaultdict(set) # stream -> entry ids being handled here
+        self._handler_tasks: set = set()
+        self._loops: List[asyncio.Task] = []
+        self._closing = False
+
+    def _stream(self, topic: str) -> str:
+        return f"{self.prefix}:{topic}"
+
+    def subscribe(self, topic: str, handler: Handler):
+        self._work[topic].append(handler)
+        print(f"[RedisEventBus] Subscribed to '{topic}' (group {self.group})")
+
+    def subscribe_broadcast(self, topic: str, handler: Handler):
+        self._fanout[topic].append(handler)
+        print(f"[RedisEventBus] Subscribed to '{topic}' (fan-out)")
+
+    async def publish(self, event: Event):
+        await self.client.xadd(
+            self._stream(event.topic),
+            {"event": json.dumps(event.to_dict(), default=str)},
+            maxlen=self.maxlen,
+            approximate=True
+        )
+
+    async def start(self):
+        """Create consumer groups and start the read loops (call once subscriptions are in place)."""
+        if self._loops:
+            return
+        for topic in self._work:
+            try:
+                await self.client.xgroup_create(self._stream(topic), self.group, id="$", mkstream=True)
+            except Exception as e:
+                if "BUSYGROUP" not in str(e): # Group already exists (another worker made it)
+                    raise
+        if self._work:
+            self._loops.append(asyncio.create_task(self._group_loop()))
+            self._loops.append(asyncio.create_task(self._maintenance_loop()))
+        if self._fanout:
+            # Pin "now" before returning, so events published right after start() are seen
+            last_ids = {}
+            for topic in self._fanout:
+                stream = self._stream(topic)
+                latest = await self.client.xrevrange(stream, count=1)
+                last_ids[stream] = latest[0][0] if latest else "0-0"
+            self._loops.append(asyncio.create_task(self._fanout_loop(last_ids)))
+
+    async def close(self):
+        self._closing = True
+        for task in self._loops:
+            task.cancel()
+        await asyncio.gather(*self._loops, return_exceptions=True)
+        self._loops = []
+        # Unfinished handlers stay pending in the group and are reclaimed by a live worker
+        for task in list(self._handler_tasks):
+            task.cancel()
+        await asyncio.gather(*self._handler_tasks, return_exceptions=True)
+        close = getattr(self.client, "aclose", None) or getattr(self.client, "close", None)
+        if close is not None:
+            await close()
+
+    # --- work delivery (consumer group) ---
+
+    async def _group_loop(self):
+        streams = {self._stream(topic): ">" for topic in self._work}
+        while not self._closing:
+            try:
+                await self._slots.acquire() # Don't claim work we have no room to run
+                self._slots.release()
+                free = self.max_in_flight - sum(len(ids) for ids in self._in_flight.values())
+                reply = await self.client.xreadgroup(self.group, self.consumer, streams, count=max(free, 1), block=self.block_ms)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[RedisEventBus] Read error: {e}")
+                await asyncio.sleep(1)
+                continue
+            for stream, entries in _entries_by_stream(reply):
+                for entry_id, fields in entries:
+                    await self._dispatch(stream, entry_id, fields)
+
+    async def _dispatch(self, stream: str, entry_id: str, fields: Optional[Dict[str, str]]):
+        self._in_flight[stream].add(entry_id) # Kept fresh while it waits for a slot too
+        await self._slots.acquire()
+        task = asyncio.create_task(self._handle(stream, entry_id, fields))
+        self._handler_tasks.add(task)
+        task.add_done_callback(self._handler_tasks.discard)
+
+    async def _handle(self, stream: str, entry_id: str, fields: Optional[Dict[str, str]]):
+        try:
+            if fields and "event" in fields:
+                event = Event.from_dict(json.loads(fields["event"]))
+                handlers = self._work.get(event.topic, [])
+                await asyncio.gather(*[h(event) for h in handlers])
+        except asyncio.CancelledError:
+            raise # Shutdown: leave it pending for another worker
+        except Exception as e:
+            # Handler errors are not retried (the session reports its own failure)
+            print(f"[RedisEventBus] Handler failed for {stream} {entry_id}: {e}")
+        finally:
+            self._in_flight[stream].discard(entry_id)
+            self._slots.release()
+        try:
+            await self.client.xack(stream, self.group, entry_id)
+        except Exception as e:
+            print(f"[RedisEventBus] Ack failed for {stream} {entry_id}: {e}")
+
+    async def _maintenance_loop(self):
+        """Keep our in-flight entries fresh and adopt entries orphaned by dead workers."""
+        interval = max(self.claim_idle_ms / 3000, 0.1)
+        while not self._closing:
+            await asyncio.sleep(interval)
+            for topic in self._work:
+                stream = self._stream(topic)
+                try:
+                    mine = list(self._in_flight[stream])
+                    if mine:
+                        await self.client.xclaim(stream, self.group, self.consumer, min_idle_time=0, message_ids=mine, justid=True)
+                    reply = await self.client.xautoclaim(stream, self.group, self.consumer, min_idle_time=self.claim_idle_ms, start_id="0-0", count=16)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"[RedisEventBus] Claim error on {stream}: {e}")
+                    continue
+                # [next_id, entries] (Redis 6.2) or [next_id, entries, deleted_ids] (7+)
+                for entry_id, fields in reply[1]:
+                    if entry_id in self._in_flight[stream]:
+                        continue
+                    print(f"[RedisEventBus] Reclaimed {stream} {entry_id} from a dead worker")
+                    if fields is None: # Trimmed away before anyone handled it
+                        await self.client.xack(stream, self.group, entry_id)
+                        continue
+                    await self._dispatch(stream, entry_id, fields)
+
+    # --- fan-out ---
+
+    async def _fanout_loop(self, last_ids: Dict[str, str]):
+        while not self._closing:
+            try:
+                reply = await self.client.xread(last_ids, count=64, block=self.block_ms)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[RedisEventBus] Read error: {e}")
+                await asyncio.sleep(1)
+                continue
+            for stream, entries in _entries_by_stream(reply):
+                for entry_id, fields in entries:
+                    last_ids[stream] = entry_id
+                    try:
+                        event = Event.from_dict(json.loads(fields["event"]))
+                        for handler in self._fanout.get(event.topic, []):
+                            await handler(event) # In order: UI messages must not overtake each other
+                    except Exception as e:
+                        print(f"[RedisEventBus] Fan-out handler failed for {stream} {entry_id}: {e}")
+
+
+def build_redis_event_bus() -> RedisStreamsEventBus:
+    """
+    Build the Redis bus from env:
+        REDIS_URL                 default redis://localhost:6379/0; memory:// = in-process FakeStreamClient
+        EVENT_BUS_PREFIX          stream key prefix (default crucible)
+        EVENT_BUS_CLAIM_IDLE_S    silence before a dead worker's events are reclaimed (default 60)
+        EVENT_BUS_MAX_IN_FLIGHT   events handled concurrently per worker (default 32)
+    """
+    return RedisStreamsEventBus(
+        url=os.environ.get("REDIS_URL", "redis://localhost:6379/0"),
+        prefix=os.environ.get("EVENT_BUS_PREFIX", "crucible"),
+        claim_idle_ms=int(float(os.environ.get("EVENT_BUS_CLAIM_IDLE_S", "60")) * 1000),
+        max_in_flight=int(os.environ.get("EVENT_BUS_MAX_IN_FLIGHT", "32"))
+    )
@@ -0,0 +1,265 @@
+"""
+Safety Pre-screen - deterministic risk signal over the transcript, ahead of the LLM triage.
+
+Every lexicon phrase is compiled into one Aho-Corasick automaton over words, so the
+transcript is scanned once however many phrases there are (and only transcripts with
+hits pay for anything more than tokenizing). Each hit is then qualified:
+    negated  - a screening denial qualifies it: "denies" (or "negative for") within
+               `negation_window` words before it in the same clause, or "no" right before
+               it ("no SI"). Commas end a clause, so "denies SI, hears voices" still flags
+               the voices. Conversational negation ("can't stop thinking about suicide",
+               "never told anyone I'm suicidal") does not count.
+    asked    - it sits in a question (e.g. C-SSRS items); it counts as denied when the
+               reply starts with "no" / "never"..., otherwise as a concern
+
+Verdicts:
+    explicit   - an explicit phrase ("kill myself", "wants to die", "voices tell me to") stated plainly
+    uncertain  - softer concerns, questions not clearly denied, or negated explicit phrases;
+                 also a transcript with no hits at all, since the lexicon can't rule out what
+                 it doesn't list
+    clear      - only screened-negative concerns ("denies SI/HI")
+
+The screen can only make the safety gate stricter: the orchestrator alerts at once and
+holds every result on "explicit", and otherwise waits for the LLM safety triage. "clear"
+never opens the gate (a denial says nothing about risk stated in words the lexicon lacks);
+it is logged so triage verdicts can be compared against it.
+"""
+
+import os
+import re
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+# Pronoun slots expanded in lexicon phrases, so third-person and reported speech match too
+PRONOUN_FORMS = {
+    "{self}": ["myself", "himself", "herself", "themselves", "themself", "yourself"],
+    "{poss}": ["my", "his", "her", "their", "your"]
+}
+
+# category -> tier -> phrases (lowercase, matched as whole words; {self}/{poss} see PRONOUN_FORMS)
+LEXICONS: Dict[str, Dict[str, List[str]]] = {
+    "suicide": {
+        "explicit": [
+            "kill {self}", "kills {self}", "killing {self}", "killed {self}", "end {poss} life", "ends {poss} life",
+            "ending {poss} life", "ended {poss} life", "take {poss} own life", "takes {poss} own life",
+            "taking {poss} own life", "took {poss} own life", "commit suicide", "committing suicide",
+            "tried to kill {self}", "trying to kill {self}", "suicide attempt", "attempted suicide",
+            "suicide plan", "plan to kill {self}", "plans to kill {self}", "want to die", "wants to die",
+            "wanted to die", "wanting to die", "want to be dead", "wants to be dead", "better off dead",
+            "hang {self}", "hanged {self}", "hanging {self}", "tried to hang", "shoot {self}", "shot {self}",
+            "slit {poss} wrists", "cut {poss} wrists", "suicide note", "overdose on purpose", "overdosed on purpose",
+            "took an overdose", "took a bottle of pills", "swallowed a bottle of pills", "took all {poss} pills"
+        ],
+        "concern": [
+            "suicide", "suicidal", "suicidal ideation", "self-harm", "self harm", "hurt {self}", "hurting {self}",
+            "cut {self}", "cuts {self}", "cutting {self}", "hopeless", "no reason to live", "better off without me",
+            "wish i was dead", "wish i were dead", "not wake up", "burden to everyone", "give away {poss} things",
+            "si", "si/hi", "suicidal thoughts", "thoughts of suicide", "overdose", "overdosed", "die", "dying",
+            "dead", "kill", "killing", "hang", "noose", "pills", "bottle of pills", "jump off", "jumped off",
+            "ending it all", "end it all"
+        ]
+    },
+    "homicide": {
+        "explicit": [
+            "kill him", "kill her", "kill them", "going to kill", "gonna kill", "want to hurt someone",
+            "wants to hurt someone", "shoot him", "shoot her", "shoot them", "make them pay"
+        ],
+        "concern": ["homicidal", "homicidal ideation", "violent thoughts", "bought a gun", "get a gun", "gun", "weapon", "hurt someone"]
+    },
+    "abuse": {
+        "explicit": [
+            "hits me", "hits her", "hits him", "beats me", "beats her", "beats him", "beat me up", "chokes me",
+            "choked me", "choked her", "sexually abused", "molested", "raped", "touched me inappropriately",
+            "touched her inappropriately", "touched him inappropriately", "locks me in"
+        ],
+        "concern": ["abuse", "abused", "abusive", "neglect", "neglected", "domestic violence", "afraid to go home", "bruises"]
+    },
+    "psychosis": {
+        "explicit": ["voices tell me to", "voices telling me to", "voices tell him to", "voices tell her to", "command hallucinations"],
+        "concern": [
+            "hearing voices", "hear voices", "hears voices", "hallucination", "hallucinations", "hallucinating",
+            "seeing things", "being followed", "watching me", "paranoid", "delusion", "delusions",
+            "haven't slept in days"
+        ]
+    },
+    # Columbia (C-SSRS) screening items, as the clinician asks them
+    "cssrs": {
+        "concern": [
+            "wished you were dead", "wish you were dead", "wish you could go to sleep and not wake up",
+            "thoughts of killing yourself", "thought about killing yourself", "thinking about how you might do this",
+            "thought about how you might do this", "intention of acting on these thoughts",
+            "started to work out the details", "done anything to end your life",
+            "prepared to do anything to end your life"
+        ]
+    }
+}
+
+
+def _expand(phrase: str) -> List[str]:
+    """Every form of a lexicon phrase with its pronoun slots filled in."""
+    for slot, forms in PRONOUN_FORMS.items():
+        if slot in phrase:
+            return [expanded for form in forms for expanded in _expand(phrase.replace(slot, form, 1))]
+    return [phrase]
+
+
+NEGATORS = {"denies", "denied", "deny", "denying"}
+DENIALS = {"no", "nope", "never", "nah", "not", "denies", "denied"}
+
+_WORD = re.compile(r"[\w'-]+")
+_CLAUSE_BREAKS = ".!?;,\n"
+
+
+@dataclass
+class ScreenHit:
+    category: str
+    tier: str          # explicit | concern
+    phrase: str
+    offset: int
+    negated: bool = False
+    asked: bool = False
+
+
+@dataclass
+class ScreenResult:
+    verdict: str       # explicit | uncertain | clear
+    hits: List[ScreenHit] = field(default_factory=list)
+    elapsed_ms: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "verdict": self.verdict,
+            "hits": [hit.__dict__ for hit in self.hits],
+            "elapsed_ms": self.elapsed_ms
+        }
+
+
+class PhraseMatcher:
+    """Aho-Corasick automaton whose alphabet is words: matches whole-word phrases in one pass."""
+
+    def __init__(self, phrases: Dict[str, Any]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, str, Any]]] = [[]] # (length in words, phrase, payload) ending here
+        for phrase, payload in phrases.items():
+            self._add(phrase, payload)
+        self._link()
+
+    def _add(self, phrase: str, payload: Any):
+        words = _WORD.findall(phrase)
+        state = 0
+        for word in words:
+            nxt = self._goto[state].get(word)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][word] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((len(words), phrase, payload))
+
+    def _link(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for word, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and word not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(word, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, words: List[str]) -> List[Tuple[int, int, str, Any]]:
+        """(first word index, last word index, phrase, payload) for every occurrence."""
+        goto, fail, out = self._goto, self._fail, self._out
+        matches = []
+        state = 0
+        for i, word in enumerate(words):
+            while state and word not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(word, 0)
+            if out[state]:
+                for length, phrase, payload in out[state]:
+                    matches.append((i - length + 1, i, phrase, payload))
+        return matches
+
+
+class SafetyScreen:
+    def __init__(self, lexicons: Dict[str, Dict[str, List[str]]] = LEXICONS, negation_window: int = 5):
+        self.negation_window = negation_window
+        phrases: Dict[str, Tuple[str, str]] = {}
+        for category, tiers in lexicons.items():
+            for tier, terms in tiers.items():
+                for term in terms:
+                    for phrase in _expand(term.lower()):
+                        phrases.setdefault(phrase, (category, tier))
+        self.matcher = PhraseMatcher(phrases)
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        # Same length as the input, so offsets stay valid
+        return text.lower().replace("’", "'").replace("‘", "'")
+
+    def _negated(self, text: str, start: int) -> bool:
+        clause_start = max(text.rfind(ch, 0, start) for ch in _CLAUSE_BREAKS) + 1
+        clause = text[clause_start:start]
+        but = clause.rfind(" but ")
+        if but >= 0:
+            clause = clause[but + 5:]
+        words = _WORD.findall(clause)[-self.negation_window:]
+        return any(w in NEGATORS for w in words) or (bool(words) and words[-1] == "no") or "negative for" in clause
+
+    @staticmethod
+    def _question_denied(text: str, end: int) -> Optional[bool]:
+        """None if the phrase isn't in a question; else whether the reply is a denial."""
+        stops = [i for i in (text.find(ch, end) for ch in ".!?\n") if i >= 0]
+        if not stops or text[min(stops)] != "?":
+            return None
+        reply = text[min(stops) + 1:min(stops) + 120].strip()
+        if ":" in reply[:25]: # "Patient: No, never."
+            reply = reply.split(":", 1)[1]
+        words = _WORD.findall(reply)
+        return bool(words) and words[0] in DENIALS
+
+    def screen(self, transcript: str) -> ScreenResult:
+        started = time.perf_counter()
+        text = self._normalize(transcript or "")
+        found = self.matcher.find(_WORD.findall(text))
+        spans = [m.span() for m in _WORD.finditer(text)] if found else []
+        hits: List[ScreenHit] = []
+        for first, last, phrase, (category, tier) in found:
+            start, end = spans[first][0], spans[last][1]
+            hit = ScreenHit(category=category, tier=tier, phrase=phrase, offset=start)
+            denied = self._question_denied(text, end)
+            if denied is not None:
+                hit.asked, hit.tier, hit.negated = True, "concern", denied
+            else:
+                hit.negated = self._negated(text, start)
+            hits.append(hit)
+
+        if any(h.tier == "explicit" and not h.negated for h in hits):
+            verdict = "explicit"
+        elif not hits or any(not h.negated or h.tier == "explicit" for h in hits):
+            verdict = "uncertain"
+        else:
+            verdict = "clear"
+        return ScreenResult(verdict=verdict, hits=hits, elapsed_ms=round((time.perf_counter() - started) * 1000, 3))
+
+
+def build_safety_screen() -> Optional[SafetyScreen]:
+    """
+    Build the pre-screen from env:
+        SAFETY_PRESCREEN                  on (default) | off (always wait for the LLM triage)
+        SAFETY_PRESCREEN_NEGATION_WINDOW  words before a phrase searched for a negator (default 5)
+    """
+    if os.environ.get("SAFETY_PRESCREEN", "on").lower() in ("0", "off", "false"):
+        return None
+    return SafetyScreen(negation_window=int(os.environ.get("SAFETY_PRESCREEN_NEGATION_WINDOW", "5")))
+
+
+# Singleton instance
+safety_screen = build_safety_screen()
@@ -0,0 +1,28 @@
+"""
+Per-task session attribution.
+
+The orchestrator sets `current_session_id` at the start of every agent run. asyncio
+tasks copy the context when they are created, so anything awaited underneath an agent
+(LLM calls, caches, governors) can attribute work to a session without threading the
+id through every signature.
+
+`current_usage` is the session's usage dict (session state "usage"); agents add their
+LLM call and token counts to it.
+
+`current_agent_id` is the agent making the LLM call (set by the agent just before it),
+for backends that answer per agent, such as the replay backend.
+
+`current_timer` is the StageTimer of the agent run in progress; the LLM call and the
+output parser add their details (wait, tokens, parse strategy) to it.
+"""
+
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+if TYPE_CHECKING:
+    from app.core.stage_timing import StageTimer
+
+current_session_id: ContextVar[Optional[str]] = ContextVar("current_session_id", default=None)
+current_usage: ContextVar[Optional[Dict[str, Any]]] = ContextVar("current_usage", default=None)
+current_agent_id: ContextVar[Optional[str]] = ContextVar("current_agent_id", default=None)
+current_timer: ContextVar[Optional["StageTimer"]] = ContextVar("current_timer", default=None)
@@ -0,0 +1,329 @@
+"""
+Session Store - where the orchestrator keeps per-session state
+({"input_data", "context", "status"}).
+
+Backends:
+    MemorySessionStore  - in-process LRU; idle sessions are evicted after a TTL or when
+                          over capacity. Sessions with status "running" are never evicted.
+    SQLiteSessionStore  - on-disk JSON snapshots shared across restarts and workers
+    TieredSessionStore  - memory in front of SQLite (default): evicted sessions spill to
+                          disk, and a miss (e.g. a clarification arriving after a restart,
+                          or at another worker) reloads the last snapshot.
+
+The memory tier hands out the live state dict, so agents mutate it in place; call
+`save()` at pause/finish points to persist a snapshot.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import asyncio
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# Called with (session_id, state) when a session leaves memory
+EvictionHook = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+
+def _encode(state: Dict[str, Any]) -> str:
+    return json.dumps(state, default=str)
+
+
+def process_rss_bytes() -> Optional[int]:
+    """Current resident set size (Linux /proc; None elsewhere)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class SessionStore(ABC):
+    def __init__(self):
+        self.evictions = 0
+        self._eviction_hooks: List[EvictionHook] = []
+
+    def on_evict(self, hook: EvictionHook) -> None:
+        """Register cleanup for sessions leaving memory (log writers, socket buffers...)."""
+        self._eviction_hooks.append(hook)
+
+    async def _evicted(self, session_id: str, state: Dict[str, Any]) -> None:
+        self.evictions += 1
+        for hook in self._eviction_hooks:
+            try:
+                await hook(session_id, state)
+            except Exception as e:
+                print(f"Error in session eviction hook for {session_id}: {e}")
+
+    @abstractmethod
+    async def get(self, session_id: str, refresh: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        `refresh` re-reads a session that isn't running here from shared storage, in case
+        another worker has moved it on since (multi-worker deployments).
+        """
+        pass
+
+    @abstractmethod
+    async def put(self, session_id: str, state: Dict[str, Any]) -> None:
+        """Register a session (memory tiers keep this exact object)."""
+        pass
+
+    async def save(self, session_id: str, state: Dict[str, Any]) -> None:
+        """Persist a snapshot of the session's current state (no-op for memory-only)."""
+        pass
+
+    async def delete(self, session_id: str) -> None:
+        pass
+
+    async def sweep(self) -> None:
+        """Evict idle / expired sessions."""
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": type(self).__name__, "evictions": self.evictions}
+
+    def status_counts(self) -> Dict[str, int]:
+        """Sessions in memory by status (cheap enough for every metrics scrape)."""
+        return {}
+
+
+class MemorySessionStore(SessionStore):
+    def __init__(self, max_sessions: int = 200, ttl: Optional[float] = 1800):
+        super().__init__()
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict() # id -> (state, last_access)
+
+    def _lookup(self, session_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return None
+        self._entries[session_id] = (entry[0], time.monotonic())
+        self._entries.move_to_end(session_id)
+        return entry[0]
+
+    def _store(self, session_id: str, state: Dict[str, Any]) -> None:
+        self._entries[session_id] = (state, time.monotonic())
+        self._entries.move_to_end(session_id)
+
+    def _collect_evictable(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """Pop idle sessions past the TTL, then the least recently used beyond capacity."""
+        now = time.monotonic()
+        evicted = []
+        over = len(self._entries) - self.max_sessions
+        # Oldest first; running sessions are pinned
+        for session_id, (state, last_access) in list(self._entries.items()):
+            expired = self.ttl and now - last_access > self.ttl
+            if not expired and over <= 0:
+                break
+            if state.get("status") == "running":
+                continue
+            del self._entries[session_id]
+            evicted.append((session_id, state))
+            over -= 1
+        return evicted
+
+    async def get(self, session_id: str, refresh: bool = False) -> Optional[Dict[str, Any]]:
+        state = self._lookup(session_id)
+        await self.sweep()
+        return state
+
+    async def put(self, session_id: str, state: Dict[str, Any]) -> None:
+        self._store(session_id, state)
+        await self.sweep()
+
+    async def delete(self, session_id: str) -> None:
+        self._entries.pop(session_id, None)
+
+    async def sweep(self) -> None:
+        for session_id, state in self._collect_evictable():
+            await self._evicted(session_id, state)
+
+    def status_counts(self) -> Dict[str, int]:
+        by_status: Dict[str, int] = {}
+        for state, _ in self._entries.values():
+            status = state.get("status", "unknown")
+            by_status[status] = by_status.get(status, 0) + 1
+        return by_status
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **super().stats(),
+            "sessions": len(self._entries),
+            "by_status": self.status_counts(),
+            "approx_state_bytes": sum(len(_encode(state)) for state, _ in self._entries.values())
+        }
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    On-disk snapshots. Like the LLM cache, every call opens its own short-lived
+    connection in a worker thread, so the file is safe to share between workers.
+    """
+
+    def __init__(self, path: str, retention: Optional[float] = 7 * 86400):
+        super().__init__()
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.retention = retention
+        self._writes_since_sweep = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " session_id TEXT PRIMARY KEY, status TEXT NOT NULL,"
+                " state TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions (updated_at)")
+
+    @contextmanager
+    def _connect(self):
+        """Short-lived connection; commits on success and always closes."""
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _get_sync(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT state FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _save_sync(self, session_id: str, status: str, payload: str, sweep: bool) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, status, state, updated_at) VALUES (?, ?, ?, ?)",
+                (session_id, status, payload, now)
+            )
+            if sweep and self.retention:
+                conn.execute("DELETE FROM sessions WHERE updated_at < ?", (now - self.retention,))
+
+    def _delete_sync(self, session_id: str) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def _stats_sync(self) -> Dict[str, int]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM sessions GROUP BY status").fetchall()
+        return dict(rows)
+
+    async def get(self, session_id: str, refresh: bool = False) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._get_sync, session_id)
+
+    async def put(self, session_id: str, state: Dict[str, Any]) -> None:
+        await self.save(session_id, state)
+
+    async def save(self, session_id: str, state: Dict[str, Any]) -> None:
+        # Encode on the loop so the snapshot is consistent; amortize retention sweeps
+        payload = _encode(state)
+        self._writes_since_sweep += 1
+        sweep = self._writes_since_sweep >= 64
+        if sweep:
+            self._writes_since_sweep = 0
+        await asyncio.to_thread(self._save_sync, session_id, state.get("status", "unknown"), payload, sweep)
+
+    async def delete(self, session_id: str) -> None:
+        await asyncio.to_thread(self._delete_sync, session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            by_status = self._stats_sync()
+        except sqlite3.Error:
+            by_status = {}
+        return {
+            **super().stats(),
+            "sessions": sum(by_status.values()),
+            "by_status": by_status,
+            "file_bytes": self.path.stat().st_size if self.path.exists() else 0
+        }
+
+
+class TieredSessionStore(SessionStore):
+    """Memory LRU in front of SQLite; evicted sessions spill to disk and reload on demand."""
+
+    def __init__(self, memory: MemorySessionStore, disk: SQLiteSessionStore):
+        super().__init__()
+        self.memory = memory
+        self.disk = disk
+        self.reloads = 0
+
+    async def get(self, session_id: str, refresh: bool = False) -> Optional[Dict[str, Any]]:
+        state = self.memory._lookup(session_id)
+        # A running session's live copy is authoritative; anything else may be stale
+        if state is None or (refresh and state.get("status") != "running"):
+            stored = await self.disk.get(session_id)
+            if stored is not None:
+                self.reloads += 1
+                state = stored
+                self.memory._store(session_id, state)
+        await self.sweep()
+        return state
+
+    async def put(self, session_id: str, state: Dict[str, Any]) -> None:
+        self.memory._store(session_id, state)
+        await self.sweep()
+
+    async def save(self, session_id: str, state: Dict[str, Any]) -> None:
+        await self.disk.save(session_id, state)
+
+    async def delete(self, session_id: str) -> None:
+        await self.memory.delete(session_id)
+        await self.disk.delete(session_id)
+
+    async def sweep(self) -> None:
+        for session_id, state in self.memory._collect_evictable():
+            await self.disk.save(session_id, state) # Spill before dropping the live copy
+            await self._evicted(session_id, state)
+
+    def status_counts(self) -> Dict[str, int]:
+        return self.memory.status_counts()
+
+    async def close(self) -> None:
+        """Spill everything still in memory (shutdown)."""
+        for session_id, (state, _) in list(self.memory._entries.items()):
+            await self.disk.save(session_id, state)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **super().stats(),
+            "reloads": self.reloads,
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats()
+        }
+
+
+def build_session_store() -> SessionStore:
+    """
+    Build the store from env:
+        SESSION_STORE           tiered (default) | memory
+        SESSION_STORE_PATH      SQLite file (default backend/cache/sessions.sqlite3)
+        SESSION_IDLE_TTL_S      idle time before a session leaves memory (default 1800, 0 = never)
+        SESSION_MAX_IN_MEMORY   sessions kept in memory (default 200)
+        SESSION_RETENTION_S     how long snapshots stay on disk (default 7 days, 0 = forever)
+    """
+    mode = os.environ.get("SESSION_STORE", "tiered").lower()
+    ttl = float(os.environ.get("SESSION_IDLE_TTL_S", "1800")) or None
+    max_sessions = int(os.environ.get("SESSION_MAX_IN_MEMORY", "200"))
+    retention = float(os.environ.get("SESSION_RETENTION_S", str(7 * 86400))) or None
+    default_path = Path(__file__).parent.parent.parent / "cache" / "sessions.sqlite3"
+    path = os.environ.get("SESSION_STORE_PATH", str(default_path))
+
+    # Always keep a memory tier: running sessions must stay the same live object
+    memory = MemorySessionStore(max_sessions=max_sessions, ttl=ttl)
+    if mode == "memory":
+        return memory
+    return TieredSessionStore(memory, SQLiteSessionStore(path, retention=retention))
+
+
+# Singleton instance
+session_store = build_session_store()
@@ -1,26 +1,295 @@
-from typing import List, Dict, Any
-from fastapi import WebSocket
+"""
+WebSocket fan-out with per-session channels.
+
+Every message carries a `session_id` and is delivered only to sockets subscribed to
+that session (messages without a session go to everyone). Each message is JSON-encoded
+once and placed on every subscriber's bounded send queue; a per-connection sender
+task drains it, so a slow browser tab only delays itself.
+
+Queue policy:
+    agent_update  - coalesced per (session, agent): a queued status not yet sent is
+                    replaced by the newer one. First to be dropped when the queue fills.
+    anything else - never dropped. When the queue is full the publishing session waits
+                    (up to the send timeout) for room; a connection that still can't keep
+                    up is closed and recovers on reconnect from the channel's replay buffer.
+
+With a distributed event bus attached, broadcasts go through the bus (UI_MESSAGE) and
+every worker delivers them to its own sockets, so a browser may be connected to any
+worker regardless of which one runs its session.
+"""
+
+import os
 import json
+import asyncio
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Set
+from fastapi import WebSocket
+from app.core.session_context import current_session_id
+from app.core.event_bus import BaseEventBus, Event
+
+# Message types that only carry the latest state and may be coalesced / dropped
+COALESCED_TYPES = {"agent_update"}
+
+UI_MESSAGE_TOPIC = "UI_MESSAGE"
+
+
+class _QueuedMessage:
+    __slots__ = ("text", "coalesce_key")
+
+    def __init__(self, text: str, coalesce_key: Optional[tuple]):
+        self.text = text
+        self.coalesce_key = coalesce_key
+
+
+class ClientConnection:
+    """One socket: its subscriptions, bounded send queue and sender task."""
+
+    def __init__(self, websocket: WebSocket, manager: "ConnectionManager"):
+        self.websocket = websocket
+        self.manager = manager
+        self.sessions: Set[str] = set()
+        self.queue: Deque[_QueuedMessage] = deque()
+        self.pending: Dict[tuple, _QueuedMessage] = {} # coalesce_key -> queued message
+        self.ready = asyncio.Event()
+        self.space = asyncio.Event() # Set whenever the sender frees a slot
+        self._put_lock = asyncio.Lock() # Keeps blocked producers in order
+        self.closed = False
+        self.dropped = 0
+        self.sender = asyncio.create_task(self._send_loop())
+
+    def offer(self, text: str, coalesce_key: Optional[tuple] = None) -> bool:
+        """Queue without waiting. Returns False if the queue is full (or producers are already waiting)."""
+        if self.closed:
+            return True
+        if coalesce_key is not None and coalesce_key in self.pending:
+            self.pending[coalesce_key].text = text # Newer status supersedes the unsent one
+            return True
+        if self._put_lock.locked():
+            return False
+        if len(self.queue) >= self.manager.max_queue and not self._drop_coalescable():
+            return False
+        self._append(text, coalesce_key)
+        return True
+
+    async def put(self, text: str, coalesce_key: Optional[tuple], timeout: float) -> None:
+        """Wait (bounded) for room in the queue; drop the client if it never frees up."""
+        deadline = asyncio.get_running_loop().time() + timeout
+        async with self._put_lock:
+            while not self.closed and len(self.queue) >= self.manager.max_queue and not self._drop_coalescable():
+                self.space.clear()
+                remaining = deadline - asyncio.get_running_loop().time()
+                try:
+                    await asyncio.wait_for(self.space.wait(), max(0.0, remaining))
+                except asyncio.TimeoutError:
+                    if not self.closed:
+                        print(f"WARNING: WebSocket client too slow ({len(self.queue)} queued). Disconnecting.")
+                        self.manager.disconnect(self.websocket)
+                    return
+            if not self.closed:
+                self._append(text, coalesce_key)
+
+    def _append(self, text: str, coalesce_key: Optional[tuple]) -> None:
+        message = _QueuedMessage(text, coalesce_key)
+        self.queue.append(message)
+        if coalesce_key is not None:
+            self.pending[coalesce_key] = message
+        self.ready.set()
+
+    def _drop_coalescable(self) -> bool:
+        """Make room by dropping the oldest queued status update."""
+        for message in self.queue:
+            if message.coalesce_key is not None:
+                self.queue.remove(message)
+                del self.pending[message.coalesce_key]
+                self.dropped += 1
+                return True
+        return False
+
+    async def _send_loop(self) -> None:
+        try:
+            while True:
+                await self.ready.wait()
+                while self.queue:
+                    message = self.queue.popleft()
+                    if message.coalesce_key is not None:
+                        del self.pending[message.coalesce_key]
+                    self.space.set()
+                    await self._send(message.text)
+                self.ready.clear()
+        except Exception as e:
+            print(f"Error sending to client: {e}")
+            self.manager.disconnect(self.websocket)
+
+    async def _send(self, text: str) -> None:
+        # asyncio.wait rather than wait_for: wait_for can swallow a cancellation that
+        # races with the send completing, which would leave this task unkillable
+        send = asyncio.ensure_future(self.websocket.send_text(text))
+        try:
+            done, _ = await asyncio.wait({send}, timeout=self.manager.send_timeout)
+        finally:
+            if not send.done():
+                send.cancel()
+        if not done:
+            raise asyncio.TimeoutError(f"send exceeded {self.manager.send_timeout}s")
+        send.result()
+
+    def close(self) -> None:
+        self.closed = True
+        self.queue.clear()
+        self.pending.clear()
+        self.space.set() # Release blocked producers
+        if not self.sender.done():
+            self.sender.cancel()
+        asyncio.create_task(self._close_socket())
+
+    async def _close_socket(self) -> None:
+        try:
+            await self.websocket.close()
+        except Exception:
+            pass # Already gone
+
 
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+    def __init__(self, max_queue: int = 256, send_timeout: float = 10.0, replay_size: int = 200, max_channels: int = 256):
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.replay_size = replay_size
+        self.max_channels = max_channels
+        self.connections: Dict[WebSocket, ClientConnection] = {}
+        self.channels: Dict[str, Set[ClientConnection]] = {}
+        # Recent messages per session, replayed on subscribe (covers the gap between
+        # POST /api/analyze returning and the client subscribing, and reconnects)
+        self._replay: "OrderedDict[str, Deque[str]]" = OrderedDict()
+        self._bus: Optional[BaseEventBus] = None
+
+    def attach_bus(self, bus: BaseEventBus):
+        """Relay broadcasts through a cross-process bus (no-op for the in-process one)."""
+        if not bus.distributed or self._bus is bus:
+            return
+        self._bus = bus
+        bus.subscribe_broadcast(UI_MESSAGE_TOPIC, self._on_bus_message)
+
+    @property
+    def active_connections(self) -> List[WebSocket]:
+        return list(self.connections)
 
-    async def connect(self, websocket: WebSocket):
+    async def connect(self, websocket: WebSocket, session_id: Optional[str] = None):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        self.connections[websocket] = ClientConnection(websocket, self)
+        if session_id:
+            self.subscribe(websocket, session_id)
 
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-
-    async def broadcast(self, message: Dict[str, Any]):
-        """Broadcast JSON message to all connected clients."""
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                print(f"Error broadcasting to client: {e}")
-                # Potentially remove dead connection
-                pass
-
-manager = ConnectionManager()
+        connection = self.connections.pop(websocket, None)
+        if connection is None:
+            return
+        for session_id in connection.sessions:
+            subscribers = self.channels.get(session_id)
+            if subscribers is not None:
+                subscribers.discard(connection)
+                if not subscribers:
+                    del self.channels[session_id]
+        connection.close()
+
+    def subscribe(self, websocket: WebSocket, session_id: str):
+        connection = self.connections.get(websocket)
+        if connection is None or session_id in connection.sessions:
+            return
+        connection.sessions.add(session_id)
+        self.channels.setdefault(session_id, set()).add(connection)
+        for text in list(self._replay.get(session_id, ()))[-self.max_queue:]:
+            connection.offer(text)
+
+    def unsubscribe(self, websocket: WebSocket, session_id: str):
+        connection = self.connections.get(websocket)
+        if connection is None:
+            return
+        connection.sessions.discard(session_id)
+        subscribers = self.channels.get(session_id)
+        if subscribers is not None:
+            subscribers.discard(connection)
+            if not subscribers:
+                del self.channels[session_id]
+
+    def close_channel(self, session_id: str):
+        """Forget a finished session's replay buffer."""
+        self._replay.pop(session_id, None)
+
+    async def broadcast(self, message: Dict[str, Any], session_id: Optional[str] = None):
+        """
+        Publish a message to its session's subscribers. The session is taken from the
+        argument, the message, or the session the calling task is working for.
+        """
+        session_id = session_id or message.get("session_id") or current_session_id.get()
+        if session_id:
+            message["session_id"] = session_id
+        text = json.dumps(message, default=str) # Encoded once for every subscriber
+
+        if self._bus is not None:
+            await self._bus.publish(Event(
+                topic=UI_MESSAGE_TOPIC,
+                sender_id="socket_manager",
+                data={"session_id": session_id, "type": message.get("type"), "agent_id": message.get("agent_id"), "text": text}
+            ))
+            return
+        await self._deliver(session_id, text, self._coalesce_key(session_id, message))
+
+    async def _on_bus_message(self, event: Event):
+        data = event.data
+        await self._deliver(data.get("session_id"), data["text"], self._coalesce_key(data.get("session_id"), data))
+
+    @staticmethod
+    def _coalesce_key(session_id: Optional[str], message: Dict[str, Any]) -> Optional[tuple]:
+        if message.get("type") in COALESCED_TYPES:
+            return (session_id, message.get("type"), message.get("agent_id"))
+        return None
+
+    async def _deliver(self, session_id: Optional[str], text: str, coalesce_key: Optional[tuple]):
+        """Queue an encoded message for this process's subscribers."""
+        if session_id is None:
+            targets = list(self.connections.values())
+        else:
+            self._remember(session_id, text, coalesce_key)
+            targets = list(self.channels.get(session_id, ()))
+        # Fast path never awaits; only subscribers with a full queue apply backpressure
+        blocked = [c for c in targets if not c.offer(text, coalesce_key)]
+        if blocked:
+            await asyncio.gather(*[c.put(text, coalesce_key, self.send_timeout) for c in blocked])
+
+    def _remember(self, session_id: str, text: str, coalesce_key: Optional[tuple]):
+        if not self.replay_size or coalesce_key is not None:
+            return # Status updates are not replayed; the next one restores the state
+        buffer = self._replay.get(session_id)
+        if buffer is None:
+            buffer = self._replay[session_id] = deque(maxlen=self.replay_size)
+            while len(self._replay) > self.max_channels:
+                self._replay.popitem(last=False)
+        else:
+            self._replay.move_to_end(session_id)
+        buffer.append(text)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connections": len(self.connections),
+            "channels": len(self.channels),
+            "queued": sum(len(c.queue) for c in self.connections.values()),
+            "dropped": sum(c.dropped for c in self.connections.values()),
+            "replay_sessions": len(self._replay)
+        }
+
+
+def build_connection_manager() -> ConnectionManager:
+    """
+    Build the manager from env:
+        WS_SEND_QUEUE       per-connection queued messages before dropping / disconnecting (default 256)
+        WS_SEND_TIMEOUT_S   a single send slower than this drops the client (default 10)
+        WS_REPLAY_SIZE      recent messages per session replayed on subscribe (default 200, 0 = off)
+    """
+    return ConnectionManager(
+        max_queue=int(os.environ.get("WS_SEND_QUEUE", "256")),
+        send_timeout=float(os.environ.get("WS_SEND_TIMEOUT_S", "10")),
+        replay_size=int(os.environ.get("WS_REPLAY_SIZE", "200"))
+    )
+
+
+manager = build_connection_manager()
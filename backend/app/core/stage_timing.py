@@ -0,0 +1,36 @@
+"""
+Stage Timing - where an agent run spends its time.
+
+BaseAgent.execute marks each stage as it finishes (context, prompt, llm, parse...) on a
+monotonic clock; code underneath it (call_llm, parse_output) adds details through
+`current_timer`. The result is attached to AgentOutput.timings and logged with the
+agent's completion, so a slow run can be traced to prompt size, the model, or JSON repair.
+"""
+
+import time
+from typing import Any, Dict
+
+
+class StageTimer:
+    def __init__(self):
+        self.started = self._last = time.perf_counter()
+        self.stages: Dict[str, float] = {} # stage -> ms
+        self.details: Dict[str, Any] = {}
+
+    def mark(self, stage: str) -> float:
+        """End `stage` now (it began when the previous one ended). Returns its ms."""
+        now = time.perf_counter()
+        elapsed = (now - self._last) * 1000
+        self.stages[stage] = self.stages.get(stage, 0.0) + elapsed
+        self._last = now
+        return elapsed
+
+    def note(self, **details: Any) -> None:
+        self.details.update(details)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 2),
+            "stages_ms": {stage: round(ms, 2) for stage, ms in self.stages.items()},
+            **self.details
+        }
@@ -0,0 +1,73 @@
+"""
+Structured Output - agent output models as LLM response schemas.
+
+An agent that declares an `output_model` (a Pydantic model from app.models.schemas)
+sends the model's schema with every call, so the provider constrains decoding to JSON of
+that shape, and validates the reply with `model_validate_json` in one pass instead of
+trying the free-text parse strategies.
+
+Gemini takes an OpenAPI subset: no $ref, no anyOf (Optional becomes `nullable`), no
+titles or defaults, and every object needs its properties spelled out. `response_schema`
+converts once per agent at startup and rejects models it can't express.
+"""
+
+from typing import Any, Dict, Optional, Type
+
+from pydantic import BaseModel, ValidationError
+
+
+def _convert(node: Dict[str, Any], defs: Dict[str, Any], path: str) -> Dict[str, Any]:
+    if "$ref" in node:
+        return _convert(defs[node["$ref"].split("/")[-1]], defs, path)
+    if "anyOf" in node:
+        options = [option for option in node["anyOf"] if option.get("type") != "null"]
+        if len(options) != 1:
+            raise ValueError(f"{path}: unions other than Optional can't be expressed as a response schema")
+        schema = _convert(options[0], defs, path)
+        if len(options) < len(node["anyOf"]):
+            schema["nullable"] = True
+        if node.get("description"):
+            schema["description"] = node["description"]
+        return schema
+
+    kind = node.get("type")
+    if kind is None and "const" in node:
+        kind = "string"
+    schema: Dict[str, Any] = {"type": kind}
+    if node.get("description"):
+        schema["description"] = node["description"]
+    if kind == "object":
+        properties = node.get("properties")
+        if not properties:
+            raise ValueError(f"{path}: free-form objects can't be expressed as a response schema")
+        schema["properties"] = {name: _convert(value, defs, f"{path}.{name}") for name, value in properties.items()}
+        if node.get("required"):
+            schema["required"] = list(node["required"])
+    elif kind == "array":
+        if "items" not in node:
+            raise ValueError(f"{path}: arrays need an item type")
+        schema["items"] = _convert(node["items"], defs, f"{path}[]")
+    elif kind == "string":
+        enum = node.get("enum") or ([node["const"]] if "const" in node else None)
+        if enum:
+            schema["enum"] = list(enum)
+    elif kind not in ("integer", "number", "boolean"):
+        raise ValueError(f"{path}: type {kind!r} can't be expressed as a response schema")
+    return schema
+
+
+def response_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    """The response schema (OpenAPI subset) for `model`, as the provider expects it."""
+    schema = model.model_json_schema(by_alias=True)
+    return _convert(schema, schema.get("$defs", {}), model.__name__)
+
+
+def validate_json(model: Type[BaseModel], text: str) -> Optional[Dict[str, Any]]:
+    """
+    `text` validated against `model`, as a dict of the fields the model returned (types
+    coerced, nothing filled in), or None when it doesn't validate.
+    """
+    try:
+        return model.model_validate_json(text).model_dump(by_alias=True, exclude_unset=True)
+    except ValidationError:
+        return None
@@ -0,0 +1,317 @@
+"""
+CPT Time Coding - rule-based procedure codes for follow-up visits whose time is documented.
+
+The whole transcript is scanned once for:
+    durations    "45 minutes", "an hour", "forty-five minute session", and start/end clock
+                 times ("started at 2:05", "end time 2:58"); each is tied to the service it
+                 describes: psychotherapy, E/M (medication management) or the whole visit.
+                 Durations with no visit/service label ("takes 30 minutes to fall asleep"),
+                 or about other time ("10 minutes left", "last session was...") are ignored.
+    visit cues   follow-up vs initial evaluation, crisis, family/group, telehealth
+    services     psychotherapy and/or medication management
+
+Codes come from the CPT time thresholds:
+    psychotherapy only        90832 (16-37 min) | 90834 (38-52) | 90837 (53+)
+    E/M only (established)    99212 (10+) | 99213 (20+) | 99214 (30+) | 99215 (40+), 99417 per 15 min from 55
+    E/M + psychotherapy       E/M by its own time + 90833 | 90836 | 90838 by psychotherapy time
+
+Anything else is ambiguous and left to the LLM with the reason: initial evaluations
+(90791/90792 depend on the provider), crisis, family/group and telehealth visits, combined
+visits without separate times, conflicting or missing durations.
+"""
+
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.code_index import cpt_index
+
+_UNITS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9,
+    "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13, "fourteen": 14, "fifteen": 15, "sixteen": 16,
+    "seventeen": 17, "eighteen": 18, "nineteen": 19
+}
+_TENS = {"twenty": 20, "thirty": 30, "forty": 40, "fifty": 50, "sixty": 60, "seventy": 70, "eighty": 80, "ninety": 90}
+_NUMBER = (
+    r"\d{1,3}(?:\.\d+)?|(?:" + "|".join(_TENS) + r")(?:[\s-](?:" + "|".join(list(_UNITS)[:9]) + r"))?|"
+    + "|".join(sorted(_UNITS, key=len, reverse=True))
+)
+
+_DURATION = re.compile(
+    rf"\b(?:(?P<h>{_NUMBER})\s*(?:hours?|hrs?)\s*(?:and\s*)?(?P<hm>{_NUMBER})\s*(?:minutes?|mins?)"
+    rf"|(?P<hh>an|one)\s+hour\s+and\s+a\s+half"
+    rf"|(?P<half>half\s+an?)\s+hour"
+    rf"|(?P<an>an|one)\s+hour"
+    rf"|(?P<n>{_NUMBER})[\s-]*(?P<unit>minutes?|mins?|min|hours?|hrs?|hr))\b"
+)
+_TIME_UNIT = re.compile(r"min|hour|hr")
+_CLOCK = re.compile(r"(?<!\d)(?P<h>[01]?\d|2[0-3]):(?P<m>[0-5]\d)\s*(?P<ampm>[ap]\.?\s?m\.?)?")
+_CLAUSE = re.compile(r"[^.!?;\n]+(?:\.\d[^.!?;\n]*)*")
+
+# Service labels attach to the nearest duration in the clause; visit labels to any unlabelled one
+SERVICE_LABELS = {
+    "psychotherapy": ["psychotherapy", "therapy time", "therapy portion", "of therapy", "counseling", "counselling", "cbt"],
+    "em": ["medication management", "med management", "med check", "e/m", "evaluation and management", "medication review"]
+}
+VISIT_LABELS = [
+    "session", "visit", "appointment", "encounter", "total time", "time spent", "face-to-face",
+    "face to face", "been talking", "we talked", "we spent", "met for"
+]
+# A duration about something other than this visit's length
+OTHER_TIME = [
+    "left", "remaining", "more minutes", "next", "last", "previous", "ago", "late", "early", "wait", "waited",
+    "every", "per day", "a day", "each", "sleep", "asleep", "slept", "walk", "walked", "walking", "lasting",
+    "lasts", "take", "takes", "took", "break", "commute", "drive", "driving", "exercise", "attack", "attacks"
+]
+START_WORDS = ("start", "began", "begin", "started", "beginning", "from")
+END_WORDS = ("end", "ended", "finish", "finished", "stop", "stopped", "until", "to", "concluded")
+
+CUES = {
+    "follow_up": [
+        "follow-up", "follow up", "followup", "last session", "last visit", "last appointment", "since we last",
+        "last time we", "established patient", "return visit", "since i last saw you", "since our last"
+    ],
+    "initial": [
+        "initial evaluation", "initial assessment", "intake", "first appointment", "first visit", "first session",
+        "new patient", "diagnostic evaluation", "nice to meet you"
+    ],
+    "crisis": ["crisis"],
+    "family_group": ["family session", "family therapy", "group therapy", "group session", "couples"],
+    "telehealth": ["telehealth", "telemedicine", "video visit", "video call", "zoom", "virtual visit", "phone session", "by phone", "over the phone"],
+    "psychotherapy": [
+        "psychotherapy", "cbt", "cognitive behavioral", "cognitive behavioural", "dbt", "thought record",
+        "homework", "coping skill", "behavioral activation", "behavioural activation", "mindfulness", "therapy session",
+        "cognitive distortion", "reframe", "reframing"
+    ],
+    "medication": [
+        "medication management", "med management", "med check", "refill", "prescri", "titrat", "increase the dose",
+        "decrease the dose", "lower the dose", "raise the dose", "side effect", "milligram"
+    ]
+}
+
+PSYCHOTHERAPY_CODES = [(53, "90837"), (38, "90834"), (16, "90832")]
+PSYCHOTHERAPY_ADDONS = [(53, "90838"), (38, "90836"), (16, "90833")]
+EM_ESTABLISHED = [(40, "99215"), (30, "99214"), (20, "99213"), (10, "99212")]
+PROLONGED_FROM, PROLONGED_BASE, PROLONGED_STEP = 55, 40, 15 # 99417 after 99215
+
+
+@dataclass
+class TimeMention:
+    minutes: int
+    service: str       # psychotherapy | em | visit
+    text: str
+
+
+@dataclass
+class TimeCoding:
+    output: Optional[Dict[str, Any]] = None   # Procedure output when the rules decide
+    reason: str = ""                          # Why the LLM is needed otherwise
+    mentions: List[TimeMention] = field(default_factory=list)
+    cues: List[str] = field(default_factory=list)
+    elapsed_ms: float = 0.0
+
+
+def _number(text: str) -> float:
+    text = text.strip().lower()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    parts = re.split(r"[\s-]+", text)
+    return float(_TENS.get(parts[0], 0) + sum(_UNITS.get(p, 0) for p in parts[1:]) or _UNITS.get(parts[0], 0))
+
+
+def _minutes(match: "re.Match") -> int:
+    if match.group("h"):
+        return round(_number(match.group("h")) * 60 + _number(match.group("hm")))
+    if match.group("hh"):
+        return 90
+    if match.group("half"):
+        return 30
+    if match.group("an"):
+        return 60
+    value = _number(match.group("n"))
+    return round(value * 60 if match.group("unit").startswith("h") else value)
+
+
+def _pick(thresholds: List[Tuple[int, str]], minutes: int) -> Optional[str]:
+    for floor, code in thresholds:
+        if minutes >= floor:
+            return code
+    return None
+
+
+class CptTimeCoder:
+    def __init__(self, cues: Dict[str, List[str]] = CUES):
+        self._cues = cues
+        self._service_labels = [
+            (service, re.compile("|".join(re.escape(p) for p in phrases))) for service, phrases in SERVICE_LABELS.items()
+        ]
+        self._visit_label = re.compile("|".join(re.escape(p) for p in VISIT_LABELS))
+        self._other_time = re.compile(r"\b(?:" + "|".join(re.escape(p) for p in OTHER_TIME) + r")\b")
+
+    def _durations(self, clause: str) -> List[TimeMention]:
+        matches = list(_DURATION.finditer(clause))
+        if not matches or self._other_time.search(clause):
+            return []
+        labels: Dict[int, Tuple[int, str]] = {}
+        for service, pattern in self._service_labels:
+            for label in pattern.finditer(clause):
+                # A service label belongs to the closest duration in the clause
+                distance, i = min(
+                    (min(abs(label.start() - m.end()), abs(m.start() - label.end())), i) for i, m in enumerate(matches)
+                )
+                if i not in labels or distance < labels[i][0]:
+                    labels[i] = (distance, service)
+        visit = bool(self._visit_label.search(clause))
+        mentions = []
+        for i, match in enumerate(matches):
+            service = labels[i][1] if i in labels else ("visit" if visit else None)
+            if service:
+                mentions.append(TimeMention(minutes=_minutes(match), service=service, text=clause.strip()[:160]))
+        return mentions
+
+    @staticmethod
+    def _clock_minutes(match: "re.Match") -> int:
+        hour, minute = int(match.group("h")), int(match.group("m"))
+        ampm = (match.group("ampm") or "").replace(".", "").replace(" ", "")
+        if ampm == "pm" and hour < 12:
+            hour += 12
+        elif ampm == "am" and hour == 12:
+            hour = 0
+        return hour * 60 + minute
+
+    def _clock_span(self, text: str) -> Optional[TimeMention]:
+        """Visit length from start/end clock times ("started at 2:05 ... ended at 2:58")."""
+        start = end = None
+        for match in _CLOCK.finditer(text):
+            words = re.findall(r"[a-z]+", text[max(0, match.start() - 30):match.start()])[-4:]
+            if start is None and any(w in START_WORDS for w in words):
+                start = match
+            elif start is not None and any(w in END_WORDS for w in words):
+                end = match
+        if start is None or end is None:
+            return None
+        span = self._clock_minutes(end) - self._clock_minutes(start)
+        if span <= 0:
+            span += 12 * 60 # "1:50 to 2:40" style times without am/pm
+        if not 0 < span <= 4 * 60:
+            return None
+        return TimeMention(minutes=span, service="visit", text=f"{start.group(0).strip()} - {end.group(0).strip()}")
+
+    def _description(self, code: str) -> str:
+        entry = cpt_index.lookup(code)
+        return entry.description if entry else ""
+
+    def _code(self, code: str, rationale: str) -> Dict[str, Any]:
+        return {"code": code, "description": self._description(code), "rationale": rationale}
+
+    def code(self, transcript: str, diagnosis: Optional[Dict[str, Any]] = None) -> TimeCoding:
+        started = time.perf_counter()
+        result = self._code_visit((transcript or "").lower(), diagnosis)
+        result.elapsed_ms = round((time.perf_counter() - started) * 1000, 3)
+        return result
+
+    def _code_visit(self, text: str, diagnosis: Optional[Dict[str, Any]]) -> TimeCoding:
+        # Plain substring checks: one C-level scan per phrase beats a big regex alternation here
+        cues = [name for name, phrases in self._cues.items() if any(p in text for p in phrases)]
+        clauses = [c for c in _CLAUSE.findall(text) if _TIME_UNIT.search(c)] if _TIME_UNIT.search(text) else []
+        mentions = [m for clause in clauses for m in self._durations(clause)]
+        span = self._clock_span(text)
+        if span:
+            mentions.append(span)
+        result = TimeCoding(mentions=mentions, cues=cues)
+
+        for cue, reason in (
+            ("initial", "initial evaluation (90791/90792 depends on the provider type)"),
+            ("crisis", "crisis visit"),
+            ("family_group", "family or group session"),
+            ("telehealth", "telehealth visit (modifiers are payer-specific)")
+        ):
+            if cue in cues:
+                result.reason = reason
+                return result
+        if "follow_up" not in cues:
+            result.reason = "visit type not stated"
+            return result
+
+        times: Dict[str, int] = {}
+        for service in ("psychotherapy", "em", "visit"):
+            values = {m.minutes for m in mentions if m.service == service}
+            if len(values) > 1 and max(values) - min(values) > 2:
+                result.reason = f"conflicting {service} durations: {sorted(values)} minutes"
+                return result
+            if values:
+                times[service] = max(values)
+
+        therapy = "psychotherapy" in cues or "psychotherapy" in times
+        medication = "medication" in cues or "em" in times
+        primary, addons = None, []
+        if therapy and not medication:
+            minutes = times.get("psychotherapy", times.get("visit"))
+            if minutes is None:
+                result.reason = "psychotherapy time not documented"
+                return result
+            code = _pick(PSYCHOTHERAPY_CODES, minutes)
+            if code is None:
+                result.reason = f"psychotherapy under 16 minutes ({minutes})"
+                return result
+            primary = self._code(code, f"Psychotherapy, {minutes} minutes documented.")
+        elif medication and not therapy:
+            minutes = times.get("em", times.get("visit"))
+            if minutes is None:
+                result.reason = "visit time not documented"
+                return result
+            code = _pick(EM_ESTABLISHED, minutes)
+            if code is None:
+                result.reason = f"E/M time under 10 minutes ({minutes})"
+                return result
+            primary = self._code(code, f"Established patient E/M (medication management) selected by time: {minutes} minutes.")
+            if code == "99215" and minutes >= PROLONGED_FROM:
+                units = (minutes - PROLONGED_BASE) // PROLONGED_STEP
+                addons = [self._code("99417", f"Prolonged service: {minutes} minutes, {units} unit(s) of 15 minutes beyond 40.") for _ in range(units)]
+        elif therapy and medication:
+            if "psychotherapy" not in times or "em" not in times:
+                result.reason = "E/M with psychotherapy, but separate E/M and psychotherapy times are not documented"
+                return result
+            em_code = _pick(EM_ESTABLISHED, times["em"])
+            addon = _pick(PSYCHOTHERAPY_ADDONS, times["psychotherapy"])
+            if em_code is None or addon is None:
+                result.reason = f"E/M {times['em']} min / psychotherapy {times['psychotherapy']} min below the coding thresholds"
+                return result
+            primary = self._code(em_code, f"Established patient E/M selected by its own time: {times['em']} minutes (psychotherapy time excluded).")
+            addons = [self._code(addon, f"Psychotherapy add-on, {times['psychotherapy']} minutes documented separately from the E/M.")]
+        else:
+            result.reason = "services provided are unclear"
+            return result
+
+        necessity = "Medical necessity per the documented diagnosis."
+        if isinstance(diagnosis, dict) and diagnosis.get("code"):
+            necessity = f"Supports {diagnosis['code']} ({diagnosis.get('description', '')}), documented this visit."
+        result.output = {
+            "clarification_needed": False,
+            "primary_code": primary,
+            "addon_codes": addons,
+            "modifiers": [],
+            "medical_necessity": necessity,
+            "confidence": "High",
+            "coded_by": "rules",
+            "time_evidence": [m.__dict__ for m in mentions]
+        }
+        return result
+
+
+def build_time_coder() -> Optional[CptTimeCoder]:
+    """
+    Build the coder from env:
+        CPT_RULES   on (default) | off (always ask the LLM)
+    """
+    if os.environ.get("CPT_RULES", "on").lower() in ("0", "off", "false"):
+        return None
+    return CptTimeCoder()
+
+
+# Singleton instance
+time_coder = build_time_coder()
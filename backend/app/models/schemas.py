@@ -1,10 +1,47 @@
-from typing import List, Optional, Dict, Any
-from pydantic import BaseModel, Field
+from typing import List, Literal, Optional, Dict, Any
+from pydantic import BaseModel, ConfigDict, Field
 from datetime import datetime
 
+# Agent output models double as the LLM's response schema (see app.core.structured_output):
+# keep fields to types the schema can express (no free-form dicts or unions besides Optional).
+# Unknown fields are kept, so a model that says a little more loses nothing.
+
+class AgentResult(BaseModel):
+    """Fields every agent that can pause for the provider shares."""
+    model_config = ConfigDict(extra="allow", populate_by_name=True)
+
+    clarification_needed: bool = False
+    clarification_question: Optional[str] = None
+    suggested_answer: Optional[str] = None
+
+# --- Orientation & Safety ---
+
+class OrientationOutput(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    summary: str
+    clinical_nature: Optional[Literal["intake", "follow-up", "crisis", "medication_check"]] = None
+    validation_result: str = "approved" # "approved" unless the input is non-clinical/abusive
+    reasoning: Optional[str] = None
+
+class SafetyConcern(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    type: Literal["Suicide Risk", "Homicide Risk", "Abuse", "Acute Emergency"]
+    severity: Literal["Low", "Moderate", "High", "Imminent"]
+    evidence: Optional[str] = None # Quote from the transcript
+    recommended_action: Optional[str] = None
+
+class SafetyTriageOutput(AgentResult):
+    risk_detected: bool
+    concerns: List[SafetyConcern] = []
+    summary: Optional[str] = None
+
 # --- Clinical Entities ---
 
 class Symptom(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
     symptom: str
     onset: Optional[str] = None
     duration: Optional[str] = None
@@ -14,6 +51,8 @@ class Symptom(BaseModel):
     impact: Optional[str] = None
 
 class Medication(BaseModel):
+    model_config = ConfigDict(extra="allow", populate_by_name=True)
+
     name: str
     dose_frequency: Optional[str] = Field(None, alias="dose_and_frequency")
     start_date: Optional[str] = None
@@ -22,6 +61,8 @@ class Medication(BaseModel):
     adherence: Optional[str] = None
 
 class MentalStatusExam(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
     appearance: Optional[str] = None
     behavior: Optional[str] = None
     speech: Optional[str] = None
@@ -35,22 +76,40 @@ class MentalStatusExam(BaseModel):
     judgment: Optional[str] = None
 
 class AssessmentScale(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
     scale_name: str
     score: int
     interpretation: Optional[str] = None
     comparison: Optional[str] = None
 
+class ClinicalEntityOutput(AgentResult):
+    presenting_symptoms: List[Symptom] = []
+    mental_status_exam: Optional[MentalStatusExam] = None
+    current_medications: List[Medication] = []
+    # History sections are narrative ("not assessed" when not addressed)
+    substance_use: Optional[str] = None
+    past_psychiatric_history: Optional[str] = None
+    medical_history: Optional[str] = None
+    social_history: Optional[str] = None
+    family_psychiatric_history: Optional[str] = None
+    functional_assessment: Optional[str] = None
+    assessment_scales: List[AssessmentScale] = []
+
 # --- Diagnosis ---
 
 class DiagnosisCandidate(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
     code: str
     description: str
-    justification: str
-    dsm_criteria_met: List[str]
-    confidence: float
-    type: str # Primary, Secondary, RuleOut
+    justification: Optional[str] = None
+    dsm_criteria_met: List[str] = []
+    confidence: Optional[float] = None
+    type: Optional[str] = None # Primary, Secondary, RuleOut
+    reason: Optional[str] = None # Why a ruled-out diagnosis was excluded
 
-class DiagnosisOutput(BaseModel):
+class DiagnosisOutput(AgentResult):
     primary_diagnosis: Optional[DiagnosisCandidate] = None
     secondary_diagnoses: List[DiagnosisCandidate] = []
     ruled_out: List[DiagnosisCandidate] = []
@@ -58,14 +117,96 @@ class DiagnosisOutput(BaseModel):
 
 # --- Risk Assessment ---
 
-class RiskAssessment(BaseModel):
-    risk_level: str # Low, Moderate, High, Imminent
-    suicidal_ideation: bool
-    suicidal_behavior: bool
-    homicidal_ideation: bool
+class CssrsDetail(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    wish_to_be_dead: bool = False
+    active_thoughts: bool = False
+    specific_plan: bool = False
+    intent: bool = False
+
+class RiskAssessment(AgentResult):
+    risk_level: Literal["Low", "Moderate", "High", "Imminent"]
+    suicidal_ideation_present: bool = False
+    max_ideation_severity: int = 0 # C-SSRS ideation severity, 0-5
+    suicidal_behavior_present: bool = False
     protective_factors: List[str] = []
+    risk_factors: List[str] = []
     clinical_actions: List[str] = []
-    cssrs_categories_present: List[int] = [] # 1-5 for ideation, 6-10 for behavior
+    cssrs_detail: Optional[CssrsDetail] = None
+
+# --- Procedure Coding ---
+
+class ProcedureCode(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    code: str
+    description: Optional[str] = None
+    rationale: Optional[str] = None
+
+class ProcedureCodingOutput(AgentResult):
+    primary_code: Optional[ProcedureCode] = None
+    addon_codes: List[ProcedureCode] = []
+    modifiers: List[str] = []
+    medical_necessity: Optional[str] = None
+    confidence: Optional[Literal["High", "Medium", "Low"]] = None
+
+# --- Medication Management ---
+
+class MedicationDetail(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    name: str
+    generic_name: Optional[str] = None
+    brand_name: Optional[str] = None
+    strength: Optional[str] = None
+    form: Optional[str] = None
+    route: Optional[str] = None
+    frequency: Optional[str] = None
+    indication: Optional[str] = None
+    response: Optional[str] = None
+    adherence: Optional[str] = None
+    side_effects: List[str] = []
+
+class MedicationChange(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    medication: str
+    change_type: Literal["New Start", "Discontinue", "Increase Dose", "Decrease Dose", "No Change"]
+    rationale: Optional[str] = None
+
+class MedicationOutput(AgentResult):
+    medications: List[MedicationDetail] = []
+    changes_made: List[MedicationChange] = []
+
+# --- Treatment Planning ---
+
+class TreatmentGoal(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    goal: str
+    target_date: Optional[str] = None
+    status: Optional[Literal["New", "Ongoing", "Met"]] = None
+
+class TreatmentPlanOutput(AgentResult):
+    treatment_goals: List[TreatmentGoal] = []
+    interventions: List[str] = []
+    referrals: List[str] = []
+    follow_up_plan: Optional[str] = None
+
+# --- SOAP Note ---
+
+class SoapNote(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    subjective: str = "" # Markdown
+    objective: str = ""
+    assessment: str = ""
+    plan: str = ""
+
+class SoapNoteOutput(AgentResult):
+    soap_note: SoapNote
+    summary: Optional[str] = None
 
 # --- Agent IO ---
 
@@ -78,3 +219,5 @@ class AgentOutput(BaseModel):
     timestamp: datetime
     clarification_needed: bool = False
     clarification_question: Optional[str] = None
+    raw_response: Optional[str] = None # Model text as returned (logged for replay), None without an LLM call
+    timings: Optional[Dict[str, Any]] = None # Stage breakdown of execute() (see app.core.stage_timing)
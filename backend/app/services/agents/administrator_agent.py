@@ -1,10 +1,18 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
+from collections import deque
 from .base import BaseAgent
 from ...core.event_bus import Event
 import asyncio
+import os
+import time
+
+ADMIN_HISTORY_SIZE = int(os.environ.get("ADMIN_HISTORY_SIZE", "32"))
+ADMIN_MAX_CYCLE_PERIOD = int(os.environ.get("ADMIN_MAX_CYCLE_PERIOD", "6"))
+SESSION_MAX_LLM_CALLS = int(os.environ.get("SESSION_MAX_LLM_CALLS", "40"))
+SESSION_MAX_WALL_S = float(os.environ.get("SESSION_MAX_WALL_S", "600"))
 
 class AdministratorAgent(BaseAgent):
-    def __init__(self):
+    def __init__(self, usage: Optional[Dict[str, Any]] = None):
         super().__init__(
             agent_id="administrator",
             name="Workflow Administrator",
@@ -12,8 +20,17 @@ class AdministratorAgent(BaseAgent):
             dependencies=[]
         )
         self.max_loops = 3
-        self.interaction_history: List[str] = [] # Track sender_ids
-        
+        # Ring buffer of recent publishers: memory and loop checks stay bounded however long the session runs
+        self.interaction_history: deque = deque(maxlen=ADMIN_HISTORY_SIZE)
+        self.max_period = ADMIN_MAX_CYCLE_PERIOD
+        # Session-wide budget; `usage` lives in the session state so it carries over resumes
+        self.usage = usage if usage is not None else {}
+        self.usage.setdefault("llm_calls", 0)
+        self.usage.setdefault("elapsed_s", 0.0)
+        self.max_llm_calls = SESSION_MAX_LLM_CALLS
+        self.max_wall_s = SESSION_MAX_WALL_S
+        self._run_started = time.monotonic()
+
     async def monitor(self, event: Event, context: Dict[str, Any]) -> Dict[str, Any]:
         """
         Evaluates the event stream for loops or completion.
@@ -26,45 +43,65 @@ class AdministratorAgent(BaseAgent):
         # 1. Update History with Priority
         self.interaction_history.append({"id": event.sender_id, "priority": event.sender_priority})
         
-        # 2. Check for Infinite Loops (A -> B -> A -> B pattern)
-        if self._detect_loop():
+        # 2. Check for Infinite Loops (a cycle of any period repeating, e.g. ABAB or ABCABC)
+        cycle = self._detect_loop()
+        if cycle:
             # JUDGE MODE: Resolve by Rank
             # Identify the loop participants
-            last_4 = self.interaction_history[-4:] # [{'id': 'A', 'p': 1}, {'id': 'B', 'p': 5}...]
-            unique_participants = list({x["id"]: x for x in last_4}.values())
+            participants = {x["id"]: x for x in list(self.interaction_history)[-len(cycle):]}
             
             # Find winner (Highest Priority)
-            winner = max(unique_participants, key=lambda x: x["priority"])
+            winner = max(participants.values(), key=lambda x: x["priority"])
             
             return {
                 "directive": "RESOLVED",
-                "reason": f"Infinite debate detected. Resolving by Authority.",
+                "reason": f"Infinite debate detected ({' -> '.join(cycle)}). Resolving by Authority.",
                 "winner_id": winner["id"],
                 "winner_priority": winner["priority"],
+                "loop_detected": True,
                 "action": "ACCEPT_WINNER_STATE"
             }
 
         # 3. Check for Global Completion (Basic Heuristic)
         # In a real mesh, this would be a complex goal predicate
-        required_keys = ["clinical", "diagnosis", "medication", "output"]
+        required_keys = ["clinical_entity", "diagnosis_mapping", "medication_management", "output_generation"]
         if all(k in context for k in required_keys) and event.topic == "OUTPUT_GENERATED":
              return {"directive": "STOP", "reason": "All goals met."}
 
         return {"directive": "CONTINUE"}
 
-    def _detect_loop(self) -> bool:
+    def _detect_loop(self) -> Optional[List[str]]:
         """
-        Simple heuristic: Check if the last 4 senders form a repetitive ABAB pattern.
+        Returns the repeating cycle if the most recent publishers are one cycle of k distinct
+        agents played twice (ABAB for k=2, ABCABC for k=3, ...), for any k up to max_period.
         """
-        if len(self.interaction_history) < 4:
-            return False
-        
-        last_4 = [x["id"] for x in self.interaction_history[-4:]]
-        # Pattern: A, B, A, B
-        if last_4[0] == last_4[2] and last_4[1] == last_4[3] and last_4[0] != last_4[1]:
-            return True
-        
-        return False
+        ids = [x["id"] for x in self.interaction_history]
+        for k in range(2, self.max_period + 1):
+            if len(ids) < 2 * k:
+                break
+            window = ids[-2 * k:]
+            if window[:k] == window[k:] and len(set(window[:k])) == k:
+                return window[k:]
+        return None
+
+    # --- Budget ---
+
+    def elapsed(self) -> float:
+        """Session wall-clock so far (time spent paused for the user doesn't count)."""
+        return self.usage["elapsed_s"] + time.monotonic() - self._run_started
+
+    def close_run(self) -> None:
+        """Bank this run's wall-clock time into the session usage."""
+        self.usage["elapsed_s"] = self.elapsed()
+        self._run_started = time.monotonic()
+
+    def budget_exceeded(self) -> Optional[str]:
+        """Reason to stop the session before another agent runs, if any."""
+        if self.max_llm_calls and self.usage["llm_calls"] >= self.max_llm_calls:
+            return f"LLM call budget exhausted ({self.usage['llm_calls']}/{self.max_llm_calls})."
+        if self.max_wall_s and self.elapsed() >= self.max_wall_s:
+            return f"Time budget exhausted ({int(self.elapsed())}s/{int(self.max_wall_s)}s)."
+        return None
 
     # Standard/mock implementation for abstract methods
     def build_prompt(self, input_data: Dict[str, Any], context: Dict[str, Any]) -> str:
@@ -1,17 +1,38 @@
-import google.generativeai as genai
 import os
+import json
+import time
 import asyncio
+import hashlib
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List
+from contextlib import AsyncExitStack
+from typing import Dict, Any, List, AsyncIterator, Awaitable, Callable, Optional, Tuple, Type
 from datetime import datetime
+from pydantic import BaseModel
 from app.models.schemas import AgentOutput
+from app.core.llm_cache import llm_cache, make_cache_key
+from app.core.llm_governor import llm_governor, estimate_tokens, EXPECTED_OUTPUT_TOKENS, LLMGrant
+from app.core.llm_resilience import llm_resilience
+from app.core.session_context import current_session_id, current_usage, current_agent_id, current_timer
+from app.core.stage_timing import StageTimer
+from app.core.structured_output import response_schema, validate_json
+from app.core.llm_client import llm_client, LLMResponse
+from app.core.json_stream import IncrementalJSONParser, ParseEvent
+from app.core.context_projection import InputSchema, project, serialize
+from app.core.metrics import agent_parse_seconds, llm_admission_wait_seconds, llm_call_seconds, llm_cache_requests_total, llm_tokens_total
 
-# Configure Gemini
-# NOTE: In production, use os.environ.get("GEMINI_API_KEY")
-# For the prototype, we expect the key to be set in the environment.
-API_KEY = os.environ.get("GEMINI_API_KEY", "")
-if API_KEY:
-    genai.configure(api_key=API_KEY)
+# Per-call LLM timeout in seconds (agents may override `llm_timeout`)
+LLM_TIMEOUT_S = float(os.environ.get("LLM_TIMEOUT_S", "60"))
+
+# Stream completions and parse them incrementally (off = always wait for the full response)
+LLM_STREAMING = os.environ.get("LLM_STREAMING", "on").lower() not in ("0", "off", "false")
+
+# Send each agent's output model to the provider as a JSON response schema
+LLM_STRUCTURED_OUTPUT = os.environ.get("LLM_STRUCTURED_OUTPUT", "on").lower() not in ("0", "off", "false")
+
+# on_partial(kind, path, value): kind is "fragment" (new text of an open string) or "value" (closed value)
+PartialCallback = Callable[[str, Tuple, Any], Awaitable[None]]
+# on_field(key, value): a top-level field of the output has closed
+FieldCallback = Callable[[str, Any], Awaitable[None]]
 
 TEAM_ROSTER = """
 THE MEDICAL AI TEAM:
@@ -30,13 +51,71 @@ FORMATTING GUIDELINES FOR TEAM CHAT:
 - Be conversational but clinical. Your "get_chat_summary" output is what the provider sees.
 """
 
+def _digest(payload: Any) -> str:
+    encoded = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+class _OpenCall:
+    """An admitted model call: its governor grant, first chunk and the rest of the stream."""
+
+    def __init__(
+        self,
+        resources: AsyncExitStack,
+        grant: LLMGrant,
+        stream: Optional[AsyncIterator[LLMResponse]],
+        first: Optional[LLMResponse],
+        admission_wait: float,
+        admitted_at: float
+    ):
+        self._resources = resources
+        self.grant = grant
+        self.stream = stream
+        self.first = first
+        self.admission_wait = admission_wait
+        self.admitted_at = admitted_at
+
+    async def chunks(self) -> AsyncIterator[LLMResponse]:
+        if self.first is not None:
+            yield self.first
+        if self.stream is not None:
+            async for chunk in self.stream:
+                yield chunk
+
+    async def aclose(self) -> None:
+        """Close the stream and release the governor slot."""
+        await self._resources.aclose()
+
 class BaseAgent(ABC):
+    # Bump when an agent's prompt template changes so cached completions are not reused
+    prompt_version: str = "1"
+
+    # Streaming: forward decoded fields under these JSON paths while the completion is still arriving
+    stream_output: bool = False
+    stream_fields: List[Tuple] = []
+
+    # Read the session transcript from the shared prompt prefix (cached across agents)
+    shares_transcript: bool = False
+
+    # Blackboard fields this agent reads ({source agent id: [output fields]}), rendered by
+    # project_inputs() as compact JSON within `input_token_budget`
+    inputs: InputSchema = {}
+    input_token_budget: int = 2000
+
+    # Shape of the output (app.models.schemas): sent as the response schema and used to
+    # validate the reply in one pass; None = free-form JSON
+    output_model: Optional[Type[BaseModel]] = None
+
+    # Send a duplicate request when a call outlasts this agent's recent p95 (latency-critical
+    # agents only: each hedge is an extra provider call)
+    hedge_requests: bool = False
+
     def __init__(
         self, 
         agent_id: str, 
         name: str, 
         priority: int = 1,
         dependencies: List[str] = [],
+        peer_review: List[str] = [],
         human_in_loop: bool = False,
         model_name: str = "gemini-flash-latest"
     ):
@@ -44,10 +123,18 @@ class BaseAgent(ABC):
         self.name = name
         self.priority = priority
         self.dependencies = dependencies
+        self.peer_review = peer_review # Peer outputs we read but do not wait for (debate mode)
         self.human_in_loop = human_in_loop
         self.listen_for: List[str] = [] # Topics to subscribe to
         self.model_name = model_name
-        self.model = genai.GenerativeModel(model_name)
+        self.llm_timeout = LLM_TIMEOUT_S
+
+        # Inputs must come from agents we wait for or review; catches misnamed keys at startup
+        unknown = [source for source in self.inputs if source not in dependencies + peer_review]
+        if unknown:
+            raise ValueError(f"{agent_id} declares inputs from {unknown}, which are neither dependencies nor peer reviews")
+        # Converted once; a model the provider can't express fails here, at startup
+        self.output_schema = response_schema(self.output_model) if self.output_model else None
     
     async def react(self, event, context: Dict[str, Any]) -> bool:
         """
@@ -58,22 +145,125 @@ class BaseAgent(ABC):
             return True
         return False
 
-    async def execute(self, input_data: Dict[str, Any], context: Dict[str, Any]) -> AgentOutput:
+    def input_fingerprint(self, input_data: Dict[str, Any], context: Dict[str, Any]) -> str:
+        """
+        Hash of everything this agent reads from the blackboard: the session input,
+        the outputs of its dependencies, the decisions of its peer reviewers, and any
+        user clarification addressed to it. Used to decide whether a checkpointed output
+        is still valid. A reworded peer review is the same review, so it doesn't re-run us.
+        """
+        checkpoints = context.get("checkpoints", {})
+        upstream = {
+            agent_id: context[agent_id]
+            for agent_id in self.dependencies
+            if agent_id in context
+        }
+        reviews = {
+            agent_id: checkpoints.get(agent_id, {}).get("decision")
+            for agent_id in self.peer_review
+            if agent_id in context
+        }
+        payload = {
+            "input": input_data,
+            "upstream": upstream,
+            "reviews": reviews,
+            "clarification": context.get("user_clarifications", {}).get(self.agent_id)
+        }
+        return _digest(payload)
+
+    def prompt_prefix(self, input_data: Dict[str, Any]) -> str:
+        """
+        Leading part of the prompt, byte-identical for every agent of a session so the
+        provider can serve it from its context cache. Only static or session-wide text
+        belongs here; anything agent-specific goes after it.
+        """
+        if not self.shares_transcript:
+            return TEAM_ROSTER
+        return f"{TEAM_ROSTER}\nSESSION TRANSCRIPT:\n{input_data.get('transcript', '')}\n"
+
+    def project_inputs(self, context: Dict[str, Any]) -> str:
+        """
+        Compact JSON of the declared `inputs`. Peer reviews may not have run yet; a missing
+        dependency raises MissingInputError.
+        """
+        return serialize(project(context, self.inputs, optional=self.peer_review), self.input_token_budget)
+
+    def decision(self, output_data: Dict[str, Any]) -> Any:
+        """
+        The part of our output that peers and downstream agents act on. Debate mode has
+        reached a fixed point when a re-run leaves this unchanged. Defaults to the whole
+        output; agents with free-text reasoning override it.
+        """
+        return output_data
+
+    def decision_digest(self, output_data: Dict[str, Any]) -> str:
+        return _digest(self.decision(output_data))
+
+    async def execute(
+        self,
+        input_data: Dict[str, Any],
+        context: Dict[str, Any],
+        on_partial: Optional[PartialCallback] = None,
+        on_field: Optional[FieldCallback] = None
+    ) -> AgentOutput:
         """
         Main execution flow for the agent.
+        `on_partial` receives streamed fields (see `stream_fields`) as they are decoded;
+        `on_field` receives each top-level field as soon as it closes.
+        Each stage is timed; the breakdown comes back as `timings` on the output.
+        Raises MissingInputError when a declared input is not on the blackboard, rather than
+        returning an output downstream agents would take for real data.
         """
+        timer = StageTimer()
+        token = current_timer.set(timer)
+        try:
+            output = await self._execute_stages(input_data, context, on_partial, on_field, timer)
+        finally:
+            current_timer.reset(token)
+        output.timings = timer.to_dict()
+        return output
+
+    async def _execute_stages(
+        self,
+        input_data: Dict[str, Any],
+        context: Dict[str, Any],
+        on_partial: Optional[PartialCallback],
+        on_field: Optional[FieldCallback],
+        timer: StageTimer
+    ) -> AgentOutput:
         # 1. Validate Input
         if not self.validate_input(input_data):
             return self.create_error_output("Invalid input data")
+        timer.mark("validate")
+
+        # 2. Answer without the LLM when deterministic rules can
+        ruled = self.deterministic_output(input_data, context)
+        timer.mark("rules")
+        if ruled is not None:
+            timer.note(llm_source="rules")
+            data = self.check_output(ruled)
+            timer.mark("check")
+            confidence = self.assess_confidence(data)
+            timer.mark("confidence")
+            return AgentOutput(
+                agent_id=self.agent_id,
+                status="completed",
+                confidence=confidence,
+                data=data,
+                reasoning="Computed by deterministic rules (no LLM call).",
+                timestamp=datetime.now()
+            )
 
         # 2. Build Shared Collaborative Context
         shared_context = self._build_collaborative_context(context)
+        timer.mark("context")
 
-        # 3. Build Specific Prompt
+        # 3. Build Specific Prompt (a missing declared input raises MissingInputError to the caller)
         specific_prompt = self.build_prompt(input_data, context)
-        
-        # Combine
-        prompt = f"{TEAM_ROSTER}\n\n{shared_context}\n\nYOUR SPECIFIC TASK:\n{specific_prompt}"
+
+        # Combine (shared prefix first, so it can be served from the context cache)
+        prefix = self.prompt_prefix(input_data)
+        prompt = f"{prefix}\n\n{shared_context}\n\nYOUR SPECIFIC TASK:\n{specific_prompt}"
 
         # Check for User Clarifications in context (Specific to THIS agent)
         user_clarifications = context.get("user_clarifications", {})
@@ -82,20 +272,31 @@ class BaseAgent(ABC):
             clarification_text += f"USER: {user_clarifications[self.agent_id]}\n"
             clarification_text += "INSTRUCTION: Incorporate this feedback immediately. If this answers your previous doubt, set 'clarification_needed' to false."
             prompt += clarification_text
+        timer.mark("prompt")
+        timer.note(prompt_chars=len(prompt), prefix_chars=len(prefix), prompt_tokens_est=estimate_tokens(prompt))
 
         # 4. Call LLM
         try:
              # Always use call_llm so subclasses can override/mock it easily
-             llm_response = await self.call_llm(prompt)
+             llm_response = await self.call_llm(prompt, on_partial=on_partial, on_field=on_field, prefix=prefix)
         except Exception as e:
+            timer.mark("llm")
             print(f"Error calling LLM for {self.agent_id}: {e}")
             return self.create_error_output(str(e))
+        timer.mark("llm")
+        timer.note(response_chars=len(llm_response))
 
         # 4. Parse Output
         parsed_data = self.parse_output(llm_response)
+        parse_ms = timer.mark("parse")
+        if "error" not in parsed_data:
+            parsed_data = self.check_output(parsed_data)
+            parse_ms += timer.mark("check")
+        agent_parse_seconds.labels(self.agent_id).observe(parse_ms / 1000)
 
         # 5. Calculate Confidence
         confidence = self.assess_confidence(parsed_data)
+        timer.mark("confidence")
 
         # 6. Return Structured Output
         return AgentOutput(
@@ -104,7 +305,8 @@ class BaseAgent(ABC):
             confidence=confidence,
             data=parsed_data,
             reasoning="Steps taken by Gemini Agent.",
-            timestamp=datetime.now()
+            timestamp=datetime.now(),
+            raw_response=llm_response
         )
 
     def _build_collaborative_context(self, context: Dict[str, Any]) -> str:
@@ -143,31 +345,229 @@ class BaseAgent(ABC):
     def build_prompt(self, input_data: Dict[str, Any], context: Dict[str, Any]) -> str:
         pass
 
-    async def call_llm(self, prompt: str) -> str:
+    async def call_llm(
+        self,
+        prompt: str,
+        on_partial: Optional[PartialCallback] = None,
+        on_field: Optional[FieldCallback] = None,
+        prefix: Optional[str] = None,
+        structured: bool = True
+    ) -> str:
         """
         Wrapper for the LLM call. Can be overridden for mocking.
+        When streaming, `on_partial` gets fields under `stream_fields` as they decode and
+        `on_field` gets each top-level field the moment it closes.
+        `prefix` is the leading part of `prompt` shared with other agents (context cache).
+        `structured=False` asks for free text (no response schema, not streamed), e.g. consults.
         """
-        if not API_KEY:
-            print(f"WARNING: No GEMINI_API_KEY found for {self.agent_id}. Returning empty JSON.")
-            return "{}"
+        # Content-addressed cache: identical prompt + model + prompt version => same completion
+        cache_key = self._cache_key(prompt)
+        cached = await llm_cache.get(cache_key)
+        llm_cache_requests_total.labels(self.agent_id, "miss" if cached is None else "hit").inc()
+        timer = current_timer.get()
+        if cached is not None:
+            print(f"DEBUG: LLM cache hit for {self.agent_id}")
+            if timer:
+                timer.note(llm_source="cache")
+            if on_partial or on_field:
+                # Replay so listeners still see every field
+                await self._dispatch_parse_events(IncrementalJSONParser().feed(cached), {}, on_partial, on_field)
+            return cached
         
-        # Use asyncio.to_thread for the synchronous SDK call
-        response = await asyncio.to_thread(self.model.generate_content, prompt)
-        return response.text
+        current_agent_id.set(self.agent_id)
+        # Retries, hedging and the circuit breaker wrap each governed attempt (app.core.llm_resilience)
+        session_id = current_session_id.get()
+        hedge = (lambda: llm_governor.would_admit(self.priority, session_id)) if self.hedge_requests else None
+        call = await llm_resilience.call(
+            self.agent_id,
+            self.model_name,
+            lambda: self._open_call(prompt, prefix, structured),
+            hedge=hedge,
+            discard=lambda open_call: open_call.aclose()
+        )
+        # Only calls that reach the model count toward the session budget (not cache hits or rule-coded results)
+        totals = current_usage.get()
+        if totals is not None:
+            totals["llm_calls"] = totals.get("llm_calls", 0) + 1
+        try:
+            if call.stream is not None:
+                text, usage, complete = await self._stream_completion(call.chunks(), on_partial, on_field)
+            else:
+                text, usage, complete = call.first.text, call.first, True
+            if usage.total_tokens:
+                call.grant.record_usage(usage.total_tokens)
+        except Exception as e:
+            llm_resilience.record_failure(self.model_name, e)
+            raise
+        finally:
+            await call.aclose()
+        finished_at = time.perf_counter()
+        llm_call_seconds.labels(self.agent_id, self.model_name).observe(finished_at - call.admitted_at)
+        if timer:
+            timer.note(
+                llm_source="model",
+                admission_wait_ms=round(call.admission_wait * 1000, 2),
+                model_ms=round((finished_at - call.admitted_at) * 1000, 2),
+                streamed=call.stream is not None,
+                complete=complete
+            )
+        self._record_usage(usage)
+
+        # A stream cut short by stop_streaming is not the model's full answer; don't cache it
+        if complete:
+            await self._cache_completion(cache_key, text, structured)
+        return text
+
+    async def _open_call(self, prompt: str, prefix: Optional[str] = None, structured: bool = True) -> "_OpenCall":
+        """
+        One attempt: wait for admission, then send the call and wait for its first chunk
+        (the whole completion when not streaming). The slot stays held until the
+        returned call is closed.
+        """
+        # Admission control: shared RPM/TPM quota, dispatched by agent priority and per-session fair share
+        est_tokens = estimate_tokens(prompt) + EXPECTED_OUTPUT_TOKENS
+        resources = AsyncExitStack()
+        try:
+            queued_at = time.perf_counter()
+            grant = await resources.enter_async_context(llm_governor.slot(self.priority, current_session_id.get(), est_tokens))
+            admitted_at = time.perf_counter()
+            llm_admission_wait_seconds.labels(self.agent_id).observe(admitted_at - queued_at)
+            if LLM_STREAMING and structured:
+                stream = llm_client.stream(self.model_name, prompt, timeout=self.llm_timeout, prefix=prefix, schema=self._request_schema())
+                resources.push_async_callback(stream.aclose) # Frees the transport slot right away when we stop early
+                first = await anext(stream, None)
+            else:
+                # Native async call on the shared client (no worker thread held while waiting)
+                stream = None
+                first = await llm_client.generate(
+                    self.model_name, prompt, timeout=self.llm_timeout, prefix=prefix,
+                    schema=self._request_schema() if structured else None
+                )
+        except BaseException:
+            await resources.aclose()
+            raise
+        return _OpenCall(resources, grant, stream, first, admitted_at - queued_at, admitted_at)
+
+    async def _stream_completion(
+        self,
+        chunks: AsyncIterator[LLMResponse],
+        on_partial: Optional[PartialCallback],
+        on_field: Optional[FieldCallback]
+    ) -> Tuple[str, LLMResponse, bool]:
+        """
+        Feed one streamed completion through the incremental parser.
+        Returns (text, usage, complete); `usage` holds the latest token counts reported.
+        When `stop_streaming` ends the stream early, text is the JSON of the top-level
+        fields decoded so far.
+        """
+        parser = IncrementalJSONParser()
+        fields: Dict[str, Any] = {}
+        texts: List[str] = []
+        usage = LLMResponse(text="")
+        async for chunk in chunks:
+            texts.append(chunk.text)
+            if chunk.total_tokens:
+                usage = chunk
+            if await self._dispatch_parse_events(parser.feed(chunk.text), fields, on_partial, on_field):
+                print(f"DEBUG: {self.agent_id} stopped streaming early after {list(fields)}")
+                return json.dumps(fields), usage, False
+        return "".join(texts), usage, True
+
+    def _record_usage(self, usage: LLMResponse) -> None:
+        """Add this call's token counts to the session's usage (see current_usage) and the token metrics."""
+        totals = current_usage.get()
+        timer = current_timer.get()
+        if timer:
+            timer.note(prompt_tokens=usage.prompt_tokens, cached_tokens=usage.cached_tokens, output_tokens=usage.output_tokens)
+        for key in ("prompt_tokens", "cached_tokens", "output_tokens"):
+            count = getattr(usage, key)
+            if count:
+                llm_tokens_total.labels(self.agent_id, self.model_name, key[:-len("_tokens")]).inc(count)
+            if totals is not None:
+                totals[key] = totals.get(key, 0) + count
+
+    async def _dispatch_parse_events(
+        self,
+        events: List[ParseEvent],
+        fields: Dict[str, Any],
+        on_partial: Optional[PartialCallback],
+        on_field: Optional[FieldCallback]
+    ) -> bool:
+        """Route parser events to the callbacks. Returns True if the stream should stop."""
+        for kind, path, value in events:
+            if on_partial and any(path[:len(field)] == field for field in self.stream_fields):
+                await on_partial(kind, path, value)
+            if kind == "value" and len(path) == 1:
+                fields[path[0]] = value
+                if on_field:
+                    await on_field(path[0], value)
+                if self.stop_streaming(fields):
+                    return True
+        return False
+
+    def stop_streaming(self, fields: Dict[str, Any]) -> bool:
+        """
+        Called each time a top-level field closes. Return True to end the stream early.
+        Default: once the agent has asked for clarification and the question (and
+        suggested answer) are in, the rest of the analysis would be redone after the
+        user answers anyway.
+        """
+        if fields.get("clarification_needed") is not True or "clarification_question" not in fields:
+            return False
+        return "suggested_answer" in fields or list(fields)[-1] != "clarification_question"
+
+    def _request_schema(self) -> Optional[Dict[str, Any]]:
+        return self.output_schema if LLM_STRUCTURED_OUTPUT else None
+
+    def _cache_key(self, prompt: str) -> str:
+        return make_cache_key(self.model_name, prompt, f"{self.agent_id}:{self.prompt_version}")
+
+    async def _cache_completion(self, cache_key: str, text: str, structured: bool = True) -> None:
+        # Only keep completions we can actually use; a formatting failure should be retried
+        if not structured:
+            if text.strip():
+                await llm_cache.set(cache_key, text)
+            return
+        parsed = self.parse_output(text)
+        if parsed and "error" not in parsed:
+            await llm_cache.set(cache_key, text)
+
+    def parse_structured(self, llm_output: str) -> Optional[Dict[str, Any]]:
+        """The output validated against `output_model` in one pass, or None (no model, or it doesn't match)."""
+        if self.output_model is None:
+            return None
+        parsed = validate_json(self.output_model, llm_output)
+        if parsed is None:
+            print(f"DEBUG: {self.agent_id} output doesn't match {self.output_model.__name__}; parsing leniently")
+            return None
+        timer = current_timer.get()
+        if timer:
+            timer.note(parse_strategy="schema")
+        return parsed
 
     def parse_output(self, llm_output: str) -> Dict[str, Any]:
         """
         Parses LLM string output into a dictionary.
-        Handles common markdown wrapping and common JSON syntax errors.
+        Output matching `output_model` (always, with a response schema) is validated in one
+        pass; anything else goes through the lenient strategies below, which handle
+        markdown wrapping and common JSON syntax errors.
         """
         import json
         import re
 
+        structured = self.parse_structured(llm_output)
+        if structured is not None:
+            return structured
+
         clean_output = llm_output.strip()
+        timer = current_timer.get()
         
         # 1. Try direct parse
         try:
-            return json.loads(clean_output)
+            parsed = json.loads(clean_output)
+            if timer:
+                timer.note(parse_strategy="direct")
+            return parsed
         except:
             pass
 
@@ -175,7 +575,10 @@ class BaseAgent(ABC):
         match = re.search(r'```(?:json)?\s*(\{.*?\})\s*```', clean_output, re.DOTALL)
         if match:
             try:
-                return json.loads(match.group(1))
+                parsed = json.loads(match.group(1))
+                if timer:
+                    timer.note(parse_strategy="markdown")
+                return parsed
             except:
                 pass
 
@@ -183,16 +586,35 @@ class BaseAgent(ABC):
         match = re.search(r'(\{.*\})', clean_output, re.DOTALL)
         if match:
             try:
-                return json.loads(match.group(1))
+                parsed = json.loads(match.group(1))
+                if timer:
+                    timer.note(parse_strategy="extracted")
+                return parsed
             except json.JSONDecodeError as e:
                 print(f"JSON subset parse failed for {self.agent_id}: {e}")
         
+        if timer:
+            timer.note(parse_strategy="failed")
         return {
             "error": "Failed to parse JSON",
             "raw": llm_output,
             "clarification_question": "I encountered a formatting error while processing the analysis. Could you please provide a brief update or re-state the last point of the session to help me re-sync?"
         }
 
+    def deterministic_output(self, input_data: Dict[str, Any], context: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Output computed without the LLM, or None to prompt as usual (the default).
+        Override for agents whose answer follows from rules when the inputs are unambiguous.
+        """
+        return None
+
+    def check_output(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Deterministic checks on a parsed output, run before anyone sees it (no LLM call).
+        Override to correct or annotate fields, e.g. validate codes against app.core.code_index.
+        """
+        return data
+
     def get_chat_summary(self, data: Dict[str, Any]) -> str:
         """Returns a summary of the agent's findings for the team chat."""
         # 1. Check for explicit summary/thought in data
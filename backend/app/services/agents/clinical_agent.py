@@ -1,8 +1,12 @@
 from typing import Dict, Any
 from .base import BaseAgent
+from app.models.schemas import ClinicalEntityOutput
 import asyncio
 
 class ClinicalEntityAgent(BaseAgent):
+    output_model = ClinicalEntityOutput
+    shares_transcript = True
+
     def __init__(self, priority: int = 2):
         super().__init__(
             agent_id="clinical_entity",
@@ -39,8 +43,8 @@ class ClinicalEntityAgent(BaseAgent):
         """
         
         try:
-            response = await self.model.generate_content_async(prompt)
-            answer = response.text.strip()
+            # Same admission, retry, cache and usage accounting as the agent's own runs
+            answer = (await self.call_llm(prompt, structured=False)).strip()
             if "NONE" in answer or "None" in answer:
                 return None
             return answer
@@ -48,7 +52,6 @@ class ClinicalEntityAgent(BaseAgent):
             return None
 
     def build_prompt(self, input_data: Dict[str, Any], context: Dict[str, Any]) -> str:
-        transcript = input_data.get("transcript", "")
         return f"""
 You are a psychiatric clinical entity extraction specialist. Extract all clinically relevant information from this psychiatric session transcript and organize it into structured categories.
 
@@ -93,14 +96,28 @@ Return ONLY a valid JSON object with this structure:
     "insight": "string",
     "judgment": "string"
   }},
-  "current_medications": [],
-  "substance_use": {{}},
-  "past_psychiatric_history": {{}},
-  "medical_history": {{}},
-  "social_history": {{}},
-  "family_psychiatric_history": {{}},
-  "functional_assessment": {{}},
-  "assessment_scales": []
+  "current_medications": [
+    {{
+      "name": "string",
+      "dose_and_frequency": "string",
+      "start_date": "string",
+      "response": "string",
+      "adherence": "string"
+    }}
+  ],
+  "substance_use": "string",
+  "past_psychiatric_history": "string",
+  "medical_history": "string",
+  "social_history": "string",
+  "family_psychiatric_history": "string",
+  "functional_assessment": "string",
+  "assessment_scales": [
+    {{
+      "scale_name": "string (e.g., PHQ-9)",
+      "score": int,
+      "interpretation": "string"
+    }}
+  ]
 }}
 
 IMPORTANT: 
@@ -111,8 +128,7 @@ IMPORTANT:
 - **DO NOT** ask the patient directly (e.g., "Sarah, what dose are you on?").
 - Use "not assessed" if element not addressed.
 
-TRANSCRIPT:
-{transcript}
+The session TRANSCRIPT is at the top of this prompt.
 """
 
     def get_chat_summary(self, data: Dict[str, Any]) -> str:
@@ -1,24 +1,34 @@
 from typing import Dict, Any, List
 from .base import BaseAgent
+from app.models.schemas import DiagnosisOutput
+from app.core.code_index import icd10_index, check_code, invalid_code_question
 import asyncio
 import json
 
 class DiagnosisMappingAgent(BaseAgent):
+    output_model = DiagnosisOutput
+    inputs = {
+        "clinical_entity": [
+            "presenting_symptoms", "mental_status_exam", "substance_use", "past_psychiatric_history",
+            "medical_history", "family_psychiatric_history", "functional_assessment", "assessment_scales"
+        ],
+        "medication_management": ["medications", "changes_made"]
+    }
+    input_token_budget = 1500
+
     def __init__(self, priority: int = 3):
         super().__init__(
             agent_id="diagnosis_mapping",
             name="Diagnosis Mapping Agent",
             priority=priority,
             dependencies=["clinical_entity"], # Depends on clinical entities
+            peer_review=["medication_management"], # Debate partner
             human_in_loop=True
         )
 
     def build_prompt(self, input_data: Dict[str, Any], context: Dict[str, Any]) -> str:
-        # Get extracted entities from context (output of ClinicalEntityAgent)
-        clinical_data = context.get("clinical", {})
-        
-        # Format the clinical data for the prompt
-        entities_str = json.dumps(clinical_data, indent=2)
+        # Extracted entities (ClinicalEntityAgent) and, once it has run, the medication review
+        entities_str = self.project_inputs(context)
 
         return f"""
 You are a psychiatric diagnosis coding specialist with deep knowledge of DSM-5 criteria and ICD-10-CM F codes. Your task is to analyze clinical information and assign appropriate psychiatric diagnosis codes.
@@ -84,10 +94,29 @@ IMPORTANT:
 Analyze this clinical information and provide diagnosis codes.
 """
 
+    def check_output(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        # Every code against the local ICD-10-CM table; a made-up primary goes back to the provider
+        primary = data.get("primary_diagnosis")
+        verdict = check_code(icd10_index, primary)
+        others = [check_code(icd10_index, d) for d in (data.get("secondary_diagnoses") or []) + (data.get("ruled_out") or [])]
+        invalid = [v["code"] for v in [verdict] + others if v and not v["valid"]]
+        if invalid:
+            print(f"WARNING: {self.agent_id} returned invalid ICD-10-CM codes: {invalid}")
+        unverified = [v["code"] for v in [verdict] + others if v and v["valid"] and not v.get("verified", True)]
+        if unverified:
+            print(f"WARNING: {self.agent_id} returned ICD-10-CM codes missing from the local table (kept, unverified): {unverified}")
+        if verdict and not verdict["valid"] and not data.get("clarification_needed"):
+            question, answer = invalid_code_question(icd10_index, verdict)
+            data.update(clarification_needed=True, clarification_question=question, suggested_answer=answer)
+        return data
+
     def get_chat_summary(self, data: Dict[str, Any]) -> str:
         primary = data.get("primary_diagnosis", {})
         code = primary.get("code")
         desc = primary.get("description")
+
+        if primary.get("code_valid") is False:
+            return f"**PAUSED**: *{code}* is not a valid ICD-10-CM code. Please confirm the diagnosis code."
         
         if code and desc:
             return f"**DIAGNOSIS PROPOSED**: *{code}* (*{desc}*)"
@@ -96,3 +125,15 @@ Analyze this clinical information and provide diagnosis codes.
             return "**PAUSED**: Insufficient data for definitive diagnosis. Clarification requested."
             
         return "Diagnosis analysis complete."
+
+    def decision(self, data: Dict[str, Any]) -> Any:
+        # The codes; justifications and reasoning may be reworded between debate rounds
+        def codes(entries):
+            return sorted(str(d.get("code")) for d in entries or [] if isinstance(d, dict) and d.get("code"))
+        primary = data.get("primary_diagnosis")
+        return {
+            "primary": primary.get("code") if isinstance(primary, dict) else None,
+            "secondary": codes(data.get("secondary_diagnoses")),
+            "ruled_out": codes(data.get("ruled_out")),
+            "clarification_needed": bool(data.get("clarification_needed"))
+        }
@@ -1,25 +1,35 @@
 from typing import Dict, Any, List
 from .base import BaseAgent
+from app.models.schemas import MedicationOutput
 import asyncio
 import json
 
 class MedicationManagementAgent(BaseAgent):
+    output_model = MedicationOutput
+    shares_transcript = True
+    inputs = {
+        "clinical_entity": ["current_medications", "presenting_symptoms", "substance_use", "medical_history"],
+        "diagnosis_mapping": ["primary_diagnosis", "secondary_diagnoses"]
+    }
+    input_token_budget = 1500
+
     def __init__(self, priority: int = 3):
         super().__init__(
             agent_id="medication_management",
             name="Medication Management Agent",
             priority=priority,
-            dependencies=["clinical_entity"],
+            dependencies=["clinical_entity", "diagnosis_mapping"], # Reviews the proposed diagnosis
             human_in_loop=True
         )
 
     def build_prompt(self, input_data: Dict[str, Any], context: Dict[str, Any]) -> str:
-        transcript = input_data.get("transcript", "")
-        
         return f"""
 You are a Medication Management Specialist.
 Identify medications and changes.
 
+INPUT DATA (clinical entities and the proposed diagnosis):
+{self.project_inputs(context)}
+
 **PEER REVIEW MODE**:
 You are collaborating with a Diagnosis Agent.
 1. Check the 'diagnosis_mapping' in the context.
@@ -65,8 +75,7 @@ IMPORTANT:
 - **PHRASING**: Ask "What is the specific dose of..." or "Please confirm frequency...".
 - **DO NOT** ask "Sarah, how much are you taking?".
 
-TRANSCRIPT:
-{transcript}
+The session TRANSCRIPT is at the top of this prompt.
 """
 
     def get_chat_summary(self, data: Dict[str, Any]) -> str:
@@ -85,3 +94,15 @@ TRANSCRIPT:
                 summary += f"**ADJUSTMENTS**: {', '.join(change_desc)}."
                 
         return summary.strip() or "Medication review complete."
+
+    def decision(self, data: Dict[str, Any]) -> Any:
+        # Regimen and changes; indications / rationale may be reworded between debate rounds
+        meds = sorted(
+            (str(m.get("generic_name") or m.get("name") or "").lower(), str(m.get("strength") or ""), str(m.get("frequency") or ""))
+            for m in data.get("medications", []) if isinstance(m, dict)
+        )
+        changes = sorted(
+            (str(c.get("medication") or "").lower(), str(c.get("change_type") or ""))
+            for c in data.get("changes_made", []) if isinstance(c, dict)
+        )
+        return {"medications": meds, "changes": changes, "clarification_needed": bool(data.get("clarification_needed"))}
@@ -1,9 +1,33 @@
 from typing import Dict, Any, List
 from .base import BaseAgent
+from app.models.schemas import SoapNoteOutput
 import asyncio
 import json
 
 class OutputGenerationAgent(BaseAgent):
+    output_model = SoapNoteOutput
+    # SOAP sections are long; stream them to the UI as they are written
+    stream_output = True
+    stream_fields = [("soap_note",)]
+
+    inputs = {
+        "safety_triage": ["risk_detected", "concerns", "summary"],
+        "clinical_entity": [
+            "presenting_symptoms", "mental_status_exam", "current_medications", "substance_use",
+            "past_psychiatric_history", "medical_history", "social_history",
+            "family_psychiatric_history", "functional_assessment", "assessment_scales"
+        ],
+        "diagnosis_mapping": ["primary_diagnosis", "secondary_diagnoses", "ruled_out"],
+        "risk_assessment": [
+            "risk_level", "suicidal_ideation_present", "max_ideation_severity", "suicidal_behavior_present",
+            "protective_factors", "risk_factors", "clinical_actions"
+        ],
+        "medication_management": ["medications", "changes_made"],
+        "treatment_planning": ["treatment_goals", "interventions", "referrals", "follow_up_plan"],
+        "procedure_coding": ["primary_code", "addon_codes", "modifiers"]
+    }
+    input_token_budget = 4000
+
     def __init__(self, priority: int = 6):
         super().__init__(
             agent_id="output_generation",
@@ -19,9 +43,7 @@ class OutputGenerationAgent(BaseAgent):
         )
 
     def build_prompt(self, input_data: Dict[str, Any], context: Dict[str, Any]) -> str:
-        # Collect all context
-        display_context = {k: v for k, v in context.items() if k not in ["user_clarifications"]}
-        full_context = json.dumps(display_context, indent=2)
+        full_context = self.project_inputs(context)
 
         return f"""
 You are a senior psychiatric scribe and documentation specialist. Your task is to synthesize all analyzed data into a professional, cohesive Psychiatric SOAP Note.
@@ -1,9 +1,20 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from .base import BaseAgent
+from app.models.schemas import ProcedureCodingOutput
+from app.core.code_index import cpt_index, check_code, invalid_code_question
+from app.core.time_coding import time_coder
 import asyncio
 import json
 
 class ProcedureCodingAgent(BaseAgent):
+    output_model = ProcedureCodingOutput
+    shares_transcript = True
+    inputs = {
+        "clinical_entity": ["presenting_symptoms", "current_medications", "assessment_scales"],
+        "diagnosis_mapping": ["primary_diagnosis", "secondary_diagnoses"]
+    }
+    input_token_budget = 1000
+
     def __init__(self, priority: int = 4):
         super().__init__(
             agent_id="procedure_coding",
@@ -13,16 +24,27 @@ class ProcedureCodingAgent(BaseAgent):
             human_in_loop=True
         )
 
+    def deterministic_output(self, input_data: Dict[str, Any], context: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        # Time-based codes for follow-up visits straight from the transcript; the LLM only
+        # sees ambiguous visits, and any visit the provider has already answered a question on
+        if time_coder is None or self.agent_id in context.get("user_clarifications", {}):
+            return None
+        diagnosis = context.get("diagnosis_mapping", {}).get("primary_diagnosis")
+        result = time_coder.code(input_data.get("transcript", ""), diagnosis)
+        if result.output is None:
+            print(f"DEBUG: {self.agent_id} rules deferred to the LLM ({result.reason}, {result.elapsed_ms}ms)")
+            return None
+        print(f"DEBUG: {self.agent_id} coded by rules in {result.elapsed_ms}ms: {result.output['primary_code']['code']}")
+        return result.output
+
     def build_prompt(self, input_data: Dict[str, Any], context: Dict[str, Any]) -> str:
-        transcript = input_data.get("transcript", "")
-        clinical_data = context.get("clinical", {})
-        diagnosis_data = context.get("diagnosis", {})
-        
-        # We need session date and patient info if available, but primarily transcript and clinical info for time/complexity
-        
+        # Time and services come from the transcript; diagnoses support medical necessity
         return f"""
 You are a psychiatric billing and coding specialist. Your task is to analyze the session and assign appropriate CPT codes for reimbursement.
 
+INPUT DATA (clinical entities and diagnoses):
+{self.project_inputs(context)}
+
 INFORMATION REQUIRED:
 1. Session Type (Initial vs Follow-up)
 2. Provider Type (Prescribing vs Non-prescribing)
@@ -68,14 +90,39 @@ IMPORTANT:
 - **PHRASING**: Ask "What was the total session time?" or "Please specify the duration...".
 - **DO NOT** ask the patient directly.
 
-TRANSCRIPT START:
-{transcript[:2000]}... (truncated for brevity if long)
+The session TRANSCRIPT is at the top of this prompt.
 """
 
+    def check_output(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        # Every code against the local CPT table; a made-up primary code goes back to the provider
+        for entry in [data.get("primary_code")] + list(data.get("addon_codes") or []):
+            if isinstance(entry, dict) and "-" in str(entry.get("code") or ""):
+                # "90834-95": keep the modifier where modifiers go
+                modifier = str(entry["code"]).split("-", 1)[1].strip()
+                modifiers = data.setdefault("modifiers", [])
+                if modifier and isinstance(modifiers, list) and modifier not in modifiers:
+                    modifiers.append(modifier)
+        verdict = check_code(cpt_index, data.get("primary_code"))
+        others = [check_code(cpt_index, c) for c in data.get("addon_codes") or []]
+        invalid = [v["code"] for v in [verdict] + others if v and not v["valid"]]
+        if invalid:
+            print(f"WARNING: {self.agent_id} returned invalid CPT codes: {invalid}")
+        unverified = [v["code"] for v in [verdict] + others if v and v["valid"] and not v.get("verified", True)]
+        if unverified:
+            print(f"WARNING: {self.agent_id} returned CPT codes missing from the local table (kept, unverified): {unverified}")
+        if verdict and not verdict["valid"] and not data.get("clarification_needed"):
+            question, answer = invalid_code_question(cpt_index, verdict)
+            data.update(clarification_needed=True, clarification_question=question, suggested_answer=answer)
+        return data
+
     def get_chat_summary(self, data: Dict[str, Any]) -> str:
         primary = data.get("primary_code")
+        if primary and primary.get("code_valid") is False:
+            return f"**PAUSED**: *{primary.get('code')}* is not a valid CPT code. Please confirm the procedure code."
         if primary:
-            return f"**CODE ASSIGNED**: *{primary.get('code')}* (*{primary.get('description', 'Procedure')}*)."
+            addons = "".join(f" + *{a.get('code')}*" for a in data.get("addon_codes") or [] if isinstance(a, dict))
+            source = " Coded from documented time." if data.get("coded_by") == "rules" else ""
+            return f"**CODE ASSIGNED**: *{primary.get('code')}*{addons} (*{primary.get('description', 'Procedure')}*).{source}"
         
         if data.get("clarification_needed"):
             return "**PAUSED**: Time/Duration missing. *Manual verification* required for CPT mapping."
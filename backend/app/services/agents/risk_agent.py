@@ -1,9 +1,13 @@
 from typing import Dict, Any, List
 from .base import BaseAgent
+from app.models.schemas import RiskAssessment
 import asyncio
 import json
 
 class RiskAssessmentAgent(BaseAgent):
+    output_model = RiskAssessment
+    shares_transcript = True
+
     def __init__(self, priority: int = 2):
         super().__init__(
             agent_id="risk_assessment",
@@ -14,7 +18,6 @@ class RiskAssessmentAgent(BaseAgent):
         )
 
     def build_prompt(self, input_data: Dict[str, Any], context: Dict[str, Any]) -> str:
-        transcript = input_data.get("transcript", "")
         return f"""
 You are a psychiatric risk assessment specialist trained in the Columbia-Suicide Severity Rating Scale (C-SSRS). Your task is to analyze the session transcript and complete a structured suicide risk assessment.
 
@@ -58,8 +61,7 @@ IMPORTANT:
 - **PHRASING**: Ask "Did the patient mention..." or "Please confirm if..." or "What is the..."
 - **DO NOT** ask "Sarah, do you..." or "How are you feeling?".
 
-TRANSCRIPT:
-{transcript}
+The session TRANSCRIPT is at the top of this prompt.
 """
 
     def get_chat_summary(self, data: Dict[str, Any]) -> str:
@@ -1,18 +1,23 @@
 from typing import Dict, Any, List
 from .base import BaseAgent
+from app.models.schemas import SafetyTriageOutput
 import asyncio
 
 class SafetyTriageAgent(BaseAgent):
+    output_model = SafetyTriageOutput
+    shares_transcript = True
+    hedge_requests = True # Every other result waits on triage
+
     def __init__(self, priority: int = 1):
         super().__init__(
             agent_id="safety_triage",
             name="Safety Triage Agent",
             priority=priority,
+            dependencies=["transcript"],
             human_in_loop=True
         )
 
     def build_prompt(self, input_data: Dict[str, Any], context: Dict[str, Any]) -> str:
-        transcript = input_data.get("transcript", "")
         return f"""
 You are a psychiatric safety specialist. Your CRITICAL task is to immediately identify any safety concerns in this session transcript that require urgent clinical attention.
 
@@ -53,8 +58,7 @@ IMPORTANT:
 
 If NO safety concerns are detected, return "risk_detected": false and an empty concerns list.
 
-TRANSCRIPT:
-{transcript}
+The session TRANSCRIPT is at the top of this prompt.
 """
 
     def get_chat_summary(self, data: Dict[str, Any]) -> str:
@@ -1,31 +1,29 @@
 from typing import Dict, Any, List
 from .base import BaseAgent
+from app.models.schemas import TreatmentPlanOutput
 import asyncio
 import json
 
 class TreatmentPlanningAgent(BaseAgent):
+    output_model = TreatmentPlanOutput
+    inputs = {
+        "diagnosis_mapping": ["primary_diagnosis", "secondary_diagnoses"],
+        "risk_assessment": ["risk_level", "risk_factors", "protective_factors", "clinical_actions"],
+        "medication_management": ["medications", "changes_made"],
+        "clinical_entity": ["presenting_symptoms", "functional_assessment", "social_history"]
+    }
+
     def __init__(self, priority: int = 5):
         super().__init__(
             agent_id="treatment_planning",
             name="Treatment Planning Agent",
             priority=priority,
-            dependencies=["diagnosis_mapping", "risk_assessment", "medication_management"],
+            dependencies=["clinical_entity", "diagnosis_mapping", "risk_assessment", "medication_management"],
             human_in_loop=True
         )
 
     def build_prompt(self, input_data: Dict[str, Any], context: Dict[str, Any]) -> str:
-        diagnosis_data = context.get("diagnosis", {})
-        risk_data = context.get("risk", {})
-        medication_data = context.get("medication", {})
-        clinical_data = context.get("clinical", {})
-        
-        # Format context for the LLM
-        context_str = json.dumps({
-            "diagnosis": diagnosis_data,
-            "risk_assessment": risk_data,
-            "medications": medication_data,
-            "clinical_entities": clinical_data
-        }, indent=2)
+        context_str = self.project_inputs(context)
 
         return f"""
 You are a psychiatric treatment planning specialist. Your task is to develop a comprehensive, actionable treatment plan based on the clinical analysis provided.
@@ -1,17 +1,20 @@
 from typing import Dict, Any
 from .base import BaseAgent
+from app.models.schemas import OrientationOutput
 
 class UserAssistAgent(BaseAgent):
+    output_model = OrientationOutput
+    shares_transcript = True
+
     def __init__(self, priority: int = 0):
         super().__init__(
             agent_id="user_assist",
             name="User Assist Agent",
             priority=priority,
-            dependencies=["transcript", "safety_risk"]
+            dependencies=["transcript"]
         )
 
     def build_prompt(self, input_data: Dict[str, Any], context: Dict[str, Any]) -> str:
-        transcript = input_data.get("transcript", "")
         
         return f"""
 You are the **Clinical Orientation Agent** for an advanced psychiatric scribe system.
@@ -34,12 +37,14 @@ Return ONLY a valid JSON object:
 
 AUDIENCE: You are speaking to the **MEDICAL PROVIDER**. Phrasing should be peer-to-peer and professional.
 
-TRANSCRIPT:
-{transcript}
+The session TRANSCRIPT is at the top of this prompt.
 """
 
     def parse_output(self, llm_output: str) -> Dict[str, Any]:
         import json
+        structured = self.parse_structured(llm_output)
+        if structured is not None:
+            return structured
         try:
             # Handle potential markdown formatting
             start_idx = llm_output.find('{')
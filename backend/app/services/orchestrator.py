@@ -1,8 +1,16 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime
 import asyncio
+import os
 import time
 from app.core.socket_manager import manager
 from app.core.blackboard_logger import blackboard_logger
+from app.core.session_context import current_session_id, current_usage
+from app.core.session_store import session_store
+from app.core.event_bus import Event, QueuedEventBus, event_bus
+from app.core.safety_screen import safety_screen
+from app.core.context_projection import MissingInputError
+from app.core.metrics import agent_queue_seconds, agent_execute_seconds, agent_runs_total
 from app.services.agents.base import BaseAgent
 from app.services.agents.safety_agent import SafetyTriageAgent
 from app.services.agents.clinical_agent import ClinicalEntityAgent
@@ -13,6 +21,17 @@ from app.services.agents.medication_agent import MedicationManagementAgent
 from app.services.agents.treatment_agent import TreatmentPlanningAgent
 from app.services.agents.output_agent import OutputGenerationAgent
 from app.services.agents.user_assist_agent import UserAssistAgent
+from app.services.scheduler import DagScheduler
+
+# Session commands on the process-wide bus. With a distributed bus, requested work is
+# picked up by exactly one worker; terminations reach every worker.
+WORKFLOW_REQUESTED = "WORKFLOW_REQUESTED"
+CLARIFICATION_SUBMITTED = "CLARIFICATION_SUBMITTED"
+SESSION_TERMINATED = "SESSION_TERMINATED"
+# How long a clarification waits for the worker that paused the session to persist it
+RESUME_SETTLE_TIMEOUT_S = 30
+# Send each agent run's stage timings to the UI (`agent_timings` messages); they are always logged
+AGENT_TIMINGS_TO_UI = os.environ.get("AGENT_TIMINGS_TO_UI", "off").lower() in ("1", "on", "true")
 
 class Orchestrator:
     def __init__(self):
@@ -28,68 +47,289 @@ class Orchestrator:
             "output_generation": OutputGenerationAgent(priority=1),
             "user_assist": UserAssistAgent(priority=10) # Orientation is high priority
         }
-        self.active_sessions: Dict[str, Any] = {}
-        self.terminated_sessions: set = set()
+        self.scheduler = DagScheduler(self.agents)
+        # Session state lives in the store (idle sessions spill to disk); running ones stay pinned in memory
+        self.sessions = session_store
+        self.sessions.on_evict(self._release_session_resources)
+        self._active_runs: Dict[str, int] = {} # Concurrent run_workflow calls per session
+        # Live meshes per session (bus + agents in flight), so the kill switch can abort them
+        self._meshes: Dict[str, List[Tuple[QueuedEventBus, Dict[str, asyncio.Event]]]] = {}
+        self.bus = event_bus
+
+    async def start(self):
+        """Subscribe to session commands and start consuming (app startup)."""
+        self.bus.subscribe(WORKFLOW_REQUESTED, self._on_workflow_requested)
+        self.bus.subscribe(CLARIFICATION_SUBMITTED, self._on_clarification_submitted)
+        if self.bus.distributed:
+            self.bus.subscribe_broadcast(SESSION_TERMINATED, self._on_session_terminated)
+        await self.bus.start()
+
+    async def request_workflow(self, input_data: Dict[str, Any], session_id: str):
+        """Queue a new analysis; whichever worker takes the event runs it."""
+        await self.bus.publish(Event(
+            topic=WORKFLOW_REQUESTED, sender_id="api",
+            data={"session_id": session_id, "input_data": input_data}
+        ))
+
+    async def request_clarification(self, session_id: str, agent_id: str, answer: str):
+        await self.bus.publish(Event(
+            topic=CLARIFICATION_SUBMITTED, sender_id="api",
+            data={"session_id": session_id, "agent_id": agent_id, "answer": answer}
+        ))
 
-    async def run_workflow(self, input_data: Dict[str, Any], session_id: str = None):
+    async def _on_workflow_requested(self, event: Event):
+        await self.run_workflow(event.data["input_data"], event.data["session_id"])
+
+    async def _on_clarification_submitted(self, event: Event):
+        await self.submit_clarification(event.data["session_id"], event.data["agent_id"], event.data["answer"])
+
+    async def _on_session_terminated(self, event: Event):
+        """Another worker terminated a session: stop it here if this worker is running it."""
+        session_id = event.data["session_id"]
+        if session_id in self._active_runs:
+            session_state = await self.sessions.get(session_id)
+            session_state["status"] = "terminated"
+            await self._abort_meshes(session_id)
+
+    async def run_workflow(self, input_data: Dict[str, Any], session_id: str = None, resume_from: Optional[str] = None):
+        """
+        Runs the agent mesh for a session.
+        If `resume_from` names an agent with a paused checkpoint, only that agent is
+        re-triggered and the mesh continues downstream from it; everything else keeps
+        its checkpointed output.
+        """
         if not session_id:
              import uuid
              session_id = str(uuid.uuid4())
+        current_session_id.set(session_id) # Routes broadcasts from this run to the session's channel
 
-        if session_id not in self.active_sessions:
-            self.active_sessions[session_id] = {
+        session_state = await self.sessions.get(session_id)
+        if session_state is None:
+            session_state = {
                 "input_data": input_data,
                 "context": {},
                 "status": "running"
             }
+            await self.sessions.put(session_id, session_state)
+        elif session_state["status"] != "terminated":
+            session_state["status"] = "running" # Pins the session in memory while agents run
+        self._active_runs[session_id] = self._active_runs.get(session_id, 0) + 1
         
-        session_state = self.active_sessions[session_id]
         context = session_state["context"]
+        checkpoints = context.setdefault("checkpoints", {})
 
         # --- EVENT MESH INITIALIZATION ---
-        from app.core.event_bus import EventBus, Event
+        from app.core.event_bus import build_mesh_bus
         from app.services.agents.administrator_agent import AdministratorAgent
         
-        bus = EventBus()
-        administrator = AdministratorAgent()
-        
-        # Subscribe Agents (Dynamic)
-        # DEBATE MODE ACTIVATED: Diagnosis & Medication listen to each other
-        self.agents["user_assist"].listen_for = ["TRANSCRIPT_READY"]
-        self.agents["safety_triage"].listen_for = ["ORIENTATION_COMPLETE"]
-        self.agents["clinical_entity"].listen_for = ["SAFETY_CLEARED"]
-        
-        self.agents["diagnosis_mapping"].listen_for = ["CLINICAL_EXTRACTED", "MEDICATION_CHECKED"] # Listens to Meds!
-        
-        self.agents["risk_assessment"].listen_for = ["DIAGNOSIS_PROPOSED"]
-        self.agents["procedure_coding"].listen_for = ["RISK_ASSESSED"]
-        
-        self.agents["medication_management"].listen_for = ["DIAGNOSIS_PROPOSED", "PROCEDURE_CODED"] # Listens to Dx!
-        
-        self.agents["treatment_planning"].listen_for = ["MEDICATION_CHECKED"]
-        self.agents["output_generation"].listen_for = ["TREATMENT_PLANNED"]
+        # Events are queued and drained by a bounded worker pool; publishing never waits on the downstream pipeline
+        bus = build_mesh_bus()
+        # LLM-call / wall-clock budget is session-wide, so it survives pauses and restarts
+        administrator = AdministratorAgent(usage=session_state.setdefault("usage", {}))
+        current_usage.set(session_state["usage"]) # Agents add their token counts (cached vs uncached)
 
-        # Helper to run an agent in the mesh
-        async def run_agent_task(event: Event):
-            # Check for termination
-            if session_id in self.terminated_sessions:
-                print(f"DEBUG: Session {session_id} TERMINATED. Skipping task for {event.topic}")
+        # Per-run scheduling state
+        # DEBATE MODE: Diagnosis & Medication re-wake each other via peer_review links
+        agent_locks = {agent_id: asyncio.Lock() for agent_id in self.agents} # One run per agent at a time
+        in_flight: Dict[str, asyncio.Event] = {} # Set when the agent finishes its current run
+        safety_alert = asyncio.Event() # A SAFETY ALERT has gone out (pre-screen or risk_detected streamed by triage)
+        budget_stop: List[str] = [] # Set once the Administrator has stopped this run for budget
+        mesh = (bus, in_flight)
+        self._meshes.setdefault(session_id, []).append(mesh)
+
+        def safety_cleared() -> bool:
+            # Only the triage agent opens the gate; the pre-screen can only keep it closed
+            return checkpoints.get("safety_triage", {}).get("status") == "completed"
+
+        async def publish_result(agent_id: str):
+            """Release an agent's result: team chat summary, then the bus event (via the Administrator)."""
+            if session_state["status"] == "terminated":
+                return # Killed while this result was waiting on the safety gate
+            if checkpoints[agent_id].get("published"):
+                return # Already released by the gate opening while this agent was finishing
+            agent = self.agents[agent_id]
+            output_data = context[agent_id]
+            checkpoints[agent_id]["published"] = True
+
+            # --- BROADCAST AGENT SUMMARY TO TEAM CHAT ---
+            # Use the agent's get_chat_summary method
+            chat_text = agent.get_chat_summary(output_data)
+            await manager.broadcast({
+                "type": "chat_message", 
+                "text": chat_text, 
+                "sender": agent.name, 
+                "agent_id": agent.agent_id,
+                "variant": "agent"
+            })
+
+            new_event = Event(
+                topic=self.scheduler.topic_for(agent_id), 
+                sender_id=agent_id, 
+                data=output_data,
+                sender_priority=agent.priority
+            )
+            
+            # Check with Administrator before publishing
+            directive = await administrator.monitor(new_event, context)
+            
+            # Log administrator decision
+            await blackboard_logger.log_administrator_decision(
+                session_id=session_id,
+                directive=directive["directive"],
+                reason=directive.get("reason", ""),
+                winner_id=directive.get("winner_id"),
+                loop_detected=directive.get("loop_detected", False)
+            )
+            
+            if directive["directive"] == "STOP":
+                await blackboard_logger.log_workflow_event(session_id, "WORKFLOW_COMPLETE", {"reason": "administrator_stop"})
+                await manager.broadcast({"type": "workflow_complete", "data": context, "session_id": session_id})
+                return
+            elif directive["directive"] == "PAUSE":
+                await manager.broadcast({"type": "chat_message", "text": f"**ADMIN PAUSE**: {directive['reason']}", "sender": "Administrator", "variant": "system"})
                 return
+            elif directive["directive"] == "RESOLVED":
+                await manager.broadcast({
+                    "type": "chat_message", 
+                    "text": f"👨‍⚖️ **ADMIN RULING**: {directive['reason']} Target: *{directive['winner_id']}*.", 
+                    "sender": "Administrator", 
+                    "variant": "consultant"
+                })
+                
+                # FORCE WINNER: Only publish if this agent IS the winner
+                if agent_id == directive['winner_id']:
+                     await bus.publish(new_event)
+                else:
+                     # LOSER: Silenced. Do not publish.
+                     await manager.broadcast({"type": "chat_message", "text": f"Agent *{agent.name}* silenced by Administrator.", "sender": "System", "variant": "system"})
+                
+                return
+            
+            # DEFAULT: CONTINUE
+            await bus.publish(new_event)
+            # Note: Agent status is set to 'idle' by frontend when chat_message is received
 
-            print(f"DEBUG: run_agent_task triggered for event {event.topic}")
-            # Log incoming event
+        async def release_held_results():
+            """Publish results that finished while the safety gate was still closed."""
+            held = [
+                agent_id for agent_id, checkpoint in checkpoints.items()
+                if checkpoint["status"] == "completed" and not checkpoint.get("published", True)
+            ]
+            if held:
+                print(f"DEBUG: Safety cleared. Releasing held results from {held}")
+                await asyncio.gather(*[publish_result(agent_id) for agent_id in held])
+
+        async def budget_exhausted() -> bool:
+            """Checked before every LLM call: a session over budget runs no more agents."""
+            reason = administrator.budget_exceeded()
+            if reason is None:
+                return False
+            if not budget_stop:
+                budget_stop.append(reason)
+                session_state["usage"]["exhausted"] = reason
+                print(f"DEBUG: Session {session_id} stopped by Administrator: {reason}")
+                await blackboard_logger.log_administrator_decision(
+                    session_id=session_id,
+                    directive="STOP",
+                    reason=reason,
+                    winner_id=None,
+                    loop_detected=False
+                )
+                await manager.broadcast({"type": "chat_message", "text": f"**BUDGET STOP**: {reason} Remaining agents skipped.", "sender": "Administrator", "variant": "system"})
+            return True
+
+        def partial_forwarder(agent_id: str):
+            """Relay streamed sections (e.g. SOAP note) to the UI while the agent is still writing."""
+            async def on_partial(kind: str, path: tuple, value: Any):
+                if len(path) < 2 or not isinstance(value, str):
+                    return
+                await manager.broadcast({
+                    "type": "output_partial",
+                    "session_id": session_id,
+                    "agent_id": agent_id,
+                    "section": path[-1],
+                    "kind": "fragment" if kind == "fragment" else "complete",
+                    "text": value
+                })
+            return on_partial
+
+        def field_watcher(agent_id: str):
+            """Act on early top-level fields before the agent has finished writing its output."""
+            async def on_field(key: str, value: Any):
+                if agent_id == "safety_triage" and key == "risk_detected" and value is True and not safety_alert.is_set():
+                    safety_alert.set()
+                    print(f"DEBUG: Safety risk streamed for {session_id}. Alerting before triage completes.")
+                    await blackboard_logger.log_event(
+                        session_id=session_id,
+                        level="AGENT_COMPLETE",
+                        event_type="SAFETY_ALERT",
+                        data={"in_flight": list(in_flight.keys())},
+                        agent_id=agent_id
+                    )
+                    await manager.broadcast({
+                        "type": "chat_message",
+                        "text": "**SAFETY ALERT**: Risk flagged during triage. Other findings are held until safety review completes.",
+                        "sender": "Supervisor",
+                        "variant": "consultant"
+                    })
+            return on_field
+
+        async def prescreen():
+            """Deterministic safety pass over the transcript before any agent runs."""
+            if safety_screen is None:
+                return
+            result = safety_screen.screen(input_data.get("transcript", ""))
+            session_state["safety_screen"] = result.to_dict()
             await blackboard_logger.log_event(
                 session_id=session_id,
-                level="EVENT",
-                event_type=event.topic,
-                data={"sender_id": event.sender_id, "payload_keys": list(event.data.keys()) if event.data else []}
+                level="AGENT_COMPLETE",
+                event_type="SAFETY_PRESCREEN",
+                data=session_state["safety_screen"],
+                agent_id="safety_triage"
             )
-            
-            # Find agents listening to this topic
-            for agent_id, agent in self.agents.items():
-                should_run = await agent.react(event, context)
-                if should_run:
+            print(f"DEBUG: Safety pre-screen for {session_id}: {result.verdict} ({len(result.hits)} hits, {result.elapsed_ms} ms)")
+            if result.verdict == "explicit":
+                safety_alert.set() # Results stay held until triage; don't alert twice
+                phrases = sorted({hit.phrase for hit in result.hits if hit.tier == "explicit" and not hit.negated})
+                await manager.broadcast({
+                    "type": "chat_message",
+                    "text": f"**SAFETY ALERT**: Transcript states {', '.join(f'*{p}*' for p in phrases)}. Other findings are held until safety review completes.",
+                    "sender": "Supervisor",
+                    "variant": "consultant"
+                })
+
+        async def run_agent(agent_id: str, event: Event):
+            agent = self.agents[agent_id]
+            current_session_id.set(session_id) # Attributes LLM calls made by this task
+            current_usage.set(session_state["usage"])
+            done = in_flight[agent_id] = asyncio.Event()
+            try:
+                async with agent_locks[agent_id]:
+                    if session_state["status"] == "terminated":
+                        return
+                    if not self.scheduler.is_ready(agent_id, input_data, context):
+                        return
+
+                    fingerprint = agent.input_fingerprint(input_data, context)
+                    checkpoint = checkpoints.get(agent_id)
+                    if (checkpoint and checkpoint["fingerprint"] == fingerprint and agent_id in context and checkpoint["status"] != "error"):
+                        # Inputs unchanged since the last run: the stored output (or the open
+                        # clarification question) stands, skip the LLM
+                        print(f"DEBUG: Agent {agent_id} inputs unchanged. Keeping {checkpoint['status']} checkpoint.")
+                        await blackboard_logger.log_event(
+                            session_id=session_id,
+                            level="AGENT_COMPLETE",
+                            event_type="CHECKPOINT_REUSED",
+                            data={"trigger": event.topic, "status": checkpoint["status"], "checkpoint_at": checkpoint["updated_at"]},
+                            agent_id=agent_id
+                        )
+                        return
+
+                    if await budget_exhausted():
+                        return
+
                     print(f"DEBUG: Agent {agent_id} WAKING UP for {event.topic}")
+                    agent_queue_seconds.labels(agent_id).observe((datetime.now() - event.timestamp).total_seconds())
                     # Log agent start
                     start_time = time.time()
                     await blackboard_logger.log_agent_execution(
@@ -103,38 +343,82 @@ class Orchestrator:
                     await manager.broadcast({"type": "chat_message", "text": f"{agent.name} reacting to {event.topic}...", "sender": "System", "variant": "system"})
                     await self._broadcast_agent_status(agent.agent_id, "running")
                     
+                    execute_started = time.perf_counter()
                     try:
-                        output = await agent.execute(input_data, context)
+                        on_partial = partial_forwarder(agent_id) if agent.stream_output else None
+                        output = await agent.execute(input_data, context, on_partial=on_partial, on_field=field_watcher(agent_id))
                         print(f"DEBUG: Agent {agent_id} COMPLETED with status {output.status}")
+                    except MissingInputError as e:
+                        # Wiring fault, not a model failure: handled as a failed run below, so
+                        # nothing is published, dependents stay asleep and the session pauses
+                        print(f"ERROR: Agent {agent_id} is missing a required input: {e}")
+                        output = agent.create_error_output(f"Missing input: {e}")
                     except Exception as e:
                         print(f"ERROR: Agent {agent_id} failed during execution: {e}")
                         import traceback
                         traceback.print_exc()
+                        agent_runs_total.labels(agent_id, "failed").inc()
                         return
+                    finally:
+                        agent_execute_seconds.labels(agent_id).observe(time.perf_counter() - execute_started)
+                    agent_runs_total.labels(agent_id, output.status).inc()
                     duration_ms = int((time.time() - start_time) * 1000)
+                    output_data = output.data
                     
                     # Log agent completion
                     await blackboard_logger.log_agent_execution(
                         session_id=session_id,
                         agent_id=agent_id,
                         phase="complete",
-                        output_data=output.data,
-                        duration_ms=duration_ms
+                        output_data=output_data,
+                        llm_response=output.raw_response,
+                        duration_ms=duration_ms,
+                        timings=output.timings
                     )
+                    if AGENT_TIMINGS_TO_UI:
+                        await manager.broadcast({"type": "agent_timings", "agent_id": agent_id, "timings": output.timings})
                     
-                    # Update Context
-                    context[agent_id] = output.data
-                    
-                    # --- BROADCAST AGENT SUMMARY TO TEAM CHAT ---
-                    # Use the agent's get_chat_summary method
-                    chat_text = agent.get_chat_summary(output.data)
-                    await manager.broadcast({
-                        "type": "chat_message", 
-                        "text": chat_text, 
-                        "sender": agent.name, 
-                        "agent_id": agent.agent_id,
-                        "variant": "agent"
-                    })
+                    # Update Context (a failed run leaves no output for others to read)
+                    failed = output.status == "error"
+                    if failed:
+                        context.pop(agent_id, None)
+                    else:
+                        context[agent_id] = output_data
+
+                    # Special Safety Check Override Logic
+                    paused = bool(output_data.get("clarification_needed"))
+                    safety_stop = False
+                    if agent_id == "safety_triage" and output_data.get("risk_detected") and not paused:
+                        # Check Orientation for Override (it runs in parallel, so wait for it)
+                        if "user_assist" in in_flight:
+                            await in_flight["user_assist"].wait()
+                        orientation = context.get("user_assist", {})
+                        if orientation.get("validation_result") == "approved":
+                            await manager.broadcast({"type": "chat_message", "text": "Safety Override: Clinical Context confirmed.", "sender": "Supervisor", "variant": "consultant"})
+                        else:
+                            safety_stop = True
+
+                    # Fixed point: the re-run reached the same decision that is already out
+                    # (e.g. a peer review that didn't change the diagnosis). Publishing it again
+                    # would only re-wake the debate partner for another round.
+                    decision = agent.decision_digest(output_data)
+                    converged = bool(
+                        checkpoint and checkpoint.get("published") and checkpoint["status"] == "completed"
+                        and checkpoint.get("decision") == decision and not (paused or safety_stop)
+                    )
+
+                    # Checkpoint: what this output was computed from, how to re-trigger it, and
+                    # whether it has been released yet. Written before any await so the safety
+                    # gate is never observed half-updated.
+                    checkpoints[agent_id] = {
+                        "status": "paused" if paused or safety_stop else "error" if failed else "completed",
+                        "fingerprint": fingerprint,
+                        "decision": decision,
+                        "trigger_topic": event.topic,
+                        "trigger_sender": event.sender_id,
+                        "published": converged,
+                        "updated_at": datetime.now().isoformat()
+                    }
                     
                     # Log context snapshot after significant agents
                     await blackboard_logger.log_context_snapshot(
@@ -143,131 +427,252 @@ class Orchestrator:
                         trigger=f"after_{agent_id}",
                         agent_id=agent_id
                     )
-                    
-                    # Handle Clarification (Pause Mesh)
-                    if output.data.get("clarification_needed"):
-                        # Log clarification request
-                        await blackboard_logger.log_clarification(
-                            session_id=session_id,
-                            agent_id=agent.agent_id,
-                            question=output.data.get("clarification_question"),
-                            suggested_answer=output.data.get("suggested_answer")
-                        )
-                        
-                        await manager.broadcast({
-                            "type": "workflow_pause",
-                            "reason": "Clarification Requested",
-                            "session_id": session_id,
-                            "agent_id": agent.agent_id,
-                            "question": output.data.get("clarification_question"),
-                            "suggested_answer": output.data.get("suggested_answer"),
-                            "data": output.data
-                        })
-                        return # Stop this branch
-
-                    # Success: Publish next event
-                    # Map agent to output topic (Simplified for MVP)
-                    topic_map = {
-                        "user_assist": "ORIENTATION_COMPLETE",
-                        "safety_triage": "SAFETY_CLEARED", # Assuming safety pass
-                        "clinical_entity": "CLINICAL_EXTRACTED",
-                        "diagnosis_mapping": "DIAGNOSIS_PROPOSED",
-                        "risk_assessment": "RISK_ASSESSED",
-                        "procedure_coding": "PROCEDURE_CODED",
-                        "medication_management": "MEDICATION_CHECKED",
-                        "treatment_planning": "TREATMENT_PLANNED",
-                        "output_generation": "OUTPUT_GENERATED"
-                    }
-                    
-                    next_topic = topic_map.get(agent_id, "UNKNOWN_EVENT")
-                    
-                    # Special Safety Check Override Logic
-                    if agent_id == "safety_triage" and output.data.get("risk_detected"):
-                         # Check Orientation for Override
-                         orientation = context.get("user_assist", {})
-                         if orientation.get("validation_result") == "approved":
-                             await manager.broadcast({"type": "chat_message", "text": "Safety Override: Clinical Context confirmed.", "sender": "Supervisor", "variant": "consultant"})
-                             next_topic = "SAFETY_CLEARED" # Force proceed
-                         else:
-                             # HARD STOP - Track who triggered the safety check for debate
-                             triggering_agent_id = event.sender_id if event.sender_id != "system" else "user_assist"
-                             await manager.broadcast({
-                                 "type": "workflow_pause", 
-                                 "reason": "SAFETY STOP", 
-                                 "session_id": session_id, 
-                                 "agent_id": "safety_triage", 
-                                 "triggering_agent_id": triggering_agent_id,  # Debate owner
-                                 "data": output.data, 
-                                 "question": "Safety Risk Detected. Verify?"
-                             })
-                             return
-
-                    new_event = Event(
-                        topic=next_topic, 
-                        sender_id=agent_id, 
-                        data=output.data,
-                        sender_priority=agent.priority
-                    )
-                    
-                    # Check with Administrator before publishing
-                    directive = await administrator.monitor(new_event, context)
-                    
-                    # Log administrator decision
-                    await blackboard_logger.log_administrator_decision(
+            finally:
+                done.set()
+                if in_flight.get(agent_id) is done:
+                    del in_flight[agent_id]
+
+            # --- PUBLICATION (outside the agent lock so debate partners can re-wake us) ---
+
+            # Failed run (LLM unavailable, circuit open, ...): nothing is published, so dependents
+            # stay asleep; a safety triage failure also keeps the safety gate closed. Pause so the
+            # user can retry the agent once the backend recovers.
+            if failed:
+                error = output_data.get("error", "unknown error")
+                await blackboard_logger.log_event(
+                    session_id=session_id,
+                    level="ERROR",
+                    event_type="AGENT_ERROR",
+                    data={"error": error, "trigger": event.topic},
+                    agent_id=agent_id
+                )
+                await self._broadcast_agent_status(agent_id, "error", output_data)
+                if agent_id == "safety_triage":
+                    await manager.broadcast({
+                        "type": "chat_message",
+                        "text": f"**SAFETY ALERT**: Safety triage could not run ({error}). All findings are held until it completes.",
+                        "sender": "Supervisor",
+                        "variant": "consultant"
+                    })
+                await manager.broadcast({
+                    "type": "workflow_pause",
+                    "reason": "SAFETY TRIAGE FAILED" if agent_id == "safety_triage" else "Agent Error",
+                    "session_id": session_id,
+                    "agent_id": agent_id,
+                    "question": f"{agent.name} failed: {error}. Retry?",
+                    "suggested_answer": "Retry.",
+                    "data": output_data
+                })
+                return
+
+            # Handle Clarification (Pause Mesh)
+            if paused:
+                await manager.broadcast({
+                    "type": "chat_message", 
+                    "text": agent.get_chat_summary(output_data), 
+                    "sender": agent.name, 
+                    "agent_id": agent.agent_id,
+                    "variant": "agent"
+                })
+                # Log clarification request
+                await blackboard_logger.log_clarification(
+                    session_id=session_id,
+                    agent_id=agent.agent_id,
+                    question=output_data.get("clarification_question"),
+                    suggested_answer=output_data.get("suggested_answer")
+                )
+                
+                await manager.broadcast({
+                    "type": "workflow_pause",
+                    "reason": "Clarification Requested",
+                    "session_id": session_id,
+                    "agent_id": agent.agent_id,
+                    "question": output_data.get("clarification_question"),
+                    "suggested_answer": output_data.get("suggested_answer"),
+                    "data": output_data
+                })
+                return # Stop this branch
+
+            if safety_stop:
+                await manager.broadcast({
+                    "type": "chat_message", 
+                    "text": agent.get_chat_summary(output_data), 
+                    "sender": agent.name, 
+                    "agent_id": agent.agent_id,
+                    "variant": "agent"
+                })
+                # HARD STOP - Track who triggered the safety check for debate
+                # Held results from the parallel branches stay unpublished.
+                if session_state.get("safety_screen", {}).get("verdict") == "clear":
+                    # Lexicon miss: the pre-screen saw only screened denials
+                    await blackboard_logger.log_event(
                         session_id=session_id,
-                        directive=directive["directive"],
-                        reason=directive.get("reason", ""),
-                        winner_id=directive.get("winner_id"),
-                        loop_detected=directive.get("loop_detected", False)
+                        level="AGENT_COMPLETE",
+                        event_type="SAFETY_PRESCREEN_OVERRULED",
+                        data={"hits": [hit["phrase"] for hit in session_state["safety_screen"]["hits"]]},
+                        agent_id=agent_id
                     )
-                    
-                    if directive["directive"] == "STOP":
-                        await blackboard_logger.log_workflow_event(session_id, "WORKFLOW_COMPLETE", {"reason": "administrator_stop"})
-                        await manager.broadcast({"type": "workflow_complete", "data": context, "session_id": session_id})
-                        return
-                    elif directive["directive"] == "PAUSE":
-                        await manager.broadcast({"type": "chat_message", "text": f"**ADMIN PAUSE**: {directive['reason']}", "sender": "Administrator", "variant": "system"})
-                        return
-                    elif directive["directive"] == "RESOLVED":
-                        await manager.broadcast({
-                            "type": "chat_message", 
-                            "text": f"👨‍⚖️ **ADMIN RULING**: {directive['reason']} Target: *{directive['winner_id']}*.", 
-                            "sender": "Administrator", 
-                            "variant": "consultant"
-                        })
-                        
-                        # FORCE WINNER: Only publish if this agent IS the winner
-                        if agent_id == directive['winner_id']:
-                             await bus.publish(new_event)
-                        else:
-                             # LOSER: Silenced. Do not publish.
-                             await manager.broadcast({"type": "chat_message", "text": f"Agent *{agent.name}* silenced by Administrator.", "sender": "System", "variant": "system"})
-                        
-                        return
-                    
-                    # DEFAULT: CONTINUE
-                    await bus.publish(new_event)
-                    # Note: Agent status is set to 'idle' by frontend when chat_message is received
+                triggering_agent_id = event.sender_id if event.sender_id != "system" else "user_assist"
+                await manager.broadcast({
+                    "type": "workflow_pause", 
+                    "reason": "SAFETY STOP", 
+                    "session_id": session_id, 
+                    "agent_id": "safety_triage", 
+                    "triggering_agent_id": triggering_agent_id,  # Debate owner
+                    "data": output_data, 
+                    "question": "Safety Risk Detected. Verify?"
+                })
+                return
 
-        # Wire the helper to the bus (Wildcard listener for simulator)
+            if converged:
+                print(f"DEBUG: Agent {agent_id} converged after {event.topic}. Not re-publishing.")
+                await blackboard_logger.log_event(
+                    session_id=session_id,
+                    level="AGENT_COMPLETE",
+                    event_type="DEBATE_CONVERGED",
+                    data={"trigger": event.topic, "trigger_sender": event.sender_id},
+                    agent_id=agent_id
+                )
+                await manager.broadcast({
+                    "type": "chat_message",
+                    "text": f"{agent.get_chat_summary(output_data)} *(unchanged after review by {event.sender_id}; debate converged)*",
+                    "sender": agent.name,
+                    "agent_id": agent.agent_id,
+                    "variant": "agent"
+                })
+                return
+
+            if agent_id == "safety_triage":
+                # Gate open: release our own verdict, then everything that was waiting on it
+                await publish_result(agent_id)
+                await release_held_results()
+                return
+
+            # Safety gating: results stay on the blackboard unpublished until safety clears
+            if agent_id != "user_assist" and not safety_cleared():
+                print(f"DEBUG: Agent {agent_id} result held until safety clears.")
+                await blackboard_logger.log_event(
+                    session_id=session_id,
+                    level="AGENT_COMPLETE",
+                    event_type="RESULT_HELD",
+                    data={"reason": "awaiting_safety_clearance"},
+                    agent_id=agent_id
+                )
+                return
+
+            await publish_result(agent_id)
+
+        # Helper to dispatch a bus event to the agents it unblocks
+        async def run_agent_task(event: Event):
+            # Check for termination
+            if session_state["status"] == "terminated":
+                print(f"DEBUG: Session {session_id} TERMINATED. Skipping task for {event.topic}")
+                return
+
+            print(f"DEBUG: run_agent_task triggered for event {event.topic}")
+            # Log incoming event
+            await blackboard_logger.log_event(
+                session_id=session_id,
+                level="EVENT",
+                event_type=event.topic,
+                data={"sender_id": event.sender_id, "payload_keys": list(event.data.keys()) if event.data else []}
+            )
+
+            # DAG wiring: downstream agents of the sender, plus any explicit listen_for subscribers
+            candidates = self.scheduler.wakes(event)
+            if not event.target_id:
+                for agent_id, agent in self.agents.items():
+                    if agent_id not in candidates and await agent.react(event, context):
+                        candidates.append(agent_id)
+
+            # Independent agents run concurrently
+            await asyncio.gather(*[run_agent(agent_id, event) for agent_id in candidates])
 
         # Wire the helper to the bus (Wildcard listener for simulator)
         # In real mesh, agents bind their own specific handlers.
         # Here, we bind the generic runner to ALL topics to dispatch to agents.
         bus.subscribe("*", run_agent_task)
 
-        # Kickoff
-        await blackboard_logger.log_workflow_event(session_id, "WORKFLOW_START", {"input_keys": list(input_data.keys())})
-        await manager.broadcast({"type": "workflow_start", "message": "Agent Mesh Activated", "session_id": session_id})
-        start_event = Event(topic="TRANSCRIPT_READY", sender_id="system", data=input_data)
-        await bus.publish(start_event)
+        try:
+            # Resume: re-deliver the paused agent's original trigger to that agent only
+            checkpoint = checkpoints.get(resume_from) if resume_from else None
+            if checkpoint and checkpoint["status"] in ("paused", "error"):
+                await blackboard_logger.log_workflow_event(session_id, "WORKFLOW_RESUME", {
+                    "resume_from": resume_from,
+                    "trigger_topic": checkpoint["trigger_topic"],
+                    "checkpointed_agents": [a for a, c in checkpoints.items() if c["status"] == "completed"]
+                })
+                resume_event = Event(
+                    topic=checkpoint["trigger_topic"],
+                    sender_id=checkpoint["trigger_sender"],
+                    data=context.get(checkpoint["trigger_sender"], input_data),
+                    target_id=resume_from
+                )
+                await bus.publish(resume_event)
+                await bus.join()
+                return
+
+            # Kickoff
+            await blackboard_logger.log_workflow_event(session_id, "WORKFLOW_START", {"input_keys": list(input_data.keys())})
+            await manager.broadcast({"type": "workflow_start", "message": "Agent Mesh Activated", "session_id": session_id})
+            await prescreen()
+            start_event = Event(topic="TRANSCRIPT_READY", sender_id="system", data=input_data)
+            await bus.publish(start_event)
+            await bus.join() # Mesh is quiet: every event and everything it woke has been handled
+        finally:
+            await bus.close()
+            administrator.close_run()
+            meshes = self._meshes.get(session_id, [])
+            if mesh in meshes:
+                meshes.remove(mesh)
+            if not meshes:
+                self._meshes.pop(session_id, None)
+            await self._finish_run(session_id, session_state)
+
+    async def _finish_run(self, session_id: str, session_state: Dict[str, Any]):
+        """Settle the session status once the mesh is quiet and persist a snapshot (paused sessions survive restarts)."""
+        self._active_runs[session_id] -= 1
+        if self._active_runs[session_id] > 0:
+            return # Another run (e.g. a clarification resume) is still going
+        del self._active_runs[session_id]
+
+        if session_state["status"] != "terminated":
+            checkpoints = session_state["context"].get("checkpoints", {})
+            paused = any(c["status"] in ("paused", "error") for c in checkpoints.values())
+            session_state["status"] = "paused" if paused else "completed"
+        await self.sessions.save(session_id, session_state)
+        await self.sessions.sweep() # Now unpinned; evict if memory is over budget
+
+    async def _release_session_resources(self, session_id: str, session_state: Dict[str, Any]):
+        """Session left memory: close its log writer and drop its socket replay buffer."""
+        print(f"DEBUG: Session {session_id} evicted from memory ({session_state.get('status')})")
+        await blackboard_logger.close_session(session_id)
+        manager.close_channel(session_id)
+
+    async def _load_for_resume(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """
+        The session's latest state. With several workers, the one that paused it may still be
+        finishing its run; wait (bounded) for its snapshot rather than resuming a stale copy.
+        """
+        if not self.bus.distributed:
+            return await self.sessions.get(session_id)
+        deadline = time.monotonic() + RESUME_SETTLE_TIMEOUT_S
+        while True:
+            session_state = await self.sessions.get(session_id, refresh=True)
+            settled = session_state is not None and (session_state["status"] != "running" or session_id in self._active_runs)
+            if settled or time.monotonic() > deadline:
+                return session_state
+            await asyncio.sleep(0.5)
 
     async def submit_clarification(self, session_id: str, agent_id: str, answer: str):
-        if session_id not in self.active_sessions:
+        session_state = await self._load_for_resume(session_id)
+        if session_state is None:
             raise ValueError("Session not found")
+        if session_state["status"] == "terminated":
+            raise ValueError("Session terminated")
         
-        session_state = self.active_sessions[session_id]
         context = session_state["context"]
+        current_session_id.set(session_id)
         
         # Store clarification
         if "user_clarifications" not in context:
@@ -290,16 +695,10 @@ class Orchestrator:
             "variant": "user"
         })
 
-        # Resume Workflow
-        session_state["status"] = "running"
-        await self.run_workflow(session_state["input_data"], session_id)
+        # Resume Workflow from the paused (or failed) agent (upstream checkpoints are kept). Completion is
+        # announced by the Administrator's STOP on OUTPUT_GENERATED, as on the initial run.
+        await self.run_workflow(session_state["input_data"], session_id, resume_from=agent_id)
 
-        # 4. Finish
-        await blackboard_logger.log_workflow_event(session_id, "WORKFLOW_COMPLETE", {"reason": "normal_completion"})
-        await manager.broadcast({
-            "type": "workflow_complete",
-            "data": context
-        })
     async def _broadcast_agent_status(self, agent_id: str, status: str, data: Any = None):
         await manager.broadcast({
             "type": "agent_update",
@@ -308,20 +707,42 @@ class Orchestrator:
             "data": data
         })
 
-    async def terminate_session(self, session_id: str):
-        if session_id in self.active_sessions:
-            self.terminated_sessions.add(session_id)
-            self.active_sessions[session_id]["status"] = "terminated"
-            
+    async def _abort_meshes(self, session_id: str) -> Dict[str, Any]:
+        """Cancel this worker's runs of a session: queued events are dropped, running agents (and their LLM streams) cancelled."""
+        aborted = {"queued_events": 0, "running_handlers": 0, "running_agents": []}
+        for bus, in_flight in list(self._meshes.get(session_id, [])):
+            aborted["running_agents"].extend(in_flight) # Snapshot before cancellation clears it
+            counts = await bus.cancel()
+            aborted["queued_events"] += counts["queued"]
+            aborted["running_handlers"] += counts["running"]
+        if aborted["queued_events"] or aborted["running_handlers"]:
+            print(f"DEBUG: Session {session_id} aborted: {aborted}")
+        return aborted
+
+    async def terminate_session(self, session_id: str) -> Dict[str, Any]:
+        """Kill switch. Returns the work aborted on this worker."""
+        session_state = await self.sessions.get(session_id, refresh=self.bus.distributed)
+        if self.bus.distributed:
+            # The session may be running on another worker (possibly not yet snapshotted)
+            await self.bus.publish(Event(topic=SESSION_TERMINATED, sender_id="api", data={"session_id": session_id}))
+        if session_state is not None:
+            session_state["status"] = "terminated" # Running agents check this before every step
+            if session_id not in self._active_runs:
+                await self.sessions.save(session_id, session_state)
+        aborted = await self._abort_meshes(session_id)
+
+        if session_state is not None or self.bus.distributed:
             # Broadcast termination
             await manager.broadcast({
                 "type": "chat_message",
                 "text": "🛑 **NETWORK TERMINATED**: Administrator has issued a hard-kill signal. All process threads halted.",
                 "sender": "System",
                 "variant": "system"
-            })
+            }, session_id=session_id)
+            manager.close_channel(session_id)
             
             # Log it
-            await blackboard_logger.log_workflow_event(session_id, "WORKFLOW_TERMINATED", {"reason": "user_kill_switch"})
+            await blackboard_logger.log_workflow_event(session_id, "WORKFLOW_TERMINATED", {"reason": "user_kill_switch", "aborted": aborted})
+        return aborted
 
 orchestrator = Orchestrator()
@@ -0,0 +1,89 @@
+"""
+Dependency-DAG scheduler for the agent mesh.
+
+The execution graph is built from each agent's declared `dependencies`:
+- A dependency naming another agent is an edge (wait for its output on the blackboard).
+- Any other dependency (e.g. "transcript") is a session input field.
+- `peer_review` links are debate feedback: they re-wake an agent but never block it,
+  so they are kept out of the DAG.
+
+Agents whose inputs are all session fields are roots and start together on
+TRANSCRIPT_READY. Every other agent starts as soon as all of its upstream agents
+have a completed checkpoint, so end-to-end latency follows the critical path. An
+upstream agent that is paused or failed (checkpoint "error") leaves its dependents waiting.
+"""
+
+from typing import Dict, Any, List
+from collections import deque
+from app.services.agents.base import BaseAgent
+
+# Topic each agent publishes when its result is released
+OUTPUT_TOPICS = {
+    "user_assist": "ORIENTATION_COMPLETE",
+    "safety_triage": "SAFETY_CLEARED",
+    "clinical_entity": "CLINICAL_EXTRACTED",
+    "diagnosis_mapping": "DIAGNOSIS_PROPOSED",
+    "risk_assessment": "RISK_ASSESSED",
+    "procedure_coding": "PROCEDURE_CODED",
+    "medication_management": "MEDICATION_CHECKED",
+    "treatment_planning": "TREATMENT_PLANNED",
+    "output_generation": "OUTPUT_GENERATED"
+}
+
+
+class DagScheduler:
+    def __init__(self, agents: Dict[str, BaseAgent]):
+        self.agents = agents
+        self.upstream: Dict[str, List[str]] = {}
+        self.inputs: Dict[str, List[str]] = {}
+        for agent_id, agent in agents.items():
+            self.upstream[agent_id] = [d for d in agent.dependencies if d in agents]
+            self.inputs[agent_id] = [d for d in agent.dependencies if d not in agents]
+
+        self.order = self._topological_order()
+        self.roots = [a for a in self.order if not self.upstream[a]]
+
+    def _topological_order(self) -> List[str]:
+        """Kahn's algorithm. Raises if the declared dependencies contain a cycle."""
+        indegree = {agent_id: len(deps) for agent_id, deps in self.upstream.items()}
+        downstream: Dict[str, List[str]] = {agent_id: [] for agent_id in self.upstream}
+        for agent_id, deps in self.upstream.items():
+            for dep in deps:
+                downstream[dep].append(agent_id)
+
+        queue = deque(a for a, n in indegree.items() if n == 0)
+        order = []
+        while queue:
+            agent_id = queue.popleft()
+            order.append(agent_id)
+            for child in downstream[agent_id]:
+                indegree[child] -= 1
+                if indegree[child] == 0:
+                    queue.append(child)
+
+        if len(order) != len(self.upstream):
+            cyclic = sorted(a for a, n in indegree.items() if n > 0)
+            raise ValueError(f"Agent dependencies contain a cycle: {cyclic}. Use peer_review for debate links.")
+        return order
+
+    def topic_for(self, agent_id: str) -> str:
+        return OUTPUT_TOPICS.get(agent_id, "UNKNOWN_EVENT")
+
+    def wakes(self, event) -> List[str]:
+        """Agents that may need to (re)run because of this event, in topological order."""
+        if event.target_id:
+            return [event.target_id]
+        if event.sender_id == "system":
+            return list(self.roots)
+        return [
+            agent_id for agent_id in self.order
+            if event.sender_id in self.upstream[agent_id]
+            or event.sender_id in self.agents[agent_id].peer_review
+        ]
+
+    def is_ready(self, agent_id: str, input_data: Dict[str, Any], context: Dict[str, Any]) -> bool:
+        """All session inputs present and every upstream agent has a completed checkpoint."""
+        checkpoints = context.get("checkpoints", {})
+        if any(field not in input_data for field in self.inputs[agent_id]):
+            return False
+        return all(checkpoints.get(dep, {}).get("status") == "completed" for dep in self.upstream[agent_id])
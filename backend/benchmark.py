@@ -0,0 +1,330 @@
+"""
+End-to-end throughput benchmark.
+
+Drives the API the way the frontend does: POST /api/analyze, follow the session on /ws,
+answer every clarification pause through POST /api/clarify with the agent's suggested
+answer. N sessions run with a bounded number in flight; transcripts come from the
+frontend's test scenarios.
+
+The app runs in-process over ASGI (lifespan, HTTP and WebSocket), so no server or HTTP
+client is needed; the LLM defaults to the replay backend (app.core.llm_replay), which
+serves responses recorded in logs/sessions. Reports sessions/s, end-to-end and
+per-agent latency percentiles, event-loop lag, process RSS and replay hit counters.
+
+    python benchmark.py --sessions 200 --concurrency 20
+    LLM_REPLAY_LATENCY=lognormal:800,0.5 python benchmark.py --json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+BACKEND_ROOT = Path(__file__).resolve().parent
+SCENARIOS_PATH = BACKEND_ROOT.parent / "frontend" / "src" / "data" / "test_scenarios.ts"
+
+
+def load_scenarios(path: Path) -> Dict[str, Dict[str, str]]:
+    """{name: {patient_id, session_date, transcript}} from the `export const` objects of a scenario file."""
+    source = path.read_text(encoding="utf-8")
+    scenarios = {}
+    for match in re.finditer(r"export const (\w+)\s*=\s*\{(.*?)\n\};", source, re.S):
+        body = match.group(2)
+        fields = dict(re.findall(r"(\w+):\s*[\"'](.*?)[\"']\s*,", body))
+        transcript = re.search(r"transcript:\s*`(.*?)`", body, re.S)
+        if transcript:
+            scenarios[match.group(1)] = {
+                "patient_id": fields.get("patientId", match.group(1)),
+                "session_date": fields.get("sessionDate") or date.today().isoformat(), # Often computed in TS
+                "transcript": transcript.group(1).strip()
+            }
+    return scenarios
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"n": 0, "p50": None, "p95": None, "p99": None, "max": None}
+    ordered = sorted(values)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 1)
+    return {"n": len(ordered), "p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": round(ordered[-1], 1)}
+
+
+class AsgiDriver:
+    """Minimal in-process ASGI client: lifespan, HTTP requests and WebSocket sessions."""
+
+    def __init__(self, app):
+        self.app = app
+        self._lifespan: Optional[asyncio.Task] = None
+        self._lifespan_inbox: asyncio.Queue = asyncio.Queue()
+
+    async def startup(self):
+        started = asyncio.get_running_loop().create_future()
+
+        async def send(message):
+            if message["type"].startswith("lifespan.startup") and not started.done():
+                started.set_result(message)
+
+        scope = {"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}
+        self._lifespan = asyncio.create_task(self.app(scope, self._lifespan_inbox.get, send))
+        await self._lifespan_inbox.put({"type": "lifespan.startup"})
+        message = await started
+        if message["type"] != "lifespan.startup.complete":
+            raise RuntimeError(f"App startup failed: {message.get('message')}")
+
+    async def shutdown(self):
+        await self._lifespan_inbox.put({"type": "lifespan.shutdown"})
+        await asyncio.wait_for(self._lifespan, timeout=30)
+
+    def _scope(self, kind: str, path: str, query: str = "") -> Dict[str, Any]:
+        return {
+            "type": kind, "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "scheme": "ws" if kind == "websocket" else "http", "path": path, "raw_path": path.encode(),
+            "root_path": "", "query_string": query.encode(), "headers": [(b"host", b"benchmark")],
+            "client": ("127.0.0.1", 0), "server": ("benchmark", 80), "state": {}
+        }
+
+    async def request(self, method: str, path: str, body: Any = None, background: Optional[List[asyncio.Task]] = None) -> Tuple[int, Any]:
+        """
+        (status, JSON body). Returns once the response is sent; background tasks keep running
+        (pass `background` to get the app task, done once they have finished).
+        """
+        payload = json.dumps(body).encode() if body is not None else b""
+        scope = self._scope("http", path)
+        scope["method"] = method
+        scope["headers"] += [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())]
+        response = asyncio.get_running_loop().create_future()
+        status, chunks = 0, []
+        sent = False
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": payload, "more_body": False}
+            await response # Disconnect only after the response is out
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body") and not response.done():
+                    response.set_result(None)
+
+        task = asyncio.create_task(self.app(scope, receive, send))
+        if background is not None:
+            background.append(task)
+        done, _ = await asyncio.wait({task, response}, return_when=asyncio.FIRST_COMPLETED)
+        if task in done and not response.done():
+            task.result() # Raises the app's exception
+        body = b"".join(chunks)
+        return status, json.loads(body) if body else None
+
+    async def websocket(self, path: str, query: str = "") -> "AsgiSocket":
+        socket = AsgiSocket()
+        socket.task = asyncio.create_task(self.app(self._scope("websocket", path, query), socket._inbox.get, socket._deliver))
+        await socket._inbox.put({"type": "websocket.connect"})
+        await socket.accepted
+        return socket
+
+
+class AsgiSocket:
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.messages: asyncio.Queue = asyncio.Queue()
+        self.accepted = asyncio.get_running_loop().create_future()
+        self._inbox: asyncio.Queue = asyncio.Queue()
+
+    async def _deliver(self, message):
+        if message["type"] == "websocket.accept":
+            self.accepted.set_result(None)
+        elif message["type"] == "websocket.send":
+            self.messages.put_nowait(json.loads(message.get("text") or message["bytes"]))
+        elif message["type"] == "websocket.close" and not self.accepted.done():
+            self.accepted.set_exception(RuntimeError("WebSocket rejected"))
+
+    async def close(self):
+        await self._inbox.put({"type": "websocket.disconnect", "code": 1000})
+        await asyncio.wait_for(self.task, timeout=5)
+
+
+async def run_session(
+    driver: AsgiDriver, scenario: Dict[str, str], max_clarifications: int, timeout: float,
+    agent_latency: Dict[str, List[float]]
+) -> Dict[str, Any]:
+    """
+    One session, start to finish. It is finished when the session settles (completed or
+    terminated) with no clarification still resuming; a session still paused after
+    `max_clarifications` answers is terminated and reported as such.
+    """
+    started = time.perf_counter()
+    _, body = await driver.request("POST", "/api/analyze", scenario)
+    session_id = body["session_id"]
+    socket = await driver.websocket("/ws", f"session_id={session_id}")
+    running: Dict[str, float] = {}
+    clarifications = 0
+    resumes: List[asyncio.Task] = [] # /api/clarify requests; done once the resumed run has finished
+    outcome, last_message = "timeout", started
+    try:
+        deadline = started + timeout
+        while time.perf_counter() < deadline:
+            try:
+                message = await asyncio.wait_for(socket.messages.get(), timeout=0.025)
+            except asyncio.TimeoutError:
+                _, usage = await driver.request("GET", f"/api/sessions/{session_id}/usage")
+                status = usage.get("status")
+                resuming = any(not task.done() for task in resumes)
+                if not resuming and status in ("completed", "terminated"):
+                    outcome = status
+                    break
+                if status == "paused" and clarifications >= max_clarifications and not resuming:
+                    outcome = "abandoned"
+                    await driver.request("POST", f"/api/terminate/{session_id}")
+                    break
+                continue
+            now = last_message = time.perf_counter()
+            kind, agent_id = message.get("type"), message.get("agent_id")
+            if kind == "agent_update" and message.get("status") == "running":
+                running[agent_id] = now
+            elif kind == "chat_message" and agent_id in running:
+                agent_latency.setdefault(agent_id, []).append((now - running.pop(agent_id)) * 1000)
+            elif kind == "workflow_pause" and clarifications < max_clarifications:
+                clarifications += 1
+                await driver.request("POST", "/api/clarify", {
+                    "session_id": session_id,
+                    "agent_id": agent_id,
+                    "answer": message.get("suggested_answer") or "Proceed with your best judgment."
+                }, background=resumes)
+    finally:
+        await socket.close()
+    if outcome == "timeout":
+        await driver.request("POST", f"/api/terminate/{session_id}")
+        last_message = time.perf_counter()
+    return {"session_id": session_id, "outcome": outcome, "clarifications": clarifications,
+            "e2e_ms": (last_message - started) * 1000}
+
+
+async def watch_loop_lag(samples: List[float], rss: List[int], interval: float = 0.01):
+    """Event-loop lag: how late a short sleep wakes up. Also samples RSS every ~100 ticks."""
+    from app.core.session_store import process_rss_bytes
+    tick = 0
+    while True:
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.perf_counter() - expected) * 1000)
+        tick += 1
+        if tick % 100 == 0:
+            value = process_rss_bytes()
+            if value:
+                rss.append(value)
+
+
+async def benchmark(args) -> Dict[str, Any]:
+    from main import app
+    from app.core.blackboard_logger import blackboard_logger
+    from app.core.llm_client import llm_client
+    from app.core.session_store import process_rss_bytes
+
+    # Keep benchmark sessions out of the recordings being replayed
+    blackboard_logger.base_path = Path(args.log_dir or tempfile.mkdtemp(prefix="crucible-bench-logs-"))
+    blackboard_logger.base_path.mkdir(parents=True, exist_ok=True)
+
+    scenarios = load_scenarios(Path(args.scenarios))
+    if not scenarios:
+        raise SystemExit(f"No scenarios with a transcript in {args.scenarios}")
+    names = sorted(scenarios)
+
+    driver = AsgiDriver(app)
+    await driver.startup()
+    rss_start = process_rss_bytes()
+    lag: List[float] = []
+    rss: List[int] = []
+    agent_latency: Dict[str, List[float]] = {}
+    results: List[Dict[str, Any]] = []
+    gate = asyncio.Semaphore(args.concurrency)
+
+    async def one(i: int):
+        async with gate:
+            scenario = dict(scenarios[names[i % len(names)]], patient_id=f"bench-{i}")
+            results.append(await run_session(driver, scenario, args.max_clarifications, args.timeout, agent_latency))
+
+    watcher = asyncio.create_task(watch_loop_lag(lag, rss))
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.sessions)))
+    elapsed = time.perf_counter() - started
+    watcher.cancel()
+    rss_end = process_rss_bytes()
+    await driver.shutdown()
+
+    outcomes: Dict[str, int] = {}
+    for r in results:
+        outcomes[r["outcome"]] = outcomes.get(r["outcome"], 0) + 1
+    mb = lambda b: round(b / 2**20, 1) if b else None
+    return {
+        "sessions": args.sessions,
+        "concurrency": args.concurrency,
+        "scenarios": names,
+        "backend": os.environ.get("LLM_BACKEND"),
+        "elapsed_s": round(elapsed, 2),
+        "sessions_per_s": round(args.sessions / elapsed, 2),
+        "outcomes": outcomes,
+        "clarifications": sum(r["clarifications"] for r in results),
+        "e2e_ms": percentiles([r["e2e_ms"] for r in results]),
+        "agent_ms": {agent: percentiles(v) for agent, v in sorted(agent_latency.items())},
+        "loop_lag_ms": percentiles(lag),
+        "rss_mb": {"start": mb(rss_start), "peak": mb(max(rss, default=rss_end)), "end": mb(rss_end)},
+        "replay": llm_client.stats() if hasattr(llm_client, "stats") else None
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    row = lambda name, p: print(f"  {name:<24}{p['n']:>6}{p['p50']!s:>10}{p['p95']!s:>10}{p['p99']!s:>10}{p['max']!s:>10}")
+    print(f"\n{report['sessions']} sessions, {report['concurrency']} concurrent, backend {report['backend']}")
+    print(f"  {report['sessions_per_s']} sessions/s over {report['elapsed_s']}s; outcomes {report['outcomes']}, "
+          f"{report['clarifications']} clarifications answered")
+    print(f"\n  {'latency (ms)':<24}{'n':>6}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    row("end to end", report["e2e_ms"])
+    for agent, p in report["agent_ms"].items():
+        row(agent, p)
+    row("event loop lag", report["loop_lag_ms"])
+    print(f"\n  RSS (MB): {report['rss_mb']}")
+    if report["replay"]:
+        print(f"  Replay: {report['replay']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=50, help="sessions to run (default 50)")
+    parser.add_argument("--concurrency", type=int, default=10, help="sessions in flight at once (default 10)")
+    parser.add_argument("--scenarios", default=str(SCENARIOS_PATH), help="test_scenarios.ts to take transcripts from")
+    parser.add_argument("--max-clarifications", type=int, default=3, help="pauses answered per session before giving up")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds per session before it is terminated")
+    parser.add_argument("--log-dir", help="blackboard log directory for the run (default: a temp directory)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    # Offline by default; the app reads these at import
+    os.environ.setdefault("LLM_BACKEND", "replay")
+    os.environ.setdefault("LLM_CACHE", "off")
+    os.environ.setdefault("SESSION_STORE", "memory")
+    os.environ.setdefault("EVENT_BUS", "memory")
+    sys.path.insert(0, str(BACKEND_ROOT))
+
+    report = asyncio.run(benchmark(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,18 @@
 from dotenv import load_dotenv
 load_dotenv()
 
+import json
+
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, BackgroundTasks
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional
 
 from app.core.socket_manager import manager
+from app.core.event_bus import event_bus
+from app.core.blackboard_logger import blackboard_logger
+from app.core.metrics import metrics
 from app.services.orchestrator import orchestrator
 
 app = FastAPI(title="Crucible API")
@@ -31,17 +37,116 @@ class AnalysisRequest(BaseModel):
 async def root():
     return {"message": "Crucible API is running"}
 
+@app.on_event("startup")
+async def start_bus():
+    # Session commands and UI messages travel over the bus (shared across workers with EVENT_BUS=redis)
+    manager.attach_bus(event_bus)
+    await orchestrator.start()
+    metrics.start_loop_monitor()
+
+@app.on_event("shutdown")
+async def flush_logs():
+    await metrics.stop_loop_monitor()
+    await event_bus.close()
+    # Blackboard appends are buffered; make sure they reach disk
+    await blackboard_logger.aclose()
+    # Spill in-memory sessions so paused ones can be resumed after restart
+    await orchestrator.sessions.close()
+
 @app.get("/health")
 async def health_check():
     return {"status": "ok"}
 
+@app.get("/api/llm/stats")
+async def llm_stats():
+    """LLM admission queue, retry/hedge/circuit state, response cache and (replay backend) recording counters."""
+    from app.core.llm_governor import llm_governor
+    from app.core.llm_resilience import llm_resilience
+    from app.core.llm_cache import llm_cache
+    from app.core.llm_client import llm_client
+    context_cache = llm_client.context_cache.stats() if llm_client.context_cache else None
+    replay = llm_client.stats() if hasattr(llm_client, "stats") else None
+    return {"governor": llm_governor.stats(), "resilience": llm_resilience.stats(), "cache": llm_cache.stats(), "context_cache": context_cache, "replay": replay}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Agent, LLM, session and transport metrics in the Prometheus text format."""
+    from app.core import metrics as m
+    from app.core.llm_governor import llm_governor
+    from app.core.llm_cache import llm_cache
+    governor = llm_governor.stats()
+    ws = manager.stats()
+    m.llm_cache_hit_ratio.labels().set(llm_cache.stats()["hit_rate"])
+    m.llm_governor_queue_depth.labels().set(governor["queue_depth"])
+    m.llm_governor_in_flight.labels().set(governor["in_flight"])
+    m.sessions.clear()
+    for status, count in orchestrator.sessions.status_counts().items():
+        m.sessions.labels(status).set(count)
+    m.ws_connections.labels().set(ws["connections"])
+    m.ws_queue_depth.labels().set(ws["queued"])
+    m.ws_dropped.labels().set(ws["dropped"])
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/sessions/stats")
+async def session_stats():
+    """Session store occupancy (memory / disk) and process RSS."""
+    from app.core.session_store import process_rss_bytes
+    await orchestrator.sessions.sweep()
+    return {"store": orchestrator.sessions.stats(), "process_rss_bytes": process_rss_bytes()}
+
+@app.get("/api/sessions/{session_id}/usage")
+async def session_usage(session_id: str):
+    """LLM calls, run time and prompt tokens (cached vs uncached) spent on one session."""
+    session_state = await orchestrator.sessions.get(session_id, refresh=True)
+    if session_state is None:
+        return {"status": "not_found", "session_id": session_id}
+    usage = dict(session_state.get("usage", {}))
+    prompt_tokens = usage.get("prompt_tokens", 0)
+    usage["cached_ratio"] = round(usage.get("cached_tokens", 0) / prompt_tokens, 3) if prompt_tokens else 0.0
+    return {"session_id": session_id, "status": session_state["status"], "usage": usage}
+
+@app.get("/api/codes/{system}")
+async def code_search(system: str, q: str = "", limit: int = 10):
+    """Look up / autocomplete an ICD-10-CM (`icd10`) or CPT (`cpt`) code from the local tables."""
+    from app.core.code_index import code_indexes
+    index = code_indexes.get(system.lower())
+    if index is None:
+        return {"status": "unknown_system", "systems": sorted(code_indexes)}
+    return {
+        "system": index.system,
+        "query": q,
+        "match": index.validate(q) if q else None,
+        "completions": [e.to_dict() for e in index.complete(q, limit=limit)]
+    }
+
+@app.get("/api/ws/stats")
+async def ws_stats():
+    """WebSocket connections, channels and send-queue counters."""
+    return manager.stats()
+
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+async def websocket_endpoint(websocket: WebSocket, session_id: Optional[str] = None):
+    """
+    Session channel socket. Subscribe with `?session_id=...` or by sending
+    {"type": "subscribe" | "unsubscribe", "session_id": "..."}.
+    """
+    await manager.connect(websocket, session_id)
     try:
         while True:
-            await websocket.receive_text()
+            text = await websocket.receive_text()
+            try:
+                message = json.loads(text)
+            except ValueError:
+                continue
+            if not isinstance(message, dict) or not message.get("session_id"):
+                continue
+            if message.get("type") == "subscribe":
+                manager.subscribe(websocket, message["session_id"])
+            elif message.get("type") == "unsubscribe":
+                manager.unsubscribe(websocket, message["session_id"])
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect(websocket)
 
 class ClarificationRequest(BaseModel):
@@ -61,7 +166,7 @@ async def start_analysis(request: AnalysisRequest, background_tasks: BackgroundT
     # Let's generate it here.
     import uuid
     session_id = str(uuid.uuid4())
-    background_tasks.add_task(orchestrator.run_workflow, request.dict(), session_id)
+    background_tasks.add_task(orchestrator.request_workflow, request.dict(), session_id)
     return {"status": "analysis_started", "message": "Agents are running...", "session_id": session_id}
 
 @app.post("/api/clarify")
@@ -69,12 +174,13 @@ async def submit_clarification(request: ClarificationRequest, background_tasks:
     """
     Submits user clarification to a paused agent.
     """
-    background_tasks.add_task(orchestrator.submit_clarification, request.session_id, request.agent_id, request.answer)
+    background_tasks.add_task(orchestrator.request_clarification, request.session_id, request.agent_id, request.answer)
     return {"status": "clarification_submitted", "message": "Agent workflow resuming..."}
 @app.post("/api/terminate/{session_id}")
 async def terminate_analysis(session_id: str):
     """
-    Kills the agent workflow for a given session.
+    Kills the agent workflow for a given session: queued agent events are dropped and
+    running agents (with their LLM calls) are cancelled. Reports what was aborted.
     """
-    await orchestrator.terminate_session(session_id)
-    return {"status": "terminated", "session_id": session_id}
+    aborted = await orchestrator.terminate_session(session_id)
+    return {"status": "terminated", "session_id": session_id, "aborted": aborted}
@@ -40,7 +40,7 @@ export function Workspace() {
     const [chatLog, setChatLog] = React.useState<ChatMessage[]>([]);
 
     // Connect to WebSocket
-    const { isConnected, subscribe } = useWebSocket("ws://localhost:8000/ws");
+    const { isConnected, subscribe, joinSession, leaveSession } = useWebSocket("ws://localhost:8000/ws");
 
     React.useEffect(() => {
         const unsubscribe = subscribe((message) => {
@@ -50,6 +50,10 @@ export function Workspace() {
                     ...prev,
                     [message.agent_id]: message.status
                 }));
+                // A fresh synthesis run streams the note from scratch
+                if (message.agent_id === "output_generation" && message.status === "running") {
+                    setSessionData(prev => prev ? { ...prev, soapNotes: {} } : null);
+                }
             }
             if (message.type === "workflow_pause") {
                 setClarificationReq({
@@ -71,8 +75,18 @@ export function Workspace() {
                     }));
                 }
             }
+            if (message.type === "output_partial") {
+                // Streamed SOAP section: append fragments, replace on completion
+                setSessionData(prev => {
+                    if (!prev) return null;
+                    const notes = typeof prev.soapNotes === "object" ? prev.soapNotes : {};
+                    const section = message.section as keyof typeof notes;
+                    const text = message.kind === "complete" ? message.text : (notes[section] || "") + message.text;
+                    return { ...prev, soapNotes: { ...notes, [section]: text } };
+                });
+            }
             if (message.type === "workflow_complete") {
-                const outputData = message.data.output;
+                const outputData = message.data.output_generation;
                 if (outputData && outputData.soap_note) {
                     setSessionData(prev => prev ? {
                         ...prev,
@@ -103,6 +117,7 @@ export function Workspace() {
             const result = await response.json();
             if (result.session_id) {
                 setCurrentSessionId(result.session_id);
+                joinSession(result.session_id);
             }
         } catch (error) {
             console.error("Failed to start analysis:", error);
@@ -133,6 +148,7 @@ export function Workspace() {
     };
 
     const handleNewSession = () => {
+        if (currentSessionId) leaveSession(currentSessionId);
         // Reset all states for a clean slate
         setSessionData(null);
         setCurrentSessionId(null);
@@ -146,6 +162,7 @@ export function Workspace() {
         if (currentSessionId) {
             try {
                 await fetch(`http://localhost:8000/api/terminate/${currentSessionId}`, { method: 'POST' });
+                leaveSession(currentSessionId);
                 // Manual UI reset for immediate feedback
                 setSessionData(null);
                 setCurrentSessionId(null);
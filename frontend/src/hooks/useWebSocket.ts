@@ -8,6 +8,13 @@ export function useWebSocket(url: string) {
     const [isConnected, setIsConnected] = useState(false);
     const wsRef = useRef<WebSocket | null>(null);
     const handlersRef = useRef<MessageHandler[]>([]);
+    const sessionsRef = useRef<Set<string>>(new Set());
+
+    const send = (payload: object) => {
+        if (wsRef.current?.readyState === WebSocket.OPEN) {
+            wsRef.current.send(JSON.stringify(payload));
+        }
+    };
 
     useEffect(() => {
         const ws = new WebSocket(url);
@@ -16,6 +23,8 @@ export function useWebSocket(url: string) {
         ws.onopen = () => {
             console.log("WebSocket connected");
             setIsConnected(true);
+            // Re-join session channels (the server replays recent messages)
+            sessionsRef.current.forEach(sessionId => ws.send(JSON.stringify({ type: "subscribe", session_id: sessionId })));
         };
 
         ws.onclose = () => {
@@ -44,5 +53,16 @@ export function useWebSocket(url: string) {
         };
     };
 
-    return { isConnected, subscribe };
+    // Session channels: the server only sends a session's messages to subscribed sockets
+    const joinSession = (sessionId: string) => {
+        sessionsRef.current.add(sessionId);
+        send({ type: "subscribe", session_id: sessionId });
+    };
+
+    const leaveSession = (sessionId: string) => {
+        sessionsRef.current.delete(sessionId);
+        send({ type: "unsubscribe", session_id: sessionId });
+    };
+
+    return { isConnected, subscribe, joinSession, leaveSession };
 }